@@ -5,6 +5,8 @@ import sqlite3
 import random
 from datetime import datetime, timedelta
 
+from utils.ids import ensure_patient_id_sequence, reserve_patient_ids
+
 # Sample data for random generation
 first_names = ['John', 'Sarah', 'Robert', 'Maria', 'James', 'Jennifer', 'Michael', 'Linda', 'William', 'Patricia',
                'David', 'Elizabeth', 'Richard', 'Susan', 'Joseph', 'Jessica', 'Thomas', 'Karen', 'Charles', 'Nancy',
@@ -46,11 +48,6 @@ current_statuses = ['Active Treatment', 'Recovered', 'Critical', 'Under Observat
 
 risk_levels = ['Low', 'Moderate', 'High']
 
-def generate_patient_id(index):
-    """Generate patient ID in format ONC-YYYY-XXXX"""
-    year = datetime.now().year
-    return f"ONC-{year}-{index:04d}"
-
 def generate_phone():
     """Generate Indian phone number"""
     return f"+91-{random.randint(7000000000, 9999999999)}"
@@ -68,13 +65,12 @@ def add_sample_patients():
     conn = sqlite3.connect('oncology_system.db')
     cursor = conn.cursor()
     
-    # Get existing count to generate IDs
-    cursor.execute("SELECT COUNT(*) FROM patients")
-    existing_count = cursor.fetchone()[0]
+    # Reserve a block of IDs in the same transaction as the inserts
+    ensure_patient_id_sequence(conn)
+    patient_ids = reserve_patient_ids(conn, 50)
     
     patients = []
-    for i in range(50):
-        patient_id = generate_patient_id(existing_count + i + 1)
+    for patient_id in patient_ids:
         
         first_name = random.choice(first_names)
         last_name = random.choice(last_names)
@@ -177,7 +173,7 @@ def add_sample_patients():
     conn.close()
     
     print(f"✅ Successfully added 50 patient records to the database!")
-    print(f"📊 Patient IDs range from ONC-{datetime.now().year}-{existing_count+1:04d} to ONC-{datetime.now().year}-{existing_count+50:04d}")
+    print(f"📊 Patient IDs range from {patient_ids[0]} to {patient_ids[-1]}")
 
 if __name__ == '__main__':
     add_sample_patients()
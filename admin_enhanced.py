@@ -1,23 +1,28 @@
 """
 Enhanced Admin Routes for Cancer Patient Management System
 """
-from flask import Blueprint, render_template, request, redirect, url_for, flash, session
+from flask import Blueprint, render_template, request, redirect, url_for, flash, session, jsonify, current_app
 from utils.decorators import login_required, admin_required
-import sqlite3
+from utils.db import get_db_connection, get_pool, pool_stats
+from utils.profiling import route_stats
+from utils.helpers import encode_cursor, decode_cursor
+from utils.jobs import submit_job
+from utils.bulk import (BULK_FILTER_COLUMNS, BulkOperationError, filter_conditions, stage_selection,
+                        preview_bulk_operation, apply_bulk_operation)
+from utils.cache import invalidate_patient_caches
+from utils.stats import get_category_counts, get_total_patients
+from utils.users import list_users, get_user_totals
+from utils.importer import import_patients, iter_import_records, ImportFormatError
+from utils.validation import PATIENT_COLUMNS, REQUIRED_FIELDS
+import os
 from datetime import datetime
 
-# Database configuration
-DATABASE = 'oncology_system.db'
-
-def get_db_connection():
-    """Create a database connection"""
-    conn = sqlite3.connect(DATABASE)
-    conn.row_factory = sqlite3.Row
-    return conn
-
 # Create admin blueprint
 admin_bp = Blueprint('admin_enhanced', __name__)
 
+# Newest users shown in the dashboard's user activity panel
+USER_ACTIVITY_LIMIT = 10
+
 @admin_bp.route('/dashboard')
 @login_required
 @admin_required
@@ -26,9 +31,8 @@ def admin_dashboard():
     conn = get_db_connection()
     
     # System-wide statistics
-    total_patients = conn.execute('SELECT COUNT(*) as count FROM patients').fetchone()['count']
-    total_users = conn.execute('SELECT COUNT(*) as count FROM users').fetchone()['count']
-    total_admins = conn.execute('SELECT COUNT(*) as count FROM users WHERE is_admin = 1').fetchone()['count']
+    total_patients = get_total_patients(conn)
+    user_totals = get_user_totals(conn)
     
     # Recent activity
     recent_patients = conn.execute('''
@@ -38,14 +42,8 @@ def admin_dashboard():
         LIMIT 10
     ''').fetchall()
     
-    # User activity
-    user_activity = conn.execute('''
-        SELECT u.username, u.created_at, COUNT(p.id) as patient_count
-        FROM users u
-        LEFT JOIN patients p ON u.id = p.created_by
-        GROUP BY u.id, u.username, u.created_at
-        ORDER BY u.created_at DESC
-    ''').fetchall()
+    # User activity (same listing as the /admin user table)
+    user_activity = list_users(conn, 'created', limit=USER_ACTIVITY_LIMIT)
     
     # Critical patients (Stage IV or Critical status)
     critical_patients = conn.execute('''
@@ -60,80 +58,184 @@ def admin_dashboard():
     
     return render_template('admin/admin_enhanced.html',
                          total_patients=total_patients,
-                         total_users=total_users,
-                         total_admins=total_admins,
+                         total_users=user_totals['total'],
+                         total_admins=user_totals['admins'],
                          recent_patients=recent_patients,
                          user_activity=user_activity,
                          critical_patients=critical_patients)
 
+BULK_PAGE_SIZE = 50
+
+# Statuses offered by the bulk status update
+BULK_STATUSES = ['Active Treatment', 'Recovered', 'Critical', 'Under Observation', 'Remission', 'Terminal']
+
+# Operation -> form field carrying its new value
+BULK_VALUE_FIELDS = {'update_status': 'new_status', 'assign_doctor': 'doctor_name'}
+
+def _bulk_filters(source):
+    """Bulk filter expression from request args/form"""
+    return {field: source.get(f'filter_{field}', '').strip()
+            for field in list(BULK_FILTER_COLUMNS) + ['search']}
+
+def _filter_args(filters):
+    """URL parameters that reproduce a bulk filter expression"""
+    return {f'filter_{field}': value for field, value in filters.items() if value}
+
+def run_bulk_job(job, operation, value, ids, filters, chunk_size):
+    """Background job body: apply a large bulk operation chunk by chunk"""
+    conn = get_pool().acquire()
+    try:
+        def report(done, total):
+            if done <= chunk_size:
+                job.set_total(total)
+            job.report(done)
+        result = apply_bulk_operation(conn, operation, value, ids, filters, chunk_size, progress=report)
+    finally:
+        conn.close()
+        invalidate_patient_caches()
+    return {'message': result.summary()}
+
 @admin_bp.route('/bulk_operations', methods=['GET', 'POST'])
 @login_required
 @admin_required
 def bulk_operations():
-    """Bulk operations for patient management"""
+    """Bulk operations on selected patients or on everything matching a filter"""
     if request.method == 'POST':
-        operation = request.form.get('operation')
-        selected_patients = request.form.getlist('selected_patients')
+        operation = request.form.get('operation', '')
+        value = request.form.get(BULK_VALUE_FIELDS.get(operation, ''), '').strip()
+        filters = _bulk_filters(request.form)
+        back = url_for('admin_enhanced.bulk_operations', **_filter_args(filters))
+        dry_run = request.form.get('dry_run') == '1'
+        wants_json = request.accept_mimetypes.best == 'application/json'
         
-        if not selected_patients:
-            flash('No patients selected', 'warning')
-            return redirect(url_for('admin_enhanced.bulk_operations'))
+        # 'filter' scope works on the filter expression, not on a page of ids
+        ids = None
+        if request.form.get('scope') != 'filter':
+            ids = request.form.getlist('selected_patients')
+            if not ids:
+                flash('No patients selected', 'warning')
+                return redirect(back)
         
         conn = get_db_connection()
-        
         try:
-            if operation == 'delete':
-                # Bulk delete
-                placeholders = ','.join(['?'] * len(selected_patients))
-                conn.execute(f'DELETE FROM patients WHERE id IN ({placeholders})', selected_patients)
-                flash(f'Deleted {len(selected_patients)} patient records', 'success')
-                
-            elif operation == 'update_status':
-                # Bulk status update
-                new_status = request.form.get('new_status')
-                placeholders = ','.join(['?'] * len(selected_patients))
-                conn.execute(f'UPDATE patients SET current_status = ? WHERE id IN ({placeholders})', 
-                           [new_status] + selected_patients)
-                flash(f'Updated status for {len(selected_patients)} patients', 'success')
-                
-            elif operation == 'assign_doctor':
-                # Bulk doctor assignment
-                doctor_name = request.form.get('doctor_name')
-                placeholders = ','.join(['?'] * len(selected_patients))
-                conn.execute(f'UPDATE patients SET doctor_name = ? WHERE id IN ({placeholders})', 
-                           [doctor_name] + selected_patients)
-                flash(f'Assigned doctor to {len(selected_patients)} patients', 'success')
-            
-            conn.commit()
-            
+            if dry_run:
+                result = preview_bulk_operation(conn, operation, value, ids, filters)
+            else:
+                matched = stage_selection(conn, ids, filters)
+                if matched > current_app.config['BULK_ASYNC_THRESHOLD']:
+                    # Large selections are applied off the request thread
+                    job_id = submit_job(
+                        conn, 'bulk', run_bulk_job, operation, value, ids, filters,
+                        current_app.config['BULK_CHUNK_SIZE'],
+                        created_by=session['user_id'],
+                        params={'operation': operation, 'value': value, 'matched': matched, 'filters': filters},
+                    )
+                    if wants_json:
+                        return jsonify({'job_id': job_id, 'matched': matched,
+                                        'status_url': url_for('export_job_status', job_id=job_id)}), 202
+                    flash(f'Bulk operation on {matched} patients started in the background', 'info')
+                    return redirect(url_for('export_job_page', job_id=job_id))
+                result = apply_bulk_operation(conn, operation, value, ids, filters,
+                                              current_app.config['BULK_CHUNK_SIZE'])
+        except BulkOperationError as e:
+            if wants_json:
+                return jsonify({'error': str(e)}), 400
+            flash(str(e), 'warning')
+            return redirect(back)
         except Exception as e:
-            conn.rollback()
+            if wants_json:
+                return jsonify({'error': str(e)}), 500
             flash(f'Error performing bulk operation: {str(e)}', 'danger')
+            return redirect(back)
         finally:
             conn.close()
+            if not dry_run:
+                invalidate_patient_caches()
         
-        return redirect(url_for('admin_enhanced.bulk_operations'))
+        if wants_json:
+            return jsonify(result.to_dict())
+        if dry_run:
+            session['bulk_preview'] = result.to_dict()
+            flash(f'Preview: {result.summary()}', 'info')
+        else:
+            flash(result.summary(), 'success')
+        return redirect(back)
+    
+    # GET request - one keyset-paginated page of the (filtered) patients
+    filters = _bulk_filters(request.args)
+    after = decode_cursor(request.args.get('after', ''))
+    conditions, params = filter_conditions(filters)
+    if after:
+        conditions.append('(created_at, id) < (?, ?)')
+        params.extend(after)
+    query = '''SELECT id, patient_id, full_name, cancer_type, cancer_stage, current_status,
+                      doctor_name, created_by, created_at
+               FROM patients'''
+    if conditions:
+        query += ' WHERE ' + ' AND '.join(conditions)
+    query += ' ORDER BY created_at DESC, id DESC LIMIT ?'
     
-    # GET request - show bulk operations interface
     conn = get_db_connection()
-    patients = conn.execute('''
-        SELECT id, patient_id, full_name, cancer_type, cancer_stage, current_status, doctor_name
-        FROM patients 
-        ORDER BY created_at DESC
-    ''').fetchall()
+    patients = conn.execute(query, params + [BULK_PAGE_SIZE + 1]).fetchall()
+    next_cursor = None
+    if len(patients) > BULK_PAGE_SIZE:
+        patients = patients[:BULK_PAGE_SIZE]
+        next_cursor = encode_cursor(patients[-1]['created_at'], patients[-1]['id'])
     
-    # Get unique doctors for assignment
+    # Get unique doctors for assignment and filtering
     doctors = conn.execute('SELECT DISTINCT doctor_name FROM patients WHERE doctor_name IS NOT NULL').fetchall()
-    
-    # Get all possible statuses
-    statuses = ['Active Treatment', 'Recovered', 'Critical', 'Under Observation', 'Remission', 'Terminal']
-    
+    counts = get_category_counts(conn)
     conn.close()
     
     return render_template('admin/bulk_operations.html',
                          patients=patients,
                          doctors=doctors,
-                         statuses=statuses)
+                         statuses=BULK_STATUSES,
+                         filter_statuses=list(counts['status']),
+                         cancer_types=list(counts['type']),
+                         stages=list(counts['stage']),
+                         filters=filters,
+                         filter_args=_filter_args(filters),
+                         has_filter=any(filters.values()),
+                         next_cursor=next_cursor,
+                         paged=bool(after),
+                         preview=session.pop('bulk_preview', None))
+
+@admin_bp.route('/import_patients', methods=['GET', 'POST'])
+@login_required
+@admin_required
+def import_patients_page():
+    """Bulk import patients from a CSV/XLSX registry file"""
+    result = None
+    
+    if request.method == 'POST':
+        upload = request.files.get('import_file')
+        if not upload or not upload.filename:
+            flash('Please choose a CSV or XLSX file to import', 'warning')
+            return redirect(url_for('admin_enhanced.import_patients_page'))
+        
+        conn = get_db_connection()
+        try:
+            # The upload is read as a stream; rows are committed in batches
+            records = iter_import_records(upload.stream, upload.filename)
+            result = import_patients(conn, records, created_by=session.get('user_id'))
+        except ImportFormatError as e:
+            flash(str(e), 'danger')
+            return redirect(url_for('admin_enhanced.import_patients_page'))
+        except Exception as e:
+            flash(f'Import stopped: {str(e)}', 'danger')
+        finally:
+            conn.close()
+            invalidate_patient_caches()
+        
+        if result is not None:
+            category = 'success' if not result.rejected else 'warning'
+            flash(f'{upload.filename}: {result.summary()}', category)
+    
+    return render_template('admin/import_patients.html',
+                         result=result,
+                         columns=PATIENT_COLUMNS,
+                         required=REQUIRED_FIELDS)
 
 @admin_bp.route('/system_logs')
 @login_required
@@ -166,13 +268,14 @@ def database_stats():
     """Database statistics and health"""
     conn = get_db_connection()
     
-    # Patient statistics
+    # Patient statistics (maintained by triggers in patient_stats)
+    counts = get_category_counts(conn)
     patient_stats = {
-        'total': conn.execute('SELECT COUNT(*) FROM patients').fetchone()[0],
-        'by_status': dict(conn.execute('SELECT current_status, COUNT(*) FROM patients GROUP BY current_status').fetchall()),
-        'by_stage': dict(conn.execute('SELECT cancer_stage, COUNT(*) FROM patients GROUP BY cancer_stage').fetchall()),
-        'by_type': dict(conn.execute('SELECT cancer_type, COUNT(*) FROM patients GROUP BY cancer_type').fetchall()),
-        'by_gender': dict(conn.execute('SELECT gender, COUNT(*) FROM patients GROUP BY gender').fetchall()),
+        'total': counts['total'],
+        'by_status': counts['status'],
+        'by_stage': counts['stage'],
+        'by_type': counts['type'],
+        'by_gender': counts['gender'],
     }
     
     # User statistics
@@ -183,15 +286,29 @@ def database_stats():
     }
     
     # Database size (simplified)
-    db_size = conn.execute('SELECT COUNT(*) FROM patients UNION ALL SELECT COUNT(*) FROM users').fetchall()
-    total_records = sum(row[0] for row in db_size)
+    total_records = patient_stats['total'] + user_stats['total']
     
     conn.close()
     
     return render_template('admin/database_stats.html',
                          patient_stats=patient_stats,
                          user_stats=user_stats,
-                         total_records=total_records)
+                         total_records=total_records,
+                         pool=pool_stats())
+
+@admin_bp.route('/metrics')
+@login_required
+@admin_required
+def metrics():
+    """Rolling per-route latency percentiles (ms) for this worker process"""
+    if request.args.get('reset') == '1':
+        route_stats.clear()
+    return jsonify({
+        'pid': os.getpid(),
+        'window': route_stats.window,
+        'routes': route_stats.snapshot(),
+        'pool': pool_stats(),
+    })
 
 @admin_bp.route('/manage_hospitals')
 @login_required
@@ -1,13 +1,41 @@
-from flask import Flask, render_template, request, redirect, url_for, session, flash, send_file, jsonify
+from flask import Flask, render_template, request, redirect, url_for, session, flash, send_file, jsonify, make_response, Response
 from werkzeug.security import generate_password_hash, check_password_hash
-import sqlite3
 import os
 import random
+import tempfile
+import csv
 import string
+import time
 from datetime import datetime, timedelta
+import click
 import pandas as pd
 from utils.decorators import login_required, admin_required
-from utils.helpers import generate_otp, format_date, export_to_csv, export_to_excel, export_to_pdf
+from utils.helpers import (generate_otp, format_date, encode_cursor, decode_cursor,
+                           iter_csv, iter_file, export_rows_to_excel, export_rows_to_pdf)
+from utils import db, profiling, metrics
+from utils.db import get_db_connection, stream_query
+from utils.schema import ensure_schema
+from utils.migrations import (run_backfill, run_backfills, pending_backfills, backfill_status,
+                              get_schema_version, SCHEMA_VERSION, DEFAULT_BACKFILL_BATCH_SIZE,
+                              LEGACY_CANCER_STAGE)
+from utils.ids import next_patient_id
+from utils.validation import validate_patient
+from utils.query_plans import check_query_plans
+from utils.importer import import_patients, iter_import_records, ImportFormatError, DEFAULT_IMPORT_BATCH_SIZE
+from utils import jobs
+from utils.jobs import (submit_job, get_job, job_to_dict, purge_expired_jobs, fail_stale_jobs, recent_jobs,
+                        is_expired, STATUS_QUEUED, STATUS_RUNNING, STATUS_DONE)
+from utils.bulk import remove_user, count_user_patients
+from utils.users import list_users, get_user_totals, USER_SORTS, USERS_PER_PAGE
+from utils.search import search_condition, search_patients, rebuild_search_index
+from utils.cache import patient_cache, invalidate_patient_caches
+from utils.stats import (get_dashboard_stats, get_category_counts, get_total_patients,
+                         check_patient_stats, rebuild_patient_stats, get_data_version)
+from utils.analytics import get_analytics, page_etag
+from utils.cohorts import (get_frame, crosstab, required_columns, CohortError, DIMENSIONS, MEASURES,
+                           AGGREGATIONS, MAX_DIMENSIONS)
+from utils.workload import (get_workload, get_appointments_on, check_appointment_stats, rebuild_appointment_stats,
+                            DAY_LIST_LIMIT)
 from config_new import Config
 
 # Initialize Flask App
@@ -15,38 +43,43 @@ app = Flask(__name__)
 app.config.from_object(Config)
 
 # Database configuration
-DATABASE = 'oncology_system.db'
+DATABASE = app.config['DATABASE']
+db.init_app(app)
+profiling.init_app(app)
+metrics.init_app(app)
+jobs.configure(workers=app.config['JOB_WORKERS'], ttl=app.config['EXPORT_JOB_TTL'],
+               sweep_interval=app.config['JOB_SWEEP_INTERVAL'], stale_after=app.config['JOB_STALE_AFTER'])
 
-def get_db_connection():
-    """Create a database connection"""
-    conn = sqlite3.connect(DATABASE)
-    conn.row_factory = sqlite3.Row
-    return conn
-
-def generate_patient_id():
-    """Generate unique patient ID in format ONC-YYYY-0001"""
-    conn = get_db_connection()
-    current_year = datetime.now().year
-    
-    # Count existing patients for current year
-    count = conn.execute(
-        "SELECT COUNT(*) as count FROM patients WHERE patient_id LIKE ?",
-        (f'ONC-{current_year}-%',)
-    ).fetchone()['count']
-    
-    conn.close()
-    
-    # Generate new sequence number (count + 1, zero-padded to 4 digits)
-    sequence = count + 1
-    patient_id = f"ONC-{current_year}-{sequence:04d}"
-    
-    return patient_id
+def _backfill_job(context, names, batch_size):
+    """Background job: work through pending data backfills in small batches"""
+    conn = db.get_pool().acquire()
+    try:
+        copied = 0
+        for name in names:
+            def report(name, last_id, rows, base=copied):
+                context.report(base + rows, f'{name}: up to id {last_id}')
+            copied += run_backfill(conn, name, batch_size, progress=report)
+    finally:
+        conn.close()
+    invalidate_patient_caches()
+    return {'message': f'{copied} rows backfilled'}
 
 def init_db():
-    """Initialize database if it doesn't exist"""
+    """Initialize database if it doesn't exist and bring its schema up to date"""
     if not os.path.exists(DATABASE):
         from init_db import init_database
-        init_database()
+        init_database(DATABASE)
+    
+    conn = db.get_pool().acquire()
+    try:
+        ensure_schema(conn)
+        # Data backfills run in batches off the startup path
+        names = pending_backfills(conn)
+        if names:
+            submit_job(conn, 'backfill', _backfill_job, names, app.config['BACKFILL_BATCH_SIZE'],
+                       params={'backfills': names})
+    finally:
+        conn.close()
 
 # Initialize database on app startup
 init_db()
@@ -248,66 +281,14 @@ def dashboard():
     """Display main dashboard with cancer patient statistics"""
     conn = get_db_connection()
     
-    # Get all statistics (no user filtering)
-    
-    # Total patients
-    total_patients = conn.execute(
-        'SELECT COUNT(*) as count FROM patients'
-    ).fetchone()['count']
-    
-    # Active cases (current_status contains 'Treatment' or 'Under Treatment')
-    active_cases = conn.execute(
-        'SELECT COUNT(*) as count FROM patients WHERE current_status LIKE ? OR current_status LIKE ?',
-        ('%Treatment%', 'Under Treatment')
-    ).fetchone()['count']
-    
-    # Stage IV patients
-    stage_iv_patients = conn.execute(
-        'SELECT COUNT(*) as count FROM patients WHERE cancer_stage = ?',
-        ('Stage IV',)
-    ).fetchone()['count']
-    
-    # Recovered patients
-    recovered_patients = conn.execute(
-        'SELECT COUNT(*) as count FROM patients WHERE current_status = ?',
-        ('Recovered',)
-    ).fetchone()['count']
-    
-    # Recent patients (last 5)
-    recent_patients = conn.execute('''
-        SELECT * FROM patients 
-        ORDER BY created_at DESC 
-        LIMIT 5
-    ''').fetchall()
-    
-    # Stage distribution for chart
-    stage_data = conn.execute('''
-        SELECT cancer_stage, COUNT(*) as count 
-        FROM patients 
-        GROUP BY cancer_stage
-        ORDER BY cancer_stage
-    ''').fetchall()
-    stage_distribution = {row['cancer_stage']: row['count'] for row in stage_data}
-    
-    # Status distribution
-    status_data = conn.execute('''
-        SELECT current_status, COUNT(*) as count 
-        FROM patients 
-        GROUP BY current_status
-        ORDER BY count DESC
-    ''').fetchall()
-    status_distribution = {row['current_status']: row['count'] for row in status_data}
+    # All counters come from one cached snapshot (no user filtering)
+    stats, cache_hit = get_dashboard_stats(conn)
     
     conn.close()
     
-    return render_template('dashboard/dashboard_modern.html', 
-                         total_patients=total_patients,
-                         active_cases=active_cases,
-                         stage_iv_patients=stage_iv_patients,
-                         recovered_patients=recovered_patients,
-                         recent_patients=recent_patients,
-                         stage_distribution=stage_distribution,
-                         status_distribution=status_distribution)
+    response = make_response(render_template('dashboard/dashboard_modern.html', **stats))
+    response.headers['X-Cache'] = 'hit' if cache_hit else 'miss'
+    return response
 
 @app.route('/dashboard-sidebar')
 @login_required
@@ -331,10 +312,38 @@ def dashboard_sidebar():
 
 # ==================== PATIENT RECORD ROUTES ====================
 
+RECORDS_PER_PAGE = 25
+RECORDS_MAX_PER_PAGE = 200
+
+def build_patient_filters(status='', cancer_type='', cancer_stage='', search=''):
+    """Build WHERE conditions and params for the patient list filters"""
+    conditions = []
+    params = []
+    
+    if status:
+        conditions.append('current_status = ?')
+        params.append(status)
+    
+    if cancer_type:
+        conditions.append('cancer_type = ?')
+        params.append(cancer_type)
+    
+    if cancer_stage:
+        conditions.append('cancer_stage = ?')
+        params.append(cancer_stage)
+    
+    if search:
+        # Served from the FTS5 index instead of six leading-wildcard LIKEs
+        search_sql, search_params = search_condition(search)
+        conditions.append(search_sql)
+        params.extend(search_params)
+    
+    return conditions, params
+
 @app.route('/records')
 @login_required
 def records():
-    """Display all patient records with new schema"""
+    """Display patient records, one keyset-paginated page at a time"""
     conn = get_db_connection()
     
     # Get filter parameters
@@ -343,56 +352,74 @@ def records():
     stage_filter = request.args.get('cancer_stage', '')
     search = request.args.get('search', '')
     
+    # Pagination parameters
+    try:
+        per_page = int(request.args.get('per_page', RECORDS_PER_PAGE))
+    except ValueError:
+        per_page = RECORDS_PER_PAGE
+    per_page = max(1, min(per_page, RECORDS_MAX_PER_PAGE))
+    after = decode_cursor(request.args.get('after', ''))
+    before = decode_cursor(request.args.get('before', ''))
+    want_count = request.args.get('count') == '1'
+    
+    conditions, params = build_patient_filters(status_filter, cancer_filter, stage_filter, search)
+    
+    # Keyset condition on (created_at, id) keeps deep pages as cheap as the first
+    page_conditions = list(conditions)
+    page_params = list(params)
+    if before:
+        page_conditions.append('(created_at, id) > (?, ?)')
+        page_params.extend(before)
+        order = 'created_at ASC, id ASC'
+    else:
+        if after:
+            page_conditions.append('(created_at, id) < (?, ?)')
+            page_params.extend(after)
+        order = 'created_at DESC, id DESC'
+    
     query = '''SELECT id, patient_id, full_name, age, gender, cancer_type, cancer_stage, 
                       current_status, diagnosis_date, doctor_name, created_at
                FROM patients'''
-    params = []
-    
-    # Add WHERE clause if any filters are applied
-    where_added = False
-    
-    if status_filter:
-        if not where_added:
-            query += ' WHERE current_status = ?'
-            where_added = True
-        else:
-            query += ' AND current_status = ?'
-        params.append(status_filter)
-    
-    if cancer_filter:
-        if not where_added:
-            query += ' WHERE cancer_type = ?'
-            where_added = True
-        else:
-            query += ' AND cancer_type = ?'
-        params.append(cancer_filter)
-        
-    if stage_filter:
-        if not where_added:
-            query += ' WHERE cancer_stage = ?'
-            where_added = True
-        else:
-            query += ' AND cancer_stage = ?'
-        params.append(stage_filter)
-    
-    if search:
-        if not where_added:
-            query += ''' WHERE (full_name LIKE ? OR patient_id LIKE ? OR cancer_type LIKE ? 
-                          OR cancer_stage LIKE ? OR doctor_name LIKE ? OR current_status LIKE ?)'''
-        else:
-            query += ''' AND (full_name LIKE ? OR patient_id LIKE ? OR cancer_type LIKE ? 
-                          OR cancer_stage LIKE ? OR doctor_name LIKE ? OR current_status LIKE ?)'''
-        search_pattern = f'%{search}%'
-        params.extend([search_pattern] * 6)
-    
-    query += ' ORDER BY created_at DESC'
-    
-    patients = conn.execute(query, params).fetchall()
+    if page_conditions:
+        query += ' WHERE ' + ' AND '.join(page_conditions)
+    query += f' ORDER BY {order} LIMIT ?'
+    page_params.append(per_page + 1)
+    
+    patients = conn.execute(query, page_params).fetchall()
+    has_more = len(patients) > per_page
+    patients = patients[:per_page]
+    if before:
+        patients.reverse()
+    
+    # Work out which directions can be followed from this page
+    next_cursor = prev_cursor = None
+    if patients:
+        first, last = patients[0], patients[-1]
+        if has_more or before:
+            next_cursor = encode_cursor(last['created_at'], last['id'])
+        if after or (before and has_more):
+            prev_cursor = encode_cursor(first['created_at'], first['id'])
+    
+    category_counts = get_category_counts(conn)
+    
+    # Unfiltered and single-category totals come from the summary table;
+    # anything else needs a scan, so only compute it on request
+    total_count = None
+    active_filters = [(dimension, value) for dimension, value in
+                      (('status', status_filter), ('type', cancer_filter), ('stage', stage_filter)) if value]
+    if not active_filters and not search:
+        total_count = category_counts['total']
+    elif len(active_filters) == 1 and not search:
+        dimension, value = active_filters[0]
+        total_count = category_counts[dimension].get(value, 0)
+    elif want_count:
+        count_query = 'SELECT COUNT(*) FROM patients WHERE ' + ' AND '.join(conditions)
+        total_count = conn.execute(count_query, params).fetchone()[0]
     
     # Get unique values for filters
-    statuses = conn.execute('SELECT DISTINCT current_status FROM patients').fetchall()
-    cancer_types = conn.execute('SELECT DISTINCT cancer_type FROM patients').fetchall()
-    stages = conn.execute('SELECT DISTINCT cancer_stage FROM patients').fetchall()
+    statuses = [{'current_status': value} for value in category_counts['status']]
+    cancer_types = [{'cancer_type': value} for value in category_counts['type']]
+    stages = [{'cancer_stage': value} for value in category_counts['stage']]
     
     conn.close()
     
@@ -404,65 +431,45 @@ def records():
                          current_status=status_filter,
                          current_cancer=cancer_filter,
                          current_stage=stage_filter,
-                         current_search=search)
+                         current_search=search,
+                         per_page=per_page,
+                         next_cursor=next_cursor,
+                         prev_cursor=prev_cursor,
+                         total_count=total_count)
+
+# Fields of the short add/edit record forms, and the names they are posted under
+RECORD_FIELDS = ['full_name', 'age', 'gender', 'cancer_type', 'current_status', 'diagnosis_date']
+RECORD_FORM_ALIASES = {'full_name': 'name', 'current_status': 'status'}
 
 @app.route('/add_record', methods=['GET', 'POST'])
 @login_required
 def add_record():
     """Add a new patient record"""
     if request.method == 'POST':
-        name = request.form.get('name', '').strip()
-        age = request.form.get('age', '')
-        gender = request.form.get('gender', '')
-        cancer_type = request.form.get('cancer_type', '').strip()
-        status = request.form.get('status', '')
-        diagnosis_date = request.form.get('diagnosis_date', '')
-        notes = request.form.get('notes', '').strip()
-        
-        # Validation
-        if not all([name, age, gender, cancer_type, status, diagnosis_date]):
-            flash('All required fields must be filled', 'danger')
-            return render_template('dashboard/add_record_new.html')
-        
-        try:
-            age = int(age)
-            if age <= 0 or age > 150:
-                flash('Please enter a valid age', 'danger')
-                return render_template('dashboard/add_record_new.html')
-        except ValueError:
-            flash('Please enter a valid age', 'danger')
+        values, error = validate_patient(request.form, RECORD_FIELDS, aliases=RECORD_FORM_ALIASES)
+        if error:
+            flash(error, 'danger')
             return render_template('dashboard/add_record_new.html')
-        
-        # Validate diagnosis date
-        if diagnosis_date:
-            try:
-                # Parse the date to ensure it's valid
-                from datetime import datetime
-                parsed_date = datetime.strptime(diagnosis_date, '%Y-%m-%d')
-                
-                # Ensure date is not in the future
-                if parsed_date > datetime.now():
-                    flash('Diagnosis date cannot be in the future', 'danger')
-                    return render_template('dashboard/add_record_new.html')
-                
-                # Ensure date is not too far in the past (e.g., more than 100 years)
-                min_date = datetime.now().replace(year=datetime.now().year - 100)
-                if parsed_date < min_date:
-                    flash('Diagnosis date cannot be more than 100 years in the past', 'danger')
-                    return render_template('dashboard/add_record_new.html')
-                    
-            except ValueError:
-                flash('Please enter a valid diagnosis date (YYYY-MM-DD format)', 'danger')
-                return render_template('dashboard/add_record_new.html')
+        # The quick form has no stage field; stored like backfilled legacy records
+        values['cancer_stage'] = LEGACY_CANCER_STAGE
         
         # Insert into database
         conn = get_db_connection()
-        conn.execute('''
-            INSERT INTO patients (user_id, name, age, gender, cancer_type, status, diagnosis_date, notes)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (session['user_id'], name, age, gender, cancer_type, status, diagnosis_date, notes))
-        conn.commit()
-        conn.close()
+        try:
+            patient_id = next_patient_id(conn)
+            columns = ['patient_id'] + list(values) + ['created_by']
+            conn.execute(
+                f"INSERT INTO patients ({', '.join(columns)}) VALUES ({', '.join(['?'] * len(columns))})",
+                [patient_id] + list(values.values()) + [session['user_id']]
+            )
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            flash(f'Error adding patient record: {str(e)}', 'danger')
+            return render_template('dashboard/add_record_new.html')
+        finally:
+            conn.close()
+        invalidate_patient_caches()
         
         flash('Patient record added successfully!', 'success')
         return redirect(url_for('records'))
@@ -497,49 +504,11 @@ def edit_record(patient_id):
         return redirect(url_for('records'))
     
     if request.method == 'POST':
-        name = request.form.get('name', '').strip()
-        age = request.form.get('age', '')
-        gender = request.form.get('gender', '')
-        cancer_type = request.form.get('cancer_type', '').strip()
-        status = request.form.get('status', '')
-        diagnosis_date = request.form.get('diagnosis_date', '')
-        notes = request.form.get('notes', '').strip()
-        
-        # Validation
-        if not all([name, age, gender, cancer_type, status, diagnosis_date]):
-            flash('All required fields must be filled', 'danger')
+        values, error = validate_patient(request.form, RECORD_FIELDS, aliases=RECORD_FORM_ALIASES)
+        if error:
+            flash(error, 'danger')
             return render_template('dashboard/edit_record_new.html', patient=patient)
-        
-        try:
-            age = int(age)
-            if age <= 0 or age > 150:
-                flash('Please enter a valid age', 'danger')
-                return render_template('dashboard/edit_record_new.html', patient=patient)
-        except ValueError:
-            flash('Please enter a valid age', 'danger')
-            return render_template('dashboard/edit_record_new.html', patient=patient)
-        
-        # Validate diagnosis date
-        if diagnosis_date:
-            try:
-                # Parse the date to ensure it's valid
-                from datetime import datetime
-                parsed_date = datetime.strptime(diagnosis_date, '%Y-%m-%d')
-                
-                # Ensure date is not in the future
-                if parsed_date > datetime.now():
-                    flash('Diagnosis date cannot be in the future', 'danger')
-                    return render_template('dashboard/edit_record_new.html', patient=patient)
-                
-                # Ensure date is not too far in the past (e.g., more than 100 years)
-                min_date = datetime.now().replace(year=datetime.now().year - 100)
-                if parsed_date < min_date:
-                    flash('Diagnosis date cannot be more than 100 years in the past', 'danger')
-                    return render_template('dashboard/edit_record_new.html', patient=patient)
-                    
-            except ValueError:
-                flash('Please enter a valid diagnosis date (YYYY-MM-DD format)', 'danger')
-                return render_template('dashboard/edit_record_new.html', patient=patient)
+        name, age, gender, cancer_type, status, diagnosis_date = values.values()
         
         # Update database
         conn.execute('''
@@ -551,6 +520,7 @@ def edit_record(patient_id):
               patient_id, session['user_id']))
         conn.commit()
         conn.close()
+        invalidate_patient_caches()
         
         flash('Patient record updated successfully!', 'success')
         return redirect(url_for('records'))
@@ -579,6 +549,7 @@ def delete_record(patient_id):
         if patient:
             conn.execute('DELETE FROM patients WHERE id = ?', (patient_id,))
             conn.commit()
+            invalidate_patient_caches()
             flash(f'Patient record for {patient["full_name"]} deleted successfully', 'success')
         else:
             flash('Patient record not found', 'danger')
@@ -593,6 +564,7 @@ def delete_record(patient_id):
             conn.execute('DELETE FROM patients WHERE id = ? AND created_by = ?', 
                         (patient_id, session['user_id']))
             conn.commit()
+            invalidate_patient_caches()
             flash(f'Patient record for {patient["full_name"]} deleted successfully', 'success')
         else:
             flash('Patient record not found', 'danger')
@@ -607,169 +579,25 @@ def delete_record(patient_id):
 def add_patient():
     """Add a new patient with comprehensive details"""
     if request.method == "POST":
-        # Get all form data
-        full_name = request.form.get("full_name", "").strip()
-        age = request.form.get("age", "").strip()
-        gender = request.form.get("gender", "").strip()
-        blood_group = request.form.get("blood_group", "").strip()
-        contact_number = request.form.get("contact_number", "").strip()
-        email = request.form.get("email", "").strip()
-        city = request.form.get("city", "").strip()
-        state = request.form.get("state", "").strip()
-        emergency_contact_name = request.form.get("emergency_contact_name", "").strip()
-        emergency_contact_number = request.form.get("emergency_contact_number", "").strip()
-        cancer_type = request.form.get("cancer_type", "").strip()
-        cancer_stage = request.form.get("cancer_stage", "").strip()
-        tumor_size = request.form.get("tumor_size", "").strip()
-        metastasis = request.form.get("metastasis", "").strip()
-        diagnosis_date = request.form.get("diagnosis_date", "").strip()
-        treatment_type = request.form.get("treatment_type", "").strip()
-        treatment_phase = request.form.get("treatment_phase", "").strip()
-        chemo_cycles_planned = request.form.get("chemo_cycles_planned", "").strip()
-        chemo_cycles_completed = request.form.get("chemo_cycles_completed", "").strip()
-        radiation_sessions_planned = request.form.get("radiation_sessions_planned", "").strip()
-        radiation_sessions_completed = request.form.get("radiation_sessions_completed", "").strip()
-        surgery_status = request.form.get("surgery_status", "").strip()
-        doctor_name = request.form.get("doctor_name", "").strip()
-        hospital_name = request.form.get("hospital_name", "").strip()
-        height = request.form.get("height", "").strip()
-        weight = request.form.get("weight", "").strip()
-        blood_pressure = request.form.get("blood_pressure", "").strip()
-        heart_rate = request.form.get("heart_rate", "").strip()
-        risk_level = request.form.get("risk_level", "").strip()
-        current_status = request.form.get("current_status", "").strip()
-        next_appointment = request.form.get("next_appointment", "").strip()
-
-        # Validate required fields
-        required_fields = {
-            "Full Name": full_name,
-            "Age": age,
-            "Gender": gender,
-            "Cancer Type": cancer_type,
-            "Cancer Stage": cancer_stage,
-            "Diagnosis Date": diagnosis_date,
-            "Current Status": current_status
-        }
-
-        missing_fields = [field for field, value in required_fields.items() if not value]
-        if missing_fields:
-            flash(f"Required fields missing: {', '.join(missing_fields)}", "danger")
+        # Validate and coerce every field (BMI is derived from height/weight)
+        values, error = validate_patient(request.form)
+        if error:
+            flash(error, "danger")
             return render_template("add_patient_modern.html")
 
-        # Validate age
-        try:
-            age = int(age)
-            if age <= 0 or age > 150:
-                flash("Please enter a valid age (1-150)", "danger")
-                return render_template("add_patient_modern.html")
-        except ValueError:
-            flash("Age must be a valid number", "danger")
-            return render_template("add_patient_modern.html")
-
-        # Validate diagnosis date
-        if diagnosis_date:
-            try:
-                # Parse the date to ensure it's valid
-                from datetime import datetime
-                parsed_date = datetime.strptime(diagnosis_date, '%Y-%m-%d')
-                
-                # Ensure date is not in the future
-                if parsed_date > datetime.now():
-                    flash("Diagnosis date cannot be in the future", "danger")
-                    return render_template("add_patient_modern.html")
-                
-                # Ensure date is not too far in the past (e.g., more than 100 years)
-                min_date = datetime.now().replace(year=datetime.now().year - 100)
-                if parsed_date < min_date:
-                    flash("Diagnosis date cannot be more than 100 years in the past", "danger")
-                    return render_template("add_patient_modern.html")
-                    
-            except ValueError:
-                flash("Please enter a valid diagnosis date (YYYY-MM-DD format)", "danger")
-                return render_template("add_patient_modern.html")
-
-        # Calculate BMI if height and weight provided
-        bmi = None
-        if height and weight:
-            try:
-                height_m = float(height) / 100  # Convert cm to meters
-                weight_kg = float(weight)
-                bmi = round(weight_kg / (height_m ** 2), 2)
-            except (ValueError, ZeroDivisionError):
-                bmi = None
-
-        # Generate patient ID
-        patient_id = generate_patient_id()
-
-        # Get current date for form max date validation
-        from datetime import datetime
-        current_date = datetime.now().strftime('%Y-%m-%d')
-
-        # Convert numeric fields
-        try:
-            tumor_size = float(tumor_size) if tumor_size else None
-        except ValueError:
-            tumor_size = None
-
-        try:
-            height = float(height) if height else None
-        except ValueError:
-            height = None
-
-        try:
-            weight = float(weight) if weight else None
-        except ValueError:
-            weight = None
-
-        try:
-            heart_rate = int(heart_rate) if heart_rate else None
-        except ValueError:
-            heart_rate = None
-
-        try:
-            chemo_cycles_planned = int(chemo_cycles_planned) if chemo_cycles_planned else None
-        except ValueError:
-            chemo_cycles_planned = None
-
-        try:
-            chemo_cycles_completed = int(chemo_cycles_completed) if chemo_cycles_completed else None
-        except ValueError:
-            chemo_cycles_completed = None
-
-        try:
-            radiation_sessions_planned = int(radiation_sessions_planned) if radiation_sessions_planned else None
-        except ValueError:
-            radiation_sessions_planned = None
-
-        try:
-            radiation_sessions_completed = int(radiation_sessions_completed) if radiation_sessions_completed else None
-        except ValueError:
-            radiation_sessions_completed = None
-
         # Insert into database
         conn = get_db_connection()
         try:
-            conn.execute("""
-                INSERT INTO patients (
-                    patient_id, full_name, age, gender, blood_group, contact_number, email,
-                    city, state, emergency_contact_name, emergency_contact_number,
-                    cancer_type, cancer_stage, tumor_size, metastasis, diagnosis_date,
-                    treatment_type, treatment_phase, chemo_cycles_planned, chemo_cycles_completed,
-                    radiation_sessions_planned, radiation_sessions_completed, surgery_status,
-                    doctor_name, hospital_name, height, weight, bmi, blood_pressure, heart_rate,
-                    risk_level, current_status, next_appointment, created_by
-                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            """, (
-                patient_id, full_name, age, gender, blood_group, contact_number, email,
-                city, state, emergency_contact_name, emergency_contact_number,
-                cancer_type, cancer_stage, tumor_size, metastasis, diagnosis_date,
-                treatment_type, treatment_phase, chemo_cycles_planned, chemo_cycles_completed,
-                radiation_sessions_planned, radiation_sessions_completed, surgery_status,
-                doctor_name, hospital_name, height, weight, bmi, blood_pressure, heart_rate,
-                risk_level, current_status, next_appointment, session["user_id"]
-            ))
+            # Allocated in the same transaction as the INSERT
+            patient_id = next_patient_id(conn)
+            columns = ['patient_id'] + list(values) + ['created_by']
+            conn.execute(
+                f"INSERT INTO patients ({', '.join(columns)}) VALUES ({', '.join(['?'] * len(columns))})",
+                [patient_id] + list(values.values()) + [session["user_id"]]
+            )
             conn.commit()
-            flash(f"Patient {full_name} registered successfully with ID: {patient_id}", "success")
+            invalidate_patient_caches()
+            flash(f"Patient {values['full_name']} registered successfully with ID: {patient_id}", "success")
             return redirect(url_for("dashboard"))
         except Exception as e:
             conn.rollback()
@@ -792,70 +620,88 @@ def analytics():
     """Display analytics page with charts"""
     conn = get_db_connection()
     
-    # Get comprehensive analytics data
-    status_data = conn.execute('''
-        SELECT current_status, COUNT(*) as count 
-        FROM patients 
-        GROUP BY current_status
-    ''').fetchall()
-    status_distribution = {row['current_status']: row['count'] for row in status_data}
+    # Every chart comes from the trigger-maintained patient_stats counts
+    charts, data_etag, cache_hit = get_analytics(conn)
     
-    cancer_data = conn.execute('''
-        SELECT cancer_type, COUNT(*) as count 
-        FROM patients 
-        GROUP BY cancer_type
-    ''').fetchall()
-    cancer_distribution = {row['cancer_type']: row['count'] for row in cancer_data}
+    conn.close()
     
-    gender_data = conn.execute('''
-        SELECT gender, COUNT(*) as count 
-        FROM patients 
-        GROUP BY gender
-    ''').fetchall()
-    gender_distribution = {row['gender']: row['count'] for row in gender_data}
+    # The page also shows who is logged in, so the ETag covers the user too
+    etag = page_etag(data_etag, session['user_id'], session.get('username'), session.get('is_admin'))
+    not_modified = request.if_none_match.contains(etag)
+    # Pending flash messages have to be rendered
+    if not_modified and '_flashes' not in session:
+        response = make_response('', 304)
+    else:
+        response = make_response(render_template('dashboard/analytics_modern.html', **charts))
+    response.set_etag(etag)
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    response.headers['X-Cache'] = 'hit' if cache_hit else 'miss'
+    return response
+
+@app.route('/api/analytics/crosstab')
+@login_required
+def api_crosstab():
+    """Patient counts (or a measure) across 1-3 dimensions, e.g. ?dims=stage,type (JSON)"""
+    dimensions = [d.strip() for d in request.args.get('dims', '').split(',') if d.strip()]
+    if not dimensions:
+        return jsonify({'dimensions': DIMENSIONS, 'measures': MEASURES, 'aggregations': AGGREGATIONS,
+                        'max_dimensions': MAX_DIMENSIONS})
     
-    stage_data = conn.execute('''
-        SELECT cancer_stage, COUNT(*) as count 
-        FROM patients 
-        GROUP BY cancer_stage
-    ''').fetchall()
-    stage_distribution = {row['cancer_stage']: row['count'] for row in stage_data}
-    
-    age_groups = conn.execute('''
-        SELECT 
-            CASE 
-                WHEN age < 18 THEN 'Under 18'
-                WHEN age BETWEEN 18 AND 35 THEN '18-35'
-                WHEN age BETWEEN 36 AND 50 THEN '36-50'
-                WHEN age BETWEEN 51 AND 65 THEN '51-65'
-                ELSE 'Over 65'
-            END as age_group,
-            COUNT(*) as count
-        FROM patients 
-        GROUP BY age_group
-    ''').fetchall()
-    age_groups = {row['age_group']: row['count'] for row in age_groups}
-    
-    monthly_trend = conn.execute('''
-        SELECT 
-            strftime('%Y-%m', diagnosis_date) as month,
-            COUNT(*) as count
-        FROM patients 
-        WHERE diagnosis_date >= date('now', '-12 months')
-        GROUP BY strftime('%Y-%m', diagnosis_date)
-        ORDER BY month
-    ''').fetchall()
-    monthly_trend = {row['month']: row['count'] for row in monthly_trend}
+    # filter_<dimension>=value, repeatable
+    filters = {key[len('filter_'):]: request.args.getlist(key)
+               for key in request.args if key.startswith('filter_')}
+    
+    measure = request.args.get('of') or None
+    
+    started = time.perf_counter()
+    try:
+        columns = required_columns(dimensions + list(filters), measure)
+        conn = get_db_connection()
+        frame, version, frame_status = get_frame(conn, columns)
+        conn.close()
+        result = crosstab(frame, dimensions, request.args.get('agg', 'count'), measure,
+                          filters, request.args.get('normalize') or None)
+    except CohortError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    result.update(version=list(version), frame=frame_status, rows=len(frame),
+                  elapsed_ms=round((time.perf_counter() - started) * 1000, 2))
+    response = jsonify(result)
+    response.headers['X-Cache'] = frame_status
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
+
+# ==================== WORKLOAD ROUTES ====================
+
+@app.route('/workload')
+@login_required
+def workload():
+    """Scheduling page: appointments per day for the next 90 days and patients behind on treatment"""
+    group = request.args.get('group', 'hospital')
+    if group not in ('hospital', 'doctor'):
+        group = 'hospital'
+    hospital = request.args.get('hospital', '').strip() or None
+    try:
+        selected_day = datetime.strptime(request.args.get('day', ''), '%Y-%m-%d').date()
+    except ValueError:
+        selected_day = None
+    
+    conn = get_db_connection()
+    
+    # Per-day counts come from appointment_stats, overdue courses from the due-date indexes
+    report, cache_hit = get_workload(conn, group, hospital)
+    day_appointments = get_appointments_on(conn, selected_day, hospital) if selected_day else None
     
     conn.close()
     
-    return render_template('dashboard/analytics_modern.html',
-                         status_distribution=status_distribution,
-                         cancer_distribution=cancer_distribution,
-                         gender_distribution=gender_distribution,
-                         stage_distribution=stage_distribution,
-                         age_groups=age_groups,
-                         monthly_trend=monthly_trend)
+    response = make_response(render_template('dashboard/workload_modern.html', group=group,
+                                             current_hospital=hospital or '', selected_day=selected_day,
+                                             day_appointments=day_appointments, day_limit=DAY_LIST_LIMIT,
+                                             **report))
+    response.headers['X-Cache'] = 'hit' if cache_hit else 'miss'
+    return response
 
 # ==================== ADMIN ROUTES ====================
 
@@ -863,29 +709,43 @@ def analytics():
 @login_required
 @admin_required
 def admin():
-    """Display admin panel"""
+    """Display admin panel: one sorted, paginated page of users"""
     conn = get_db_connection()
     
-    # Get all users
-    users = conn.execute('''
-        SELECT id, username, full_name, is_admin, created_at,
-               (SELECT COUNT(*) FROM patients WHERE created_by = users.id) as patient_count
-        FROM users 
-        ORDER BY created_at DESC
-    ''').fetchall()
+    sort = request.args.get('sort', 'created')
+    if sort not in USER_SORTS:
+        sort = 'created'
+    descending = request.args.get('dir', 'desc') != 'asc'
+    search = request.args.get('q', '').strip()
+    try:
+        page = max(1, int(request.args.get('page', 1)))
+    except ValueError:
+        page = 1
+    
+    # Patient counts come from the maintained per-user counters
+    users = list_users(conn, sort, descending, search, limit=USERS_PER_PAGE,
+                       offset=(page - 1) * USERS_PER_PAGE)
     
     # Get system statistics
-    total_users = conn.execute('SELECT COUNT(*) as count FROM users').fetchone()['count']
-    total_patients = conn.execute('SELECT COUNT(*) as count FROM patients').fetchone()['count']
-    total_admins = conn.execute('SELECT COUNT(*) as count FROM users WHERE is_admin = 1').fetchone()['count']
+    user_totals = get_user_totals(conn, search)
+    total_patients = get_total_patients(conn)
+    
+    # Background user deletions, running ones first
+    user_jobs = [job_to_dict(job) for job in recent_jobs(conn, ['delete_user'], limit=5)]
     
     conn.close()
     
     return render_template('admin/admin_modern.html',
                          users=users,
-                         total_users=total_users,
+                         total_users=user_totals['total'],
                          total_patients=total_patients,
-                         total_admins=total_admins)
+                         total_admins=user_totals['admins'],
+                         user_jobs=user_jobs,
+                         sort=sort,
+                         descending=descending,
+                         search=search,
+                         page=page,
+                         pages=max(1, -(-user_totals['matching'] // USERS_PER_PAGE)))
 
 @app.route('/admin/promote/<int:user_id>', methods=['POST'])
 @login_required
@@ -942,17 +802,58 @@ def admin_delete_user(user_id):
         flash('User not found', 'danger')
         return redirect(url_for('admin'))
     
-    # Delete user's patients first (cascade)
-    conn.execute('DELETE FROM patients WHERE created_by = ?', (user_id,))
+    # A deletion already running for this user will finish the job (unless
+    # its worker died, which fail_stale_jobs notices within minutes)
+    fail_stale_jobs(conn)
+    running = conn.execute(
+        "SELECT 1 FROM background_jobs WHERE kind = 'delete_user' AND status IN (?, ?) "
+        "AND json_extract(params, '$.user_id') = ?",
+        (STATUS_QUEUED, STATUS_RUNNING, user_id)
+    ).fetchone()
+    if running:
+        conn.close()
+        flash(f'User {user["username"]} is already being deleted', 'info')
+        return redirect(url_for('admin'))
     
-    # Delete the user
-    conn.execute('DELETE FROM users WHERE id = ?', (user_id,))
-    conn.commit()
+    # Reassign the user's patients instead of deleting them, if asked
+    reassign_to = None
+    reassign_username = request.form.get('reassign_to', '').strip()
+    if reassign_username:
+        target = conn.execute('SELECT id FROM users WHERE username = ?', (reassign_username,)).fetchone()
+        if not target or target['id'] == user_id:
+            conn.close()
+            flash(f'Cannot reassign patients to {reassign_username}', 'danger')
+            return redirect(url_for('admin'))
+        reassign_to = target['id']
+    
+    # The user's patients are removed in batches on the worker pool, so the
+    # write lock is never held for the whole cascade
+    job_id = submit_job(
+        conn, 'delete_user', run_delete_user_job, user_id, reassign_to,
+        created_by=session['user_id'],
+        params={'user_id': user_id, 'username': user['username'], 'reassign_to': reassign_to},
+    )
     conn.close()
     
-    flash(f'User {user["username"]} deleted successfully', 'success')
+    if reassign_to:
+        flash(f'Deleting user {user["username"]} and reassigning their patients to {reassign_username}', 'info')
+    else:
+        flash(f'Deleting user {user["username"]} and their patients in the background', 'info')
     return redirect(url_for('admin'))
 
+def run_delete_user_job(job, user_id, reassign_to=None):
+    """Background job body: delete a user after removing or reassigning their patients"""
+    conn = db.get_pool().acquire()
+    try:
+        job.set_total(count_user_patients(conn, user_id))
+        done = remove_user(conn, user_id, reassign_to, app.config['BULK_CHUNK_SIZE'],
+                           progress=job.report)
+    finally:
+        conn.close()
+        invalidate_patient_caches()
+    action = 'reassigned' if reassign_to else 'deleted'
+    return {'message': f'User deleted, {done} patients {action}'}
+
 # ==================== PROFILE ROUTE ====================
 
 @app.route('/profile', methods=['GET', 'POST'])
@@ -1005,86 +906,440 @@ def profile():
 
 # ==================== EXPORT ROUTE ====================
 
+# Exported columns and their header labels, in output order
+EXPORT_COLUMNS = [
+    ('patient_id', 'Patient ID'),
+    ('full_name', 'Full Name'),
+    ('age', 'Age'),
+    ('gender', 'Gender'),
+    ('cancer_type', 'Cancer Type'),
+    ('cancer_stage', 'Stage'),
+    ('current_status', 'Status'),
+    ('diagnosis_date', 'Diagnosis Date'),
+    ('doctor_name', 'Doctor'),
+    ('hospital_name', 'Hospital'),
+    ('created_at', 'Created At'),
+]
+
+EXPORT_BATCH_SIZE = 1000
+
+# group_by values accepted for PDF reports
+PDF_GROUP_COLUMNS = {
+    'hospital': 'hospital_name',
+    'doctor': 'doctor_name',
+}
+
 @app.route('/export_data', methods=['GET', 'POST'])
 @login_required
 def export_data():
     """Export patient data in various formats"""
     export_format = request.args.get('format') or request.form.get('format', 'csv')
     
-    conn = get_db_connection()
-    
     # Get filtered data based on current filters
     status_filter = request.args.get('status') or request.form.get('status', '')
     cancer_filter = request.args.get('cancer_type') or request.form.get('cancer_type', '')
+    stage_filter = request.args.get('cancer_stage') or request.form.get('cancer_stage', '')
     search = request.args.get('search') or request.form.get('search', '')
+    group_by = request.args.get('group_by') or request.form.get('group_by', '')
     
-    query = '''
-        SELECT patient_id, full_name, age, gender, cancer_type, cancer_stage, 
-               current_status, diagnosis_date, doctor_name, hospital_name, created_at
+    query = f'''
+        SELECT {', '.join(column for column, _ in EXPORT_COLUMNS)}
         FROM patients 
     '''
-    params = []
+    conditions, params = build_patient_filters(status_filter, cancer_filter, stage_filter, search)
+    if conditions:
+        query += ' WHERE ' + ' AND '.join(conditions)
+    
+    # PDF reports can be sectioned by hospital or doctor
+    group_column = PDF_GROUP_COLUMNS.get(group_by) if export_format == 'pdf' else None
+    group_label = dict(EXPORT_COLUMNS)[group_column] if group_column else None
+    if group_column:
+        query += f' ORDER BY {group_column}, created_at DESC'
+    else:
+        query += ' ORDER BY created_at DESC'
     
-    if status_filter:
-        query += ' AND current_status = ?'
-        params.append(status_filter)
+    # Generate filename with timestamp
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    headers = [label for _, label in EXPORT_COLUMNS]
+    
+    if export_format == 'csv':
+        # Stream straight from the cursor: constant memory, no temp file
+        filename = f'patients_{timestamp}.csv'
+        batches = stream_query(query, params, EXPORT_BATCH_SIZE)
+        response = Response(iter_csv(headers, batches), mimetype='text/csv')
+        response.headers['Content-Disposition'] = f'attachment; filename={filename}'
+        response.headers['X-Accel-Buffering'] = 'no'
+        return response
+    
+    if export_format not in ('excel', 'pdf'):
+        flash('Invalid export format', 'danger')
+        return redirect(url_for('records'))
     
-    if cancer_filter:
-        query += ' AND cancer_type = ?'
-        params.append(cancer_filter)
+    # Large Excel/PDF exports run on the background worker pool instead of
+    # holding this request past the gunicorn timeout
+    threshold = app.config['EXPORT_ASYNC_THRESHOLD']
+    conn = get_db_connection()
+    row_count = conn.execute(f'SELECT COUNT(*) FROM ({query} LIMIT ?)', params + [threshold + 1]).fetchone()[0]
+    if row_count > threshold:
+        purge_expired_jobs(conn)
+        extension = 'xlsx' if export_format == 'excel' else 'pdf'
+        job_id = submit_job(
+            conn, 'export', run_export_job, export_format, query, params, f'patients_{timestamp}.{extension}',
+            group_label,
+            created_by=session['user_id'],
+            params={'format': export_format, 'status': status_filter, 'cancer_type': cancer_filter,
+                    'cancer_stage': stage_filter, 'search': search, 'group_by': group_by},
+        )
+        conn.close()
+        if request.accept_mimetypes.best == 'application/json':
+            return jsonify({
+                'job_id': job_id,
+                'status_url': url_for('export_job_status', job_id=job_id),
+                'download_url': url_for('export_job_download', job_id=job_id),
+            }), 202
+        flash('Large export started in the background. It will be ready to download shortly.', 'info')
+        return redirect(url_for('export_job_page', job_id=job_id))
+    conn.close()
     
-    if search:
-        query += ' AND (full_name LIKE ? OR patient_id LIKE ?)'
-        params.extend([f'%{search}%', f'%{search}%'])
+    if export_format == 'excel':
+        # Spool rows from the cursor into a write-only workbook on disk
+        filename = f'patients_{timestamp}.xlsx'
+        fd, filepath = tempfile.mkstemp(suffix='.xlsx', prefix='export_')
+        os.close(fd)
+        try:
+            export_rows_to_excel(headers, stream_query(query, params, EXPORT_BATCH_SIZE), filepath)
+        except Exception as e:
+            os.remove(filepath)
+            flash(f'Error exporting data: {str(e)}', 'danger')
+            return redirect(url_for('records'))
+        # The spooled file is deleted as soon as it has been sent (or the client goes away)
+        response = Response(iter_file(filepath, remove=True),
+                            mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
+        response.headers['Content-Disposition'] = f'attachment; filename={filename}'
+        response.headers['Content-Length'] = str(os.path.getsize(filepath))
+        return response
+    
+    # PDF: chunked landscape tables, optionally sectioned by hospital/doctor
+    filename = f'patients_{timestamp}.pdf'
+    fd, filepath = tempfile.mkstemp(suffix='.pdf', prefix='export_')
+    os.close(fd)
+    try:
+        export_rows_to_pdf(headers, stream_query(query, params, EXPORT_BATCH_SIZE), filepath,
+                           'Patient Records Report', group_by=group_label)
+    except Exception as e:
+        os.remove(filepath)
+        flash(f'Error exporting data: {str(e)}', 'danger')
+        return redirect(url_for('records'))
+    response = Response(iter_file(filepath, remove=True), mimetype='application/pdf')
+    response.headers['Content-Disposition'] = f'attachment; filename={filename}'
+    response.headers['Content-Length'] = str(os.path.getsize(filepath))
+    return response
+
+def run_export_job(job, export_format, query, params, filename, group_by=None):
+    """Background job body: write a large Excel/PDF export to EXPORT_DIR"""
+    conn = db.get_pool().acquire()
+    total = conn.execute(f'SELECT COUNT(*) FROM ({query})', params).fetchone()[0]
+    conn.close()
+    job.set_total(total)
     
-    query += ' ORDER BY created_at DESC'
+    export_dir = app.config['EXPORT_DIR']
+    os.makedirs(export_dir, exist_ok=True)
+    extension = 'xlsx' if export_format == 'excel' else 'pdf'
+    filepath = os.path.join(export_dir, f'{job.job_id}.{extension}')
+    batches = job.track(stream_query(query, params, EXPORT_BATCH_SIZE))
+    headers = [label for _, label in EXPORT_COLUMNS]
     
-    patients = conn.execute(query, params).fetchall()
+    if export_format == 'excel':
+        export_rows_to_excel(headers, batches, filepath)
+    else:
+        export_rows_to_pdf(headers, batches, filepath, 'Patient Records Report', group_by=group_by)
+    
+    return {'path': filepath, 'name': filename, 'message': f'{total} patients exported'}
+
+def _can_access_job(job):
+    """Users may only see their own jobs; admins see all"""
+    return job is not None and (session.get('is_admin') or job['created_by'] == session['user_id'])
+
+@app.route('/exports/<job_id>')
+@login_required
+def export_job_page(job_id):
+    """Progress page for a background export"""
+    conn = get_db_connection()
+    job = get_job(conn, job_id)
     conn.close()
     
-    # Convert to list of dictionaries for export
-    data = []
-    for patient in patients:
-        data.append({
-            'Patient ID': patient['patient_id'],
-            'Full Name': patient['full_name'],
-            'Age': patient['age'],
-            'Gender': patient['gender'],
-            'Cancer Type': patient['cancer_type'],
-            'Stage': patient['cancer_stage'],
-            'Status': patient['current_status'],
-            'Diagnosis Date': patient['diagnosis_date'],
-            'Doctor': patient['doctor_name'],
-            'Hospital': patient['hospital_name'],
-            'Created At': patient['created_at']
-        })
+    if not _can_access_job(job):
+        flash('Export not found', 'danger')
+        return redirect(url_for('records'))
     
-    # Generate filename with timestamp
-    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    return render_template('dashboard/export_status.html', job=job_to_dict(job))
+
+@app.route('/exports/<job_id>/status')
+@login_required
+def export_job_status(job_id):
+    """JSON progress of a background export"""
+    conn = get_db_connection()
+    job = get_job(conn, job_id)
+    conn.close()
     
-    try:
-        if export_format == 'csv':
-            filename = f'patients_{timestamp}.csv'
-            filepath = export_to_csv(data, filename)
-            return send_file(filepath, as_attachment=True, download_name=filename)
-        
-        elif export_format == 'excel':
-            filename = f'patients_{timestamp}.xlsx'
-            filepath = export_to_excel(data, filename)
-            return send_file(filepath, as_attachment=True, download_name=filename)
-        
-        elif export_format == 'pdf':
-            filename = f'patients_{timestamp}.pdf'
-            filepath = export_to_pdf(data, filename, 'Patient Records Report')
-            return send_file(filepath, as_attachment=True, download_name=filename)
-        
-        else:
-            flash('Invalid export format', 'danger')
-            return redirect(url_for('records'))
+    if not _can_access_job(job):
+        return jsonify({'error': 'Export not found'}), 404
     
-    except Exception as e:
-        flash(f'Error exporting data: {str(e)}', 'danger')
+    payload = job_to_dict(job)
+    # Bulk operations and backfills finish without an artifact
+    if job['status'] == STATUS_DONE and job['result_path'] and not is_expired(job):
+        payload['download_url'] = url_for('export_job_download', job_id=job_id)
+    return jsonify(payload)
+
+@app.route('/exports/<job_id>/download')
+@login_required
+def export_job_download(job_id):
+    """Download the artifact of a finished export"""
+    conn = get_db_connection()
+    job = get_job(conn, job_id)
+    conn.close()
+    
+    if not _can_access_job(job):
+        flash('Export not found', 'danger')
         return redirect(url_for('records'))
+    
+    if (job['status'] != STATUS_DONE or not job['result_path'] or is_expired(job)
+            or not os.path.exists(job['result_path'])):
+        flash('This export is not available (still running or expired)', 'warning')
+        return redirect(url_for('export_job_page', job_id=job_id))
+    
+    return send_file(job['result_path'], as_attachment=True, download_name=job['result_name'])
+
+# ==================== SEARCH API ====================
+
+@app.route('/api/patients/search')
+@login_required
+def api_search_patients():
+    """Full-text patient search ranked by relevance (JSON)"""
+    query = request.args.get('q', '').strip()
+    try:
+        limit = int(request.args.get('limit', 20))
+    except ValueError:
+        limit = 20
+    
+    if not query:
+        return jsonify({'query': query, 'results': []})
+    
+    conn = get_db_connection()
+    rows = search_patients(conn, query, limit)
+    conn.close()
+    
+    return jsonify({
+        'query': query,
+        'results': [{
+            'id': row['id'],
+            'patient_id': row['patient_id'],
+            'full_name': row['full_name'],
+            'cancer_type': row['cancer_type'],
+            'cancer_stage': row['cancer_stage'],
+            'current_status': row['current_status'],
+            'doctor_name': row['doctor_name'],
+        } for row in rows]
+    })
+
+SUGGEST_LIMIT = 8
+SUGGEST_MAX_LIMIT = 20
+
+# Typeahead results keyed on (data version, normalized query, limit)
+suggest_cache = patient_cache(maxsize=2048, ttl=30, name='suggest')
+
+@app.route('/api/patients/suggest')
+@login_required
+def api_suggest_patients():
+    """Compact top-N patient matches for search-as-you-type"""
+    query = ' '.join(request.args.get('q', '').split()).lower()
+    try:
+        limit = int(request.args.get('limit', SUGGEST_LIMIT))
+    except ValueError:
+        limit = SUGGEST_LIMIT
+    limit = max(1, min(limit, SUGGEST_MAX_LIMIT))
+    
+    if not query:
+        return jsonify({'q': query, 'results': []})
+    
+    conn = get_db_connection()
+    key = (get_data_version(conn), query, limit)
+    results = suggest_cache.get(key)
+    cache_status = 'hit'
+    if results is None:
+        cache_status = 'miss'
+        rows = search_patients(conn, query, limit, substring=False)
+        # Fall back to substring matches only when no word starts with the query
+        if not rows:
+            rows = search_patients(conn, query, limit)
+        results = [{
+            'id': row['id'],
+            'patient_id': row['patient_id'],
+            'name': row['full_name'],
+            'stage': row['cancer_stage'],
+            'status': row['current_status'],
+            'url': url_for('edit_record', patient_id=row['id']),
+        } for row in rows]
+        suggest_cache.set(key, results)
+    conn.close()
+    
+    response = jsonify({'q': query, 'results': results})
+    response.headers['X-Cache'] = cache_status
+    response.headers['Cache-Control'] = 'private, max-age=30'
+    return response
+
+# ==================== METRICS ====================
+
+@app.route('/metrics')
+def prometheus_metrics():
+    """Prometheus scrape endpoint, aggregated across gunicorn workers"""
+    # Patient counts are exported too: bearer token, or loopback when none is set
+    if not metrics.scrape_allowed(app.config['METRICS_TOKEN']):
+        return Response('Forbidden\n', status=403, mimetype='text/plain')
+    if not metrics.METRICS_AVAILABLE:
+        return Response('prometheus_client is not installed\n', status=501, mimetype='text/plain')
+    body, content_type = metrics.render_metrics()
+    return Response(body, content_type=content_type)
+
+# ==================== CLI COMMANDS ====================
+
+@app.cli.command('rebuild-search-index')
+def rebuild_search_index_command():
+    """Create (if needed) and rebuild the FTS5 patient search index"""
+    conn = get_db_connection()
+    indexed = rebuild_search_index(conn)
+    conn.close()
+    print(f'Search index rebuilt for {indexed} patients')
+
+@app.cli.command('purge-exports')
+def purge_exports_command():
+    """Delete expired background export artifacts"""
+    conn = get_db_connection()
+    purged = purge_expired_jobs(conn)
+    conn.close()
+    print(f'{purged} expired exports removed')
+
+@app.cli.command('check-patient-stats')
+@click.option('--repair', is_flag=True, help='Rebuild patient_stats/appointment_stats if they have drifted')
+def check_patient_stats_command(repair):
+    """Verify the trigger-maintained patient_stats and appointment_stats tables against a full scan"""
+    conn = get_db_connection()
+    mismatches = check_patient_stats(conn)
+    for dimension, value, stored, actual in mismatches:
+        print(f'{dimension}={value!r}: stored {stored}, actual {actual}')
+    if not mismatches:
+        print('patient_stats is consistent')
+    elif repair:
+        rebuild_patient_stats(conn)
+        print(f'patient_stats rebuilt ({len(mismatches)} mismatches fixed)')
+    appointment_mismatches = check_appointment_stats(conn)
+    for (day, hospital, doctor), stored, actual in appointment_mismatches:
+        print(f'appointments {day} {hospital!r} {doctor!r}: stored {stored}, actual {actual}')
+    if not appointment_mismatches:
+        print('appointment_stats is consistent')
+    elif repair:
+        rebuild_appointment_stats(conn)
+        print(f'appointment_stats rebuilt ({len(appointment_mismatches)} mismatches fixed)')
+    conn.close()
+
+@app.cli.command('rebuild-patient-stats')
+def rebuild_patient_stats_command():
+    """Recompute the patient_stats and appointment_stats summary tables from scratch"""
+    conn = get_db_connection()
+    rebuild_patient_stats(conn)
+    rebuild_appointment_stats(conn)
+    conn.close()
+    invalidate_patient_caches()
+    print('patient_stats and appointment_stats rebuilt')
+
+@app.cli.command('check-query-plans')
+@click.option('--verbose', '-v', is_flag=True, help='Print every plan, not just failures')
+def check_query_plans_command(verbose):
+    """Fail if a hot route query would full-scan patients or sort unexpectedly"""
+    conn = get_db_connection()
+    results = check_query_plans(conn)
+    conn.close()
+    failures = 0
+    for name, plan, problems in results:
+        if problems:
+            failures += 1
+        if problems or verbose:
+            print(f"{'FAIL' if problems else 'ok  '} {name}")
+            for detail in plan:
+                print(f'       {detail}')
+            for problem in problems:
+                print(f'       -> {problem}')
+    print(f'{len(results) - failures}/{len(results)} query plans ok')
+    if failures:
+        raise SystemExit(1)
+
+@app.cli.command('migrate')
+@click.option('--batch-size', default=DEFAULT_BACKFILL_BATCH_SIZE, show_default=True,
+              help='Rows copied per backfill transaction')
+@click.option('--status', 'status_only', is_flag=True, help='Show the schema version and backfills without running them')
+def migrate_command(batch_size, status_only):
+    """Apply pending schema migrations and run data backfills to completion"""
+    conn = get_db_connection()
+    try:
+        if not status_only:
+            # Startup already applied the migrations; this finishes the backfills
+            ensure_schema(conn)
+
+            def report(name, last_id, copied):
+                print(f'  {name}: {copied} rows copied (up to id {last_id})')
+
+            for name, rows in run_backfills(conn, batch_size, progress=report).items():
+                print(f'Backfill {name} finished ({rows} rows copied)')
+        print(f'Schema version {get_schema_version(conn)}/{SCHEMA_VERSION}')
+        for name, last_id, rows, scheduled_at, updated_at, finished_at in backfill_status(conn):
+            state = f'finished {finished_at}' if finished_at else f'pending after id {last_id}'
+            print(f'  {name}: {rows} rows copied, {state}')
+    finally:
+        conn.close()
+    invalidate_patient_caches()
+
+@app.cli.command('import-patients')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--batch-size', default=DEFAULT_IMPORT_BATCH_SIZE, show_default=True,
+              help='Rows inserted per transaction')
+@click.option('--user', 'username', default=None, help='Record the import as created by this user')
+@click.option('--errors', 'errors_path', type=click.Path(dir_okay=False), default=None,
+              help='Write rejected rows (line, problem) to this CSV file')
+def import_patients_command(path, batch_size, username, errors_path):
+    """Bulk import patients from a CSV or XLSX registry file"""
+    conn = get_db_connection()
+    created_by = None
+    if username:
+        user = conn.execute('SELECT id FROM users WHERE username = ?', (username,)).fetchone()
+        if not user:
+            raise click.ClickException(f'Unknown user: {username}')
+        created_by = user['id']
+
+    def report(result):
+        print(f'  {result.inserted} imported, {result.rejected} rejected')
+
+    try:
+        with open(path, 'rb') as source:
+            result = import_patients(conn, iter_import_records(source, path), created_by=created_by,
+                                     batch_size=batch_size, progress=report)
+    except ImportFormatError as e:
+        raise click.ClickException(str(e))
+    finally:
+        conn.close()
+        invalidate_patient_caches()
+
+    print(result.summary())
+    if result.first_id:
+        print(f'Assigned IDs {result.first_id} to {result.last_id}')
+    if errors_path and result.errors:
+        with open(errors_path, 'w', newline='') as out:
+            writer = csv.writer(out)
+            writer.writerow(['Line', 'Problem'])
+            writer.writerows(result.errors)
+        print(f'{len(result.errors)} rejected rows written to {errors_path}')
+    else:
+        for line, message in result.errors[:20]:
+            print(f'  line {line}: {message}')
 
 # ==================== ERROR HANDLERS ====================
 
@@ -0,0 +1,261 @@
+"""
+End-to-end request benchmarks against a generated registry.
+
+Runs the main pages through Flask's test client (templates, SQL, exports and
+all) against a registry built by registry_generator.py, reporting latency
+percentiles plus the database time and query count from each response's
+Server-Timing header. Results can be saved as JSON and compared against a
+baseline from another commit; a median more than ``--tolerance`` slower is
+reported as a regression and makes the run exit with status 1:
+
+    python benchmarks/app_benchmark.py --size 100000 --save
+    python benchmarks/app_benchmark.py --size 100000 --compare benchmarks/results/<commit>_100000.json
+    python benchmarks/app_benchmark.py --database registry.db --only records export_csv --cold
+
+``add_patient`` writes to the registry; the rows it adds are deleted again
+when the run ends.
+"""
+import argparse
+import json
+import os
+import platform
+import re
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from registry_generator import BENCH_ADMIN, DATA_DIR, DEFAULT_SEED, ensure_registry
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
+DEFAULT_ITERATIONS = 20
+DEFAULT_WARMUP = 2
+DEFAULT_TOLERANCE = 0.2
+
+# Narrow enough to stay under EXPORT_ASYNC_THRESHOLD at 1M patients
+EXPORT_FILTER = 'status=Critical&cancer_type=Pancreatic+Cancer&cancer_stage=Stage+IV'
+
+NEW_PATIENT = {
+    'full_name': 'Benchmark Patient', 'age': '58', 'gender': 'Female', 'blood_group': 'O+',
+    'contact_number': '+91-9000000000', 'city': 'Pune', 'state': 'Maharashtra',
+    'cancer_type': 'Breast Cancer', 'cancer_stage': 'Stage II', 'tumor_size': '2.4',
+    'metastasis': 'No Metastasis', 'diagnosis_date': '2026-01-15', 'treatment_type': 'Chemotherapy',
+    'treatment_phase': 'Induction', 'chemo_cycles_planned': '6', 'chemo_cycles_completed': '1',
+    'doctor_name': 'Dr. Priya Patel', 'hospital_name': 'Tata Memorial', 'height': '160', 'weight': '62',
+    'blood_pressure': '120/80', 'heart_rate': '72', 'risk_level': 'Medium', 'current_status': 'Active Treatment',
+}
+
+# name -> (method, url, form data, expected status)
+SCENARIOS = {
+    'dashboard': ('GET', '/dashboard', None, 200),
+    'records': ('GET', '/records', None, 200),
+    'records_filtered': ('GET', '/records?status=Critical&cancer_type=Lung+Cancer', None, 200),
+    'records_filtered_count': ('GET', '/records?cancer_stage=Stage+IV&status=Terminal&count=1', None, 200),
+    'records_search_word': ('GET', '/records?search=Smith', None, 200),
+    'records_search_substring': ('GET', '/records?search=ohns', None, 200),
+    'records_search_id': ('GET', '/records?search=ONC-2025-01', None, 200),
+    'analytics': ('GET', '/analytics', None, 200),
+    'export_csv': ('GET', '/export_data?format=csv', None, 200),
+    'export_csv_filtered': ('GET', f'/export_data?format=csv&{EXPORT_FILTER}', None, 200),
+    'export_excel': ('GET', f'/export_data?format=excel&{EXPORT_FILTER}', None, 200),
+    'export_pdf': ('GET', f'/export_data?format=pdf&{EXPORT_FILTER}', None, 200),
+    'export_pdf_grouped': ('GET', f'/export_data?format=pdf&group_by=hospital&{EXPORT_FILTER}', None, 200),
+    'add_patient': ('POST', '/add_patient', NEW_PATIENT, 302),
+}
+
+SERVER_TIMING_DB = re.compile(r'db;dur=([\d.]+);desc="(\d+) queries"')
+
+
+def percentile(values, percent):
+    """Nearest-rank percentile"""
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, -(-len(ordered) * percent // 100) - 1))
+    return ordered[int(rank)]
+
+
+def git_commit():
+    """(short commit, working tree dirty) of the checkout being measured"""
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=root, capture_output=True,
+                                text=True, check=True).stdout.strip()
+        dirty = bool(subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=root,
+                                    capture_output=True, text=True, check=True).stdout.strip())
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown', False
+    return commit, dirty
+
+
+def load_app(database):
+    """Import the app against ``database`` (configuration is read at import time)"""
+    os.environ['DATABASE'] = database
+    os.environ.setdefault('EXPORT_DIR', tempfile.mkdtemp(prefix='bench_exports_'))
+    os.environ.setdefault('SLOW_QUERY_MS', '100000')
+    os.environ.setdefault('SLOW_REQUEST_MS', '100000')
+    os.environ['PROFILING_ENABLED'] = '1'
+    import app_new
+    return app_new
+
+
+def login(client, conn):
+    """Put the benchmark admin into the client's session"""
+    user = conn.execute('SELECT id, username FROM users WHERE username = ?', (BENCH_ADMIN,)).fetchone()
+    if user is None:
+        user = conn.execute('SELECT id, username FROM users WHERE is_admin ORDER BY id LIMIT 1').fetchone()
+    with client.session_transaction() as session:
+        session['user_id'] = user[0]
+        session['username'] = user[1]
+        session['is_admin'] = True
+
+
+def run_scenario(client, method, url, data, expected, iterations, warmup, before=None):
+    """Time ``iterations`` requests (body fully consumed) after ``warmup`` untimed ones"""
+    timings, db_times, queries, sizes = [], [], [], []
+    for iteration in range(warmup + iterations):
+        if before:
+            before()
+        started = time.perf_counter()
+        response = client.open(url, method=method, data=data)
+        body = response.get_data()
+        elapsed = (time.perf_counter() - started) * 1000
+        if response.status_code != expected:
+            raise RuntimeError(f'{method} {url} answered {response.status_code}, expected {expected}')
+        if iteration < warmup:
+            continue
+        timings.append(elapsed)
+        sizes.append(len(body))
+        match = SERVER_TIMING_DB.search(', '.join(response.headers.getlist('Server-Timing')))
+        if match:
+            db_times.append(float(match.group(1)))
+            queries.append(int(match.group(2)))
+    return {
+        'median_ms': round(statistics.median(timings), 2),
+        'p95_ms': round(percentile(timings, 95), 2),
+        'min_ms': round(min(timings), 2),
+        'mean_ms': round(statistics.fmean(timings), 2),
+        'db_ms': round(statistics.median(db_times), 2) if db_times else None,
+        'queries': int(statistics.median(queries)) if queries else None,
+        'bytes': int(statistics.median(sizes)),
+    }
+
+
+def run_benchmarks(database, names, iterations=DEFAULT_ITERATIONS, warmup=DEFAULT_WARMUP, cold=False):
+    """Run the named scenarios; returns the result document"""
+    app_module = load_app(database)
+    client = app_module.app.test_client()
+    conn = sqlite3.connect(database)
+    patients = conn.execute('SELECT COUNT(*) FROM patients').fetchone()[0]
+    last_id = conn.execute('SELECT IFNULL(MAX(id), 0) FROM patients').fetchone()[0]
+    login(client, conn)
+
+    # --cold: drop the in-process caches before every request
+    before = app_module.invalidate_patient_caches if cold else None
+    commit, dirty = git_commit()
+    document = {
+        'meta': {
+            'commit': commit,
+            'dirty': dirty,
+            'created': datetime.now().isoformat(timespec='seconds'),
+            'database': os.path.basename(database),
+            'patients': patients,
+            'iterations': iterations,
+            'warmup': warmup,
+            'cold': cold,
+            'python': platform.python_version(),
+            'sqlite': sqlite3.sqlite_version,
+            'machine': platform.machine(),
+        },
+        'results': {},
+    }
+    try:
+        for name in names:
+            method, url, data, expected = SCENARIOS[name]
+            document['results'][name] = run_scenario(client, method, url, data, expected,
+                                                     iterations, warmup, before)
+            print_row(name, document['results'][name])
+    finally:
+        # Undo add_patient's inserts (triggers keep patient_stats and the search index in step)
+        conn.execute('DELETE FROM patients WHERE id > ?', (last_id,))
+        conn.commit()
+        conn.close()
+        app_module.invalidate_patient_caches()
+    return document
+
+
+HEADER = f"{'scenario':<26} {'median ms':>10} {'p95 ms':>9} {'db ms':>8} {'queries':>8} {'KB':>8}"
+
+
+def print_row(name, result, baseline=None):
+    db_ms = '-' if result['db_ms'] is None else f"{result['db_ms']:.1f}"
+    queries = '-' if result['queries'] is None else result['queries']
+    line = (f"{name:<26} {result['median_ms']:>10.1f} {result['p95_ms']:>9.1f} {db_ms:>8} "
+            f"{queries:>8} {result['bytes'] / 1024:>8.1f}")
+    if baseline:
+        line += f"  {baseline['median_ms']:>9.1f} {result['median_ms'] / baseline['median_ms']:>6.2f}x"
+    print(line)
+
+
+def compare(document, baseline, tolerance=DEFAULT_TOLERANCE):
+    """Print current vs baseline medians; returns the regressed scenario names"""
+    base_meta, meta = baseline['meta'], document['meta']
+    print(f"\nBaseline {base_meta['commit']}{' (dirty)' if base_meta['dirty'] else ''} "
+          f"({base_meta['patients']} patients) vs {meta['commit']}{' (dirty)' if meta['dirty'] else ''} "
+          f"({meta['patients']} patients)")
+    if base_meta['patients'] != meta['patients']:
+        print('warning: registries differ in size, ratios are not comparable')
+    print(f"{HEADER}  {'baseline':>9} {'ratio':>7}")
+    regressions = []
+    for name, result in document['results'].items():
+        previous = baseline['results'].get(name)
+        print_row(name, result, previous)
+        if previous and result['median_ms'] > previous['median_ms'] * (1 + tolerance):
+            regressions.append(name)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument('--size', type=int, default=10000,
+                        help='patients in the generated registry (built in benchmarks/data on first use)')
+    source.add_argument('--database', help='benchmark an existing database instead')
+    parser.add_argument('--seed', type=int, default=DEFAULT_SEED)
+    parser.add_argument('--only', nargs='+', choices=list(SCENARIOS), default=list(SCENARIOS))
+    parser.add_argument('--iterations', type=int, default=DEFAULT_ITERATIONS)
+    parser.add_argument('--warmup', type=int, default=DEFAULT_WARMUP)
+    parser.add_argument('--cold', action='store_true', help='clear the in-process caches before every request')
+    parser.add_argument('--save', nargs='?', const='', metavar='PATH',
+                        help='write the results as JSON (default: benchmarks/results/<commit>_<patients>.json)')
+    parser.add_argument('--compare', metavar='BASELINE', help='compare with a saved result')
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE,
+                        help='allowed median slowdown before a scenario counts as regressed (0.2 = 20%%)')
+    args = parser.parse_args()
+
+    database = args.database or ensure_registry(args.size, DATA_DIR, args.seed)
+    print(HEADER)
+    document = run_benchmarks(database, args.only, args.iterations, args.warmup, args.cold)
+
+    if args.save is not None:
+        path = args.save or os.path.join(
+            RESULTS_DIR, f"{document['meta']['commit']}_{document['meta']['patients']}.json")
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, 'w') as f:
+            json.dump(document, f, indent=2)
+        print(f'\nSaved {path}')
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(document, baseline, args.tolerance)
+        if regressions:
+            print(f"\n{len(regressions)} regressed by more than {args.tolerance:.0%}: {', '.join(regressions)}")
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
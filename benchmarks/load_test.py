@@ -0,0 +1,413 @@
+"""
+Load test: concurrent data-entry clerks against a local gunicorn server.
+
+Starts gunicorn (gevent workers by default, as in the Procfile) on a
+generated registry, logs N synthetic users in through ``/login`` and has
+each of them loop over a weighted mix of ``add_patient`` writes, ``records``
+searches and dashboard reads with exponential think time. Reports
+throughput, latency percentiles and error counts per operation - SQLite
+"database is locked" failures, 5xx responses, connection errors - and writes
+them as JSON that can be diffed against another release's report:
+
+    python benchmarks/load_test.py --size 100000 --users 20 --duration 60 --save
+    python benchmarks/load_test.py --users 50 --mix add_patient=1 records_search=6 dashboard=3
+    python benchmarks/load_test.py --url http://127.0.0.1:8000 --users 10   # an already running server
+    python benchmarks/load_test.py --size 100000 --compare benchmarks/results/load_<commit>_100000.json
+
+Users are ``bench_user_NN`` (password ``benchmark``), created when missing.
+Patients added during the run are deleted afterwards unless ``--keep-rows``.
+"""
+import argparse
+import http.cookiejar
+import json
+import os
+import platform
+import random
+import secrets
+import socket
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from datetime import datetime
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from add_50_patients import last_names
+from app_benchmark import NEW_PATIENT, RESULTS_DIR, git_commit, percentile
+from registry_generator import (BENCH_PASSWORD, CANCER_STAGES, CANCER_TYPES, DATA_DIR, DEFAULT_SEED,
+                                STATUSES, create_users, ensure_registry)
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+DEFAULT_USERS = 20
+DEFAULT_DURATION = 60
+DEFAULT_RAMP_UP = 5
+DEFAULT_THINK_TIME = 0.5
+DEFAULT_WORKERS = 4
+DEFAULT_WORKER_CLASS = 'gevent'
+DEFAULT_MIX = {'add_patient': 2, 'records_search': 5, 'dashboard': 3}
+REQUEST_TIMEOUT = 30
+STARTUP_TIMEOUT = 60
+
+LOCKED_MARKER = b'database is locked'
+
+# Outcome buckets reported for every operation
+OUTCOMES = ['ok', 'locked', 'server_error', 'connection', 'unexpected']
+
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    """Report redirects as responses: a POST answered with 302 is the success case"""
+
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        return None
+
+
+class Clerk:
+    """One logged-in synthetic user with its own cookie jar"""
+
+    def __init__(self, base_url, username, rng):
+        self.base_url = base_url
+        self.username = username
+        self.rng = rng
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()), _NoRedirect())
+
+    def request(self, path, form=None):
+        """(status, body) for one request; HTTP error statuses are returned, not raised"""
+        data = urllib.parse.urlencode(form).encode() if form is not None else None
+        try:
+            with self.opener.open(self.base_url + path, data=data, timeout=REQUEST_TIMEOUT) as response:
+                return response.status, response.read()
+        except urllib.error.HTTPError as error:
+            return error.code, error.read()
+
+    def login(self):
+        status, _ = self.request('/login', {'username': self.username, 'password': BENCH_PASSWORD})
+        if status != 302:
+            raise RuntimeError(f'login as {self.username} answered {status}')
+
+    # Operations: each returns (status, body, expected status)
+
+    def dashboard(self):
+        return self.request('/dashboard') + (200,)
+
+    def records_search(self):
+        choice = self.rng.random()
+        if choice < 0.5:
+            params = {'search': self.rng.choice(last_names)}
+        elif choice < 0.7:
+            params = {'search': f'ONC-{self.rng.randint(2022, datetime.now().year)}-{self.rng.randint(1, 99):02d}'}
+        else:
+            params = {'status': self.rng.choice(STATUSES), 'cancer_type': self.rng.choice(CANCER_TYPES)[0]}
+        return self.request('/records?' + urllib.parse.urlencode(params)) + (200,)
+
+    def add_patient(self):
+        form = dict(NEW_PATIENT,
+                    full_name=f'Load Test {self.username} {self.rng.randint(1, 10**6)}',
+                    age=str(self.rng.randint(20, 90)),
+                    cancer_type=self.rng.choice(CANCER_TYPES)[0],
+                    cancer_stage=self.rng.choice(CANCER_STAGES)[0],
+                    current_status=self.rng.choice(STATUSES))
+        return self.request('/add_patient', form) + (302,)
+
+
+def classify(status, body, expected):
+    """Outcome bucket for one response"""
+    if LOCKED_MARKER in body:
+        # add_patient flashes the SQLite error and re-renders the form with 200
+        return 'locked'
+    if status >= 500:
+        return 'server_error'
+    if status != expected:
+        return 'unexpected'
+    return 'ok'
+
+
+class Recorder:
+    """Thread-safe latency and outcome collection"""
+
+    def __init__(self, operations):
+        self._lock = threading.Lock()
+        self.latencies = {name: [] for name in operations}
+        self.outcomes = {name: dict.fromkeys(OUTCOMES, 0) for name in operations}
+
+    def add(self, operation, elapsed_ms, outcome):
+        with self._lock:
+            self.outcomes[operation][outcome] += 1
+            if outcome == 'ok':
+                self.latencies[operation].append(elapsed_ms)
+
+
+def run_clerk(clerk, mix, recorder, start_at, deadline, think_time, login_errors):
+    """Log in at ``start_at``, then run weighted operations until ``deadline``"""
+    time.sleep(max(0.0, start_at - time.monotonic()))
+    try:
+        clerk.login()
+    except (OSError, RuntimeError) as error:
+        login_errors.append(f'{clerk.username}: {error}')
+        return
+    operations, weights = list(mix), list(mix.values())
+    while time.monotonic() < deadline:
+        operation = clerk.rng.choices(operations, weights)[0]
+        started = time.perf_counter()
+        try:
+            status, body, expected = getattr(clerk, operation)()
+            outcome = classify(status, body, expected)
+        except OSError:
+            outcome = 'connection'
+        recorder.add(operation, (time.perf_counter() - started) * 1000, outcome)
+        if think_time:
+            time.sleep(clerk.rng.expovariate(1 / think_time))
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_server(database, workers, worker_class, log_path):
+    """Start gunicorn on a free local port; returns (process, base url)"""
+    port = _free_port()
+    env = dict(os.environ, DATABASE=database, SLOW_REQUEST_MS='100000', SLOW_QUERY_MS='100000')
+    # Every worker has to sign sessions with the same key
+    env.setdefault('SECRET_KEY', secrets.token_hex(32))
+    command = [sys.executable, '-m', 'gunicorn', '--workers', str(workers), '--worker-class', worker_class,
+               '--bind', f'127.0.0.1:{port}', '--timeout', str(REQUEST_TIMEOUT * 2), 'app_new:app']
+    log = open(log_path, 'wb')
+    process = subprocess.Popen(command, cwd=ROOT, env=env, stdout=log, stderr=subprocess.STDOUT)
+    base_url = f'http://127.0.0.1:{port}'
+    deadline = time.monotonic() + STARTUP_TIMEOUT
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f'gunicorn exited with status {process.returncode}, see {log_path}')
+        try:
+            urllib.request.urlopen(base_url + '/login', timeout=2).close()
+            return process, base_url
+        except OSError:
+            time.sleep(0.25)
+    process.terminate()
+    raise RuntimeError(f'gunicorn did not answer within {STARTUP_TIMEOUT}s, see {log_path}')
+
+
+def stop_server(process):
+    process.terminate()
+    try:
+        process.wait(timeout=30)
+    except subprocess.TimeoutExpired:
+        process.kill()
+
+
+def summarize(recorder, elapsed):
+    """Per-operation and total throughput, percentiles and error counts"""
+    operations = {}
+    all_latencies = []
+    totals = dict.fromkeys(OUTCOMES, 0)
+    for name, latencies in recorder.latencies.items():
+        outcomes = recorder.outcomes[name]
+        all_latencies += latencies
+        for outcome, count in outcomes.items():
+            totals[outcome] += count
+        operations[name] = _latency_summary(latencies, sum(outcomes.values()), elapsed, outcomes)
+    operations['total'] = _latency_summary(all_latencies, sum(totals.values()), elapsed, totals)
+    return operations
+
+
+def _latency_summary(latencies, requests, elapsed, outcomes):
+    summary = {
+        'requests': requests,
+        'throughput_rps': round(outcomes['ok'] / elapsed, 2),
+        'error_rate': round(1 - outcomes['ok'] / requests, 4) if requests else 0.0,
+        'outcomes': dict(outcomes),
+    }
+    for percent in (50, 90, 95, 99):
+        summary[f'p{percent}_ms'] = round(percentile(latencies, percent), 1) if latencies else None
+    summary['max_ms'] = round(max(latencies), 1) if latencies else None
+    return summary
+
+
+def run_load_test(database, users, mix, duration, ramp_up, think_time, seed, url=None,
+                  workers=DEFAULT_WORKERS, worker_class=DEFAULT_WORKER_CLASS, keep_rows=False):
+    """Run one load test; returns the report document"""
+    conn = sqlite3.connect(database)
+    create_users(conn, users + 1)
+    conn.commit()
+    usernames = [f'bench_user_{number:02d}' for number in range(1, users + 1)]
+    patients = conn.execute('SELECT COUNT(*) FROM patients').fetchone()[0]
+    last_id = conn.execute('SELECT IFNULL(MAX(id), 0) FROM patients').fetchone()[0]
+
+    log_path = os.path.join(tempfile.gettempdir(), f'load_test_gunicorn_{os.getpid()}.log')
+    process = None
+    if url is None:
+        process, url = start_server(database, workers, worker_class, log_path)
+    recorder = Recorder(mix)
+    login_errors = []
+    try:
+        started = time.monotonic()
+        deadline = started + ramp_up + duration
+        threads = [threading.Thread(
+            target=run_clerk,
+            args=(Clerk(url, username, random.Random(seed * 1000 + number)), mix, recorder,
+                  started + ramp_up * number / users, deadline, think_time, login_errors),
+            daemon=True,
+        ) for number, username in enumerate(usernames)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.monotonic() - started
+    finally:
+        if process is not None:
+            stop_server(process)
+        added = conn.execute('SELECT COUNT(*) FROM patients WHERE id > ?', (last_id,)).fetchone()[0]
+        if not keep_rows:
+            conn.execute('DELETE FROM patients WHERE id > ?', (last_id,))
+            conn.commit()
+        conn.close()
+
+    server_log_locked = None
+    if process is not None:
+        with open(log_path, 'rb') as log:
+            server_log_locked = log.read().count(LOCKED_MARKER)
+
+    commit, dirty = git_commit()
+    return {
+        'meta': {
+            'commit': commit,
+            'dirty': dirty,
+            'created': datetime.now().isoformat(timespec='seconds'),
+            'database': os.path.basename(database),
+            'patients': patients,
+            'users': users,
+            'mix': mix,
+            'duration_s': round(elapsed, 1),
+            'ramp_up_s': ramp_up,
+            'think_time_s': think_time,
+            'server': f'gunicorn {workers}x{worker_class}' if process is not None else url,
+            'python': platform.python_version(),
+            'sqlite': sqlite3.sqlite_version,
+            'machine': platform.machine(),
+            'cpus': os.cpu_count(),
+        },
+        'login_errors': login_errors,
+        'patients_added': added,
+        'server_log_locked': server_log_locked,
+        'operations': summarize(recorder, elapsed),
+    }
+
+
+HEADER = (f"{'operation':<16} {'requests':>9} {'ok/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} "
+          f"{'locked':>7} {'5xx':>5} {'conn':>5} {'other':>6}")
+
+
+def _ms(value):
+    return '-' if value is None else f'{value:.1f}'
+
+
+def print_report(document):
+    meta = document['meta']
+    print(f"{meta['users']} users on {meta['server']}, {meta['patients']} patients, "
+          f"{meta['duration_s']}s, mix {meta['mix']}")
+    print(HEADER)
+    for name, summary in document['operations'].items():
+        outcomes = summary['outcomes']
+        print(f"{name:<16} {summary['requests']:>9} {summary['throughput_rps']:>8.1f} {_ms(summary['p50_ms']):>8} "
+              f"{_ms(summary['p95_ms']):>8} {_ms(summary['p99_ms']):>8} {outcomes['locked']:>7} "
+              f"{outcomes['server_error']:>5} {outcomes['connection']:>5} {outcomes['unexpected']:>6}")
+    if document['login_errors']:
+        print(f"{len(document['login_errors'])} users could not log in: {document['login_errors'][0]}")
+    if document['server_log_locked']:
+        print(f"'database is locked' appears {document['server_log_locked']} times in the server log")
+
+
+def print_comparison(document, baseline):
+    """Throughput and p95 of each operation against a previous report"""
+    base_meta, meta = baseline['meta'], document['meta']
+    print(f"\nBaseline {base_meta['commit']} vs {meta['commit']}")
+    for key in ('users', 'patients', 'mix', 'server'):
+        if base_meta.get(key) != meta.get(key):
+            print(f'warning: {key} differs ({base_meta.get(key)} vs {meta.get(key)}), ratios are not comparable')
+    print(f"{'operation':<16} {'ok/s':>8} {'was':>8} {'ratio':>7} {'p95 ms':>8} {'was':>8} {'ratio':>7} "
+          f"{'errors':>7} {'was':>7}")
+    for name, summary in document['operations'].items():
+        previous = baseline['operations'].get(name)
+        if not previous:
+            continue
+        throughput_ratio = (summary['throughput_rps'] / previous['throughput_rps']
+                            if previous['throughput_rps'] else float('nan'))
+        p95_ratio = (summary['p95_ms'] / previous['p95_ms']
+                     if summary['p95_ms'] and previous['p95_ms'] else float('nan'))
+        errors = summary['requests'] - summary['outcomes']['ok']
+        previous_errors = previous['requests'] - previous['outcomes']['ok']
+        print(f"{name:<16} {summary['throughput_rps']:>8.1f} {previous['throughput_rps']:>8.1f} "
+              f"{throughput_ratio:>6.2f}x {_ms(summary['p95_ms']):>8} {_ms(previous['p95_ms']):>8} "
+              f"{p95_ratio:>6.2f}x {errors:>7} {previous_errors:>7}")
+
+
+def parse_mix(values):
+    """['add_patient=2', ...] -> {'add_patient': 2.0, ...}"""
+    mix = {}
+    for value in values:
+        name, _, weight = value.partition('=')
+        if name not in DEFAULT_MIX:
+            raise argparse.ArgumentTypeError(f"unknown operation '{name}' (choose from {', '.join(DEFAULT_MIX)})")
+        mix[name] = float(weight or 1)
+    return {name: weight for name, weight in mix.items() if weight > 0}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument('--size', type=int, default=100000,
+                        help='patients in the generated registry (built in benchmarks/data on first use)')
+    source.add_argument('--database', help='load-test an existing database instead')
+    parser.add_argument('--seed', type=int, default=DEFAULT_SEED)
+    parser.add_argument('--url', help='target an already running server on --database instead of starting one')
+    parser.add_argument('--users', type=int, default=DEFAULT_USERS)
+    parser.add_argument('--duration', type=float, default=DEFAULT_DURATION, help='seconds after ramp-up')
+    parser.add_argument('--ramp-up', type=float, default=DEFAULT_RAMP_UP, help='seconds to stagger logins over')
+    parser.add_argument('--think-time', type=float, default=DEFAULT_THINK_TIME,
+                        help='mean pause between a user\'s requests in seconds (0 = closed loop)')
+    parser.add_argument('--mix', nargs='+', metavar='OPERATION=WEIGHT',
+                        default=[f'{name}={weight}' for name, weight in DEFAULT_MIX.items()])
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS)
+    parser.add_argument('--worker-class', default=DEFAULT_WORKER_CLASS)
+    parser.add_argument('--keep-rows', action='store_true', help='keep the patients added during the run')
+    parser.add_argument('--save', nargs='?', const='', metavar='PATH',
+                        help='write the report as JSON (default: benchmarks/results/load_<commit>_<patients>.json)')
+    parser.add_argument('--compare', metavar='REPORT', help='compare with a saved report')
+    args = parser.parse_args()
+
+    try:
+        mix = parse_mix(args.mix)
+    except argparse.ArgumentTypeError as error:
+        parser.error(str(error))
+    if args.url and not args.database:
+        parser.error('--url needs the --database the server is using')
+
+    database = os.path.abspath(args.database or ensure_registry(args.size, DATA_DIR, args.seed))
+    document = run_load_test(database, args.users, mix, args.duration, args.ramp_up, args.think_time, args.seed,
+                             args.url, args.workers, args.worker_class, args.keep_rows)
+    print_report(document)
+
+    if args.save is not None:
+        path = args.save or os.path.join(
+            RESULTS_DIR, f"load_{document['meta']['commit']}_{document['meta']['patients']}.json")
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, 'w') as f:
+            json.dump(document, f, indent=2)
+        print(f'\nSaved {path}')
+
+    if args.compare:
+        with open(args.compare) as f:
+            print_comparison(document, json.load(f))
+
+
+if __name__ == '__main__':
+    main()
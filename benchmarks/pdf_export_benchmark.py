@@ -0,0 +1,75 @@
+"""
+Benchmark for the chunked PDF export engine (utils.helpers.export_rows_to_pdf).
+
+Generates synthetic patient rows in memory and times PDF generation at
+increasing sizes, reporting per-row cost so linear scaling is easy to check:
+
+    python benchmarks/pdf_export_benchmark.py
+    python benchmarks/pdf_export_benchmark.py --sizes 1000 10000 50000 --group-by Hospital
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from utils.helpers import export_rows_to_pdf
+
+HEADERS = ['Patient ID', 'Full Name', 'Age', 'Gender', 'Cancer Type', 'Stage', 'Status',
+           'Diagnosis Date', 'Doctor', 'Hospital', 'Created At']
+
+HOSPITALS = ['Apollo Hospital', 'Fortis Healthcare', 'AIIMS', 'Tata Memorial', 'Manipal Hospital']
+DOCTORS = ['Dr. Rajesh Sharma', 'Dr. Priya Patel', 'Dr. Amit Kumar', 'Dr. Sunita Gupta']
+
+
+def make_rows(count, seed=42):
+    """Synthetic export rows, sorted by hospital so grouping is valid"""
+    rng = random.Random(seed)
+    rows = [(
+        f'ONC-2026-{i:06d}',
+        f'Patient {i}',
+        rng.randint(18, 90),
+        rng.choice(['Male', 'Female']),
+        rng.choice(['Lung Cancer', 'Breast Cancer', 'Colon Cancer', 'Leukemia']),
+        rng.choice(['Stage I', 'Stage II', 'Stage III', 'Stage IV']),
+        rng.choice(['Active Treatment', 'Recovered', 'Critical', 'Remission']),
+        '2024-05-01',
+        rng.choice(DOCTORS),
+        rng.choice(HOSPITALS),
+        '2026-01-01 10:00:00',
+    ) for i in range(count)]
+    rows.sort(key=lambda row: row[9])
+    return rows
+
+
+def batched(rows, size=1000):
+    for start in range(0, len(rows), size):
+        yield rows[start:start + size]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 5000, 10000, 25000, 50000])
+    parser.add_argument('--group-by', choices=['Hospital', 'Doctor'], default=None)
+    args = parser.parse_args()
+
+    print(f"{'rows':>8} {'seconds':>9} {'us/row':>8} {'size KB':>9}")
+    for size in args.sizes:
+        rows = make_rows(size)
+        fd, path = tempfile.mkstemp(suffix='.pdf')
+        os.close(fd)
+        try:
+            start = time.perf_counter()
+            export_rows_to_pdf(HEADERS, batched(rows), path, 'Benchmark Report', group_by=args.group_by)
+            elapsed = time.perf_counter() - start
+            size_kb = os.path.getsize(path) / 1024
+        finally:
+            os.remove(path)
+        print(f'{size:>8} {elapsed:>9.2f} {elapsed / size * 1e6:>8.1f} {size_kb:>9.0f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,320 @@
+"""
+Seeded synthetic patient registry for benchmarks.
+
+Builds a complete database (current schema, users, patients, search index and
+patient_stats) with realistic distributions over the vocabularies the forms
+use: cancer type mix, stage-dependent status/risk/metastasis, type-dependent
+gender, Zipf-skewed doctor/hospital/creator workloads and a registry that
+grows over time. Every column of a batch is drawn in one vectorized numpy
+pass and inserted with ``executemany``, so a 1M patient registry takes
+minutes rather than hours. The same seed always produces the same database:
+
+    python benchmarks/registry_generator.py --sizes 10000 100000 1000000
+    python benchmarks/registry_generator.py --sizes 50000 --seed 7 --out-dir /tmp/registries
+"""
+import argparse
+import os
+import sqlite3
+import sys
+import time
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from werkzeug.security import generate_password_hash
+
+from add_50_patients import first_names, last_names, cities, states, blood_groups, doctors, hospitals
+from utils.ids import ensure_patient_id_sequence, reserve_patient_ids
+from utils.schema import ensure_schema, deferred_insert_triggers
+from utils.validation import PATIENT_COLUMNS, calculate_bmi_column, frame_to_rows
+
+DEFAULT_SIZES = [10000, 100000, 1000000]
+DEFAULT_SEED = 42
+DEFAULT_BATCH_SIZE = 50000
+DEFAULT_USERS = 20
+DEFAULT_YEARS = 5
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+
+# Every generated user has this password (admin: bench_admin)
+BENCH_PASSWORD = 'benchmark'
+BENCH_ADMIN = 'bench_admin'
+
+# (value, weight) vocabularies, values as offered by the add_patient form
+CANCER_TYPES = [
+    ('Breast Cancer', 20), ('Lung Cancer', 18), ('Colorectal Cancer', 12), ('Prostate Cancer', 12),
+    ('Skin Cancer', 8), ('Stomach Cancer', 7), ('Liver Cancer', 6), ('Pancreatic Cancer', 5), ('Other', 12),
+]
+# Share of female patients per cancer type (default 0.5)
+FEMALE_SHARE = {'Breast Cancer': 0.99, 'Prostate Cancer': 0.0, 'Lung Cancer': 0.45}
+CANCER_STAGES = [('Stage I', 30), ('Stage II', 28), ('Stage III', 24), ('Stage IV', 18)]
+STATUSES = ['Active Treatment', 'Recovered', 'Critical', 'Under Observation', 'Remission', 'Terminal']
+# Status weights per stage, in STATUSES order
+STATUS_BY_STAGE = {
+    'Stage I': [30, 25, 2, 25, 17, 1],
+    'Stage II': [38, 18, 4, 20, 18, 2],
+    'Stage III': [45, 8, 12, 15, 14, 6],
+    'Stage IV': [40, 2, 25, 8, 5, 20],
+}
+RISK_LEVELS = ['Low', 'Medium', 'High', 'Critical']
+RISK_BY_STAGE = {
+    'Stage I': [60, 30, 9, 1],
+    'Stage II': [35, 40, 20, 5],
+    'Stage III': [10, 35, 40, 15],
+    'Stage IV': [2, 13, 45, 40],
+}
+METASTASIS = ['No Metastasis', 'Regional Metastasis', 'Distant Metastasis']
+METASTASIS_BY_STAGE = {
+    'Stage I': [97, 3, 0],
+    'Stage II': [80, 18, 2],
+    'Stage III': [35, 55, 10],
+    'Stage IV': [5, 25, 70],
+}
+TREATMENT_TYPES = [
+    ('Chemotherapy', 30), ('Radiation Therapy', 15), ('Surgery', 20), ('Immunotherapy', 8),
+    ('Targeted Therapy', 7), ('Hormone Therapy', 8), ('Combination', 12),
+]
+TREATMENT_PHASES = [('Initial', 20), ('Induction', 15), ('Consolidation', 15), ('Maintenance', 35), ('Palliative', 15)]
+SURGERY_STATUSES = [('Not Required', 45), ('Planned', 15), ('Completed', 30), ('In Recovery', 10)]
+GENDER_OTHER_SHARE = 0.005
+
+# Statuses that keep a patient on an appointment schedule
+SCHEDULED_STATUSES = ['Active Treatment', 'Critical', 'Under Observation', 'Remission']
+
+INSERT_COLUMNS = ['patient_id'] + PATIENT_COLUMNS + ['bmi', 'created_by', 'created_at']
+INSERT_SQL = 'INSERT INTO patients ({columns}) VALUES ({placeholders})'.format(
+    columns=', '.join(INSERT_COLUMNS), placeholders=', '.join(['?'] * len(INSERT_COLUMNS)))
+
+
+def _weights(weights):
+    weights = np.asarray(weights, dtype=float)
+    return weights / weights.sum()
+
+
+def _choice(rng, vocabulary, size):
+    """Draw from a [(value, weight), ...] vocabulary"""
+    values = np.array([value for value, _ in vocabulary], dtype=object)
+    return values[rng.choice(len(values), size=size, p=_weights([weight for _, weight in vocabulary]))]
+
+
+def _zipf_choice(rng, values, size, exponent=1.1):
+    """Skewed draw: the first values get most of the rows, as real workloads do"""
+    ranks = np.arange(1, len(values) + 1)
+    return np.array(values, dtype=object)[rng.choice(len(values), size=size, p=_weights(ranks ** -exponent))]
+
+
+def _conditional_choice(rng, keys, table, values):
+    """Draw values[i] with the weights ``table[key]`` row by row, vectorized per key"""
+    out = np.empty(len(keys), dtype=object)
+    for key, weights in table.items():
+        mask = keys == key
+        out[mask] = np.array(values, dtype=object)[rng.choice(len(values), size=mask.sum(), p=_weights(weights))]
+    return out
+
+
+def _optional(rng, values, present_share):
+    """Blank out a share of a column (optional form fields)"""
+    values = values.astype(object)
+    values[rng.random(len(values)) >= present_share] = None
+    return values
+
+
+def _dates(days, origin):
+    """Day offsets from ``origin`` as YYYY-MM-DD strings"""
+    return (pd.Timestamp(origin) + pd.to_timedelta(days, unit='D')).strftime('%Y-%m-%d').to_numpy(dtype=object)
+
+
+def creation_times(rng, count, now, years=DEFAULT_YEARS):
+    """Sorted created_at timestamps over the last ``years``, more of them recently"""
+    span = years * 365 * 86400
+    offsets = np.sort(rng.random(count) ** 0.7) * span
+    start = pd.Timestamp(now) - pd.Timedelta(seconds=span)
+    return start + pd.to_timedelta(offsets.astype('int64'), unit='s')
+
+
+def generate_patients(rng, created_at, user_ids, now):
+    """A DataFrame of patient columns for the given (sorted) creation times"""
+    size = len(created_at)
+    today = pd.Timestamp(now).normalize()
+    frame = pd.DataFrame(index=range(size))
+
+    first = np.array(first_names, dtype=object)[rng.integers(0, len(first_names), size)]
+    last = np.array(last_names, dtype=object)[rng.integers(0, len(last_names), size)]
+    frame['full_name'] = first + ' ' + last
+
+    cancer_type = _choice(rng, CANCER_TYPES, size)
+    stage = _choice(rng, CANCER_STAGES, size)
+    female_share = pd.Series(cancer_type).map(FEMALE_SHARE).fillna(0.5).to_numpy()
+    draw = rng.random(size)
+    gender = np.where(draw < female_share, 'Female', 'Male').astype(object)
+    gender[rng.random(size) < GENDER_OTHER_SHARE] = 'Other'
+
+    age = np.clip(np.rint(rng.normal(62, 13, size)), 18, 95).astype(int)
+    pediatric = rng.random(size) < 0.02
+    age[pediatric] = rng.integers(1, 18, pediatric.sum())
+    frame['age'] = age
+    frame['gender'] = gender
+    frame['blood_group'] = _optional(rng, _choice(rng, [(group, 1) for group in blood_groups], size), 0.7)
+
+    frame['contact_number'] = ['+91-' + str(number) for number in rng.integers(7000000000, 9999999999, size)]
+    frame['email'] = _optional(rng, pd.Series(first + '.' + last).str.lower().to_numpy(dtype=object)
+                               + rng.integers(1, 1000, size).astype(str).astype(object) + '@email.com', 0.6)
+    frame['city'] = _zipf_choice(rng, cities, size, 0.8)
+    frame['state'] = _zipf_choice(rng, states, size, 0.8)
+    frame['emergency_contact_name'] = _optional(
+        rng, np.array(first_names, dtype=object)[rng.integers(0, len(first_names), size)] + ' ' + last, 0.8)
+    frame['emergency_contact_number'] = ['+91-' + str(number)
+                                         for number in rng.integers(7000000000, 9999999999, size)]
+
+    frame['cancer_type'] = cancer_type
+    frame['cancer_stage'] = stage
+    frame['tumor_size'] = _optional(rng, np.round(rng.gamma(2.0, 1.8, size) + 0.3, 1), 0.6)
+    frame['metastasis'] = _conditional_choice(rng, stage, METASTASIS_BY_STAGE, METASTASIS)
+
+    # Diagnosed a few weeks before registration
+    created_days = ((created_at - today) / pd.Timedelta(days=1)).to_numpy()
+    diagnosis_days = np.floor(created_days - rng.exponential(30, size))
+    frame['diagnosis_date'] = _dates(diagnosis_days, today)
+
+    treatment = _choice(rng, TREATMENT_TYPES, size)
+    frame['treatment_type'] = _optional(rng, treatment, 0.9)
+    frame['treatment_phase'] = _choice(rng, TREATMENT_PHASES, size)
+    chemo = np.isin(treatment, ['Chemotherapy', 'Combination'])
+    planned = rng.integers(4, 13, size)
+    frame['chemo_cycles_planned'] = pd.Series(planned, dtype='Int64').where(chemo)
+    frame['chemo_cycles_completed'] = pd.Series((planned * rng.random(size)).astype(int), dtype='Int64').where(chemo)
+    radiation = np.isin(treatment, ['Radiation Therapy', 'Combination'])
+    sessions = rng.integers(15, 36, size)
+    frame['radiation_sessions_planned'] = pd.Series(sessions, dtype='Int64').where(radiation)
+    frame['radiation_sessions_completed'] = pd.Series((sessions * rng.random(size)).astype(int),
+                                                      dtype='Int64').where(radiation)
+    frame['surgery_status'] = _choice(rng, SURGERY_STATUSES, size)
+    frame['doctor_name'] = _zipf_choice(rng, doctors, size)
+    frame['hospital_name'] = _zipf_choice(rng, hospitals, size)
+
+    height = np.round(np.where(gender == 'Female', rng.normal(158, 7, size), rng.normal(171, 7, size)), 1)
+    weight = np.round(np.clip(rng.normal(64, 12, size), 35, 140), 1)
+    frame['height'] = height
+    frame['weight'] = weight
+    frame['blood_pressure'] = [f'{systolic}/{diastolic}' for systolic, diastolic
+                               in zip(rng.integers(100, 161, size), rng.integers(60, 101, size))]
+    frame['heart_rate'] = rng.integers(55, 111, size)
+    frame['risk_level'] = _conditional_choice(rng, stage, RISK_BY_STAGE, RISK_LEVELS)
+    status = _conditional_choice(rng, stage, STATUS_BY_STAGE, STATUSES)
+    frame['current_status'] = status
+
+    scheduled = np.isin(status, SCHEDULED_STATUSES)
+    appointment = _dates(rng.integers(-14, 91, size), today)
+    appointment[~scheduled] = None
+    frame['next_appointment'] = appointment
+
+    frame['bmi'] = calculate_bmi_column(pd.Series(height), pd.Series(weight))
+    frame['created_by'] = _zipf_choice(rng, user_ids, size, 0.9)
+    frame['created_at'] = created_at.strftime('%Y-%m-%d %H:%M:%S').to_numpy(dtype=object)
+    return frame
+
+
+def create_users(conn, count=DEFAULT_USERS):
+    """bench_admin plus ``count - 1`` data entry users; returns their ids"""
+    password_hash = generate_password_hash(BENCH_PASSWORD)
+    users = [(BENCH_ADMIN, 'Benchmark Admin', True)]
+    users += [(f'bench_user_{number:02d}', f'Benchmark User {number}', False) for number in range(1, count)]
+    conn.executemany('INSERT OR IGNORE INTO users (username, full_name, password_hash, is_admin) VALUES (?, ?, ?, ?)',
+                     [(username, full_name, password_hash, is_admin) for username, full_name, is_admin in users])
+    placeholders = ', '.join(['?'] * len(users))
+    return [row[0] for row in conn.execute(f'SELECT id FROM users WHERE username IN ({placeholders}) ORDER BY id',
+                                           [username for username, _, _ in users])]
+
+
+def _insert_batch(conn, frame):
+    """Insert one generated batch with patient IDs reserved per registration year"""
+    years = frame['created_at'].str.slice(0, 4).astype(int)
+    patient_ids = []
+    for year, rows in years.groupby(years, sort=False).size().items():
+        patient_ids += reserve_patient_ids(conn, int(rows), year=int(year))
+    frame.insert(0, 'patient_id', patient_ids)
+    conn.executemany(INSERT_SQL, frame_to_rows(frame, INSERT_COLUMNS))
+
+
+def build_registry(path, count, seed=DEFAULT_SEED, batch_size=DEFAULT_BATCH_SIZE, users=DEFAULT_USERS,
+                   years=DEFAULT_YEARS, now=None, progress=None):
+    """Create a fresh database at ``path`` holding ``count`` synthetic patients.
+
+    ``progress(done, count)`` is called after each batch.
+    """
+    if os.path.exists(path):
+        os.remove(path)
+    now = now or datetime.now().replace(microsecond=0)
+    rng = np.random.default_rng(seed)
+    conn = sqlite3.connect(path, isolation_level=None)
+    # A throwaway file: skip fsyncs while loading
+    conn.execute('PRAGMA journal_mode = WAL')
+    conn.execute('PRAGMA synchronous = OFF')
+    try:
+        ensure_schema(conn)
+        conn.execute('BEGIN IMMEDIATE')
+        ensure_patient_id_sequence(conn)
+        user_ids = create_users(conn, users)
+        conn.commit()
+
+        created_at = creation_times(rng, count, now, years)
+        for start in range(0, count, batch_size):
+            frame = generate_patients(rng, created_at[start:start + batch_size], user_ids, now)
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                with deferred_insert_triggers(conn):
+                    _insert_batch(conn, frame)
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            if progress:
+                progress(min(start + batch_size, count), count)
+        conn.execute('PRAGMA optimize')
+        conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+    finally:
+        conn.close()
+
+
+def registry_path(count, out_dir=DATA_DIR, seed=DEFAULT_SEED):
+    """Conventional file name for a generated registry"""
+    return os.path.join(out_dir, f'registry_{count}_s{seed}.db')
+
+
+def ensure_registry(count, out_dir=DATA_DIR, seed=DEFAULT_SEED, **options):
+    """Path to a generated registry of ``count`` patients, building it on first use"""
+    path = registry_path(count, out_dir, seed)
+    if not os.path.exists(path):
+        os.makedirs(out_dir, exist_ok=True)
+        build_registry(path, count, seed, **options)
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES)
+    parser.add_argument('--seed', type=int, default=DEFAULT_SEED)
+    parser.add_argument('--out-dir', default=DATA_DIR)
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument('--users', type=int, default=DEFAULT_USERS)
+    parser.add_argument('--years', type=int, default=DEFAULT_YEARS, help='registration history to spread rows over')
+    args = parser.parse_args()
+
+    os.makedirs(args.out_dir, exist_ok=True)
+    for size in args.sizes:
+        path = registry_path(size, args.out_dir, args.seed)
+        started = time.perf_counter()
+
+        def report(done, total):
+            print(f'\r{os.path.basename(path)}: {done}/{total} patients', end='', flush=True)
+
+        build_registry(path, size, args.seed, args.batch_size, args.users, args.years, progress=report)
+        elapsed = time.perf_counter() - started
+        print(f'\r{path}: {size} patients in {elapsed:.1f}s '
+              f'({size / elapsed:,.0f} rows/s, {os.path.getsize(path) / 2**20:,.0f} MB)')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,4 +1,5 @@
 import os
+import tempfile
 from datetime import timedelta
 import secrets
 
@@ -6,6 +7,40 @@ class Config:
     SECRET_KEY = os.environ.get('SECRET_KEY') or secrets.token_hex(32)
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL') or 'sqlite:///oncology_system.db'
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+
+    # SQLite connection pool (see utils/db.py)
+    DATABASE = os.environ.get('DATABASE') or 'oncology_system.db'
+    DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE') or 8)
+    DB_POOL_TIMEOUT = int(os.environ.get('DB_POOL_TIMEOUT') or 10)
+    DB_BUSY_TIMEOUT_MS = int(os.environ.get('DB_BUSY_TIMEOUT_MS') or 5000)
+    DB_MMAP_SIZE = int(os.environ.get('DB_MMAP_SIZE') or 256 * 1024 * 1024)
+    DB_CACHE_SIZE_KB = int(os.environ.get('DB_CACHE_SIZE_KB') or 16 * 1024)
+
+    # Exports above this many rows run as background jobs (see utils/jobs.py)
+    EXPORT_ASYNC_THRESHOLD = int(os.environ.get('EXPORT_ASYNC_THRESHOLD') or 5000)
+    EXPORT_DIR = os.environ.get('EXPORT_DIR') or os.path.join(tempfile.gettempdir(), 'oncobloom_exports')
+    EXPORT_JOB_TTL = int(os.environ.get('EXPORT_JOB_TTL') or 3600)
+    JOB_WORKERS = int(os.environ.get('JOB_WORKERS') or 2)
+    JOB_SWEEP_INTERVAL = int(os.environ.get('JOB_SWEEP_INTERVAL') or 15)
+    JOB_STALE_AFTER = int(os.environ.get('JOB_STALE_AFTER') or 120)
+
+    # Bulk admin operations: rows changed per transaction, and the selection
+    # size above which they run as background jobs (see utils/bulk.py)
+    BULK_CHUNK_SIZE = int(os.environ.get('BULK_CHUNK_SIZE') or 2000)
+    BULK_ASYNC_THRESHOLD = int(os.environ.get('BULK_ASYNC_THRESHOLD') or 20000)
+
+    # Rows copied per transaction by schema data backfills (see utils/migrations.py)
+    BACKFILL_BATCH_SIZE = int(os.environ.get('BACKFILL_BATCH_SIZE') or 1000)
+
+    # Request/SQL profiling (see utils/profiling.py)
+    PROFILING_ENABLED = os.environ.get('PROFILING_ENABLED', '1') != '0'
+    SLOW_QUERY_MS = int(os.environ.get('SLOW_QUERY_MS') or 100)
+    SLOW_REQUEST_MS = int(os.environ.get('SLOW_REQUEST_MS') or 1000)
+    PROFILING_ROUTE_WINDOW = int(os.environ.get('PROFILING_ROUTE_WINDOW') or 1000)
+
+    # Bearer token required by /metrics; unset, only loopback clients may scrape (see utils/metrics.py)
+    METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+
     PERMANENT_SESSION_LIFETIME = timedelta(hours=24)
     
     # Email configuration for OTP
@@ -0,0 +1,41 @@
+"""
+Gunicorn configuration for the Oncobloom application.
+
+    gunicorn -c gunicorn.conf.py wsgi:application
+
+Workers are gevent-based. Prometheus metrics are aggregated across workers
+through ``PROMETHEUS_MULTIPROC_DIR`` (see utils/metrics.py): it is set here,
+before any worker starts, to a directory that is emptied on every start, and
+the ``child_exit`` hook drops a dead worker's live gauges.
+"""
+import glob
+import multiprocessing
+import os
+import tempfile
+
+bind = os.environ.get('GUNICORN_BIND') or f"0.0.0.0:{os.environ.get('PORT') or 5000}"
+workers = int(os.environ.get('WEB_CONCURRENCY') or multiprocessing.cpu_count() * 2 + 1)
+worker_class = 'gevent'
+worker_connections = 1000
+timeout = 30
+keepalive = 2
+max_requests = 1000
+max_requests_jitter = 50
+
+# Workers inherit the environment, so every one writes to the same directory
+os.environ.setdefault('PROMETHEUS_MULTIPROC_DIR',
+                      os.path.join(tempfile.gettempdir(), 'oncobloom_prometheus'))
+
+
+def on_starting(server):
+    """Start from an empty metrics directory; old files would be summed in"""
+    metrics_dir = os.environ['PROMETHEUS_MULTIPROC_DIR']
+    os.makedirs(metrics_dir, exist_ok=True)
+    for path in glob.glob(os.path.join(metrics_dir, '*.db')):
+        os.remove(path)
+
+
+def child_exit(server, worker):
+    """Drop the exited worker's live gauges from the aggregated metrics"""
+    from utils.metrics import mark_worker_dead
+    mark_worker_dead(worker.pid)
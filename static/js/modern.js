@@ -199,6 +199,12 @@ function initEnhancedSearch(searchInput, options = {}) {
     let searchTimeout;
     let clearBtn;
     
+    // Both initializers below may reach the same input; wire it only once
+    if (searchInput.dataset.enhancedSearch) {
+        return;
+    }
+    searchInput.dataset.enhancedSearch = 'true';
+    
     // Add clear button if enabled
     if (clearButton) {
         addClearButton(searchInput);
@@ -226,6 +232,11 @@ function initEnhancedSearch(searchInput, options = {}) {
     // Handle Enter key
     searchInput.addEventListener('keypress', function(e) {
         if (e.key === 'Enter') {
+            // Inside a filter form, Enter runs the full search
+            if (this.form) {
+                cancelSuggestions(searchInput);
+                return;
+            }
             e.preventDefault();
             const query = this.value.trim();
             if (query.length >= minLength) {
@@ -275,25 +286,97 @@ function showSearchLoading(searchInput, show) {
     }
 }
 
+// Patient typeahead backed by /api/patients/suggest
+const suggestionCache = new Map();
+const SUGGESTION_CACHE_SIZE = 100;
+
+function cancelSuggestions(searchInput) {
+    if (searchInput._suggestController) {
+        searchInput._suggestController.abort();
+        searchInput._suggestController = null;
+    }
+}
+
+function fetchSuggestions(query, searchInput) {
+    const baseUrl = searchInput.dataset.suggestUrl || '/api/patients/suggest';
+    const key = query.toLowerCase();
+    
+    if (suggestionCache.has(key)) {
+        return Promise.resolve(suggestionCache.get(key));
+    }
+    
+    // Only the latest keystroke matters; drop any request still in flight
+    cancelSuggestions(searchInput);
+    const controller = new AbortController();
+    searchInput._suggestController = controller;
+    
+    return fetch(`${baseUrl}?q=${encodeURIComponent(query)}`, {
+        signal: controller.signal,
+        headers: { 'Accept': 'application/json' },
+        credentials: 'same-origin'
+    })
+        .then(response => {
+            if (!response.ok) {
+                throw new Error(`Search failed (${response.status})`);
+            }
+            return response.json();
+        })
+        .then(data => {
+            if (searchInput._suggestController === controller) {
+                searchInput._suggestController = null;
+            }
+            suggestionCache.set(key, data.results);
+            if (suggestionCache.size > SUGGESTION_CACHE_SIZE) {
+                suggestionCache.delete(suggestionCache.keys().next().value);
+            }
+            return data.results;
+        });
+}
+
+function escapeHtml(value) {
+    const div = document.createElement('div');
+    div.textContent = value == null ? '' : String(value);
+    return div.innerHTML;
+}
+
+function toSearchResults(patients) {
+    // showSearchResults renders via innerHTML, so escape server data first
+    return patients.map(patient => ({
+        text: escapeHtml(patient.name),
+        subtext: escapeHtml([patient.patient_id, patient.stage, patient.status].filter(Boolean).join(' · ')),
+        icon: 'user',
+        onClick: () => {
+            window.location.href = patient.url;
+        }
+    }));
+}
+
 function performSearch(query, searchInput) {
-    // Show loading state
     showSearchLoading(searchInput, true);
     
-    // Simulate search API call
-    setTimeout(() => {
-        showSearchLoading(searchInput, false);
-        // Here you would typically make an API call
-        console.log('Searching for:', query);
-        
-        // Show success feedback
-        searchInput.classList.add('valid');
-        setTimeout(() => {
-            searchInput.classList.remove('valid');
-        }, 1000);
-    }, 500);
+    fetchSuggestions(query, searchInput)
+        .then(patients => {
+            // Ignore answers for a query the user has already typed past
+            if (searchInput.value.trim() !== query) {
+                return;
+            }
+            showSearchResults(toSearchResults(patients), searchInput);
+            trackSearch(query, patients.length, 'typeahead');
+        })
+        .catch(error => {
+            if (error.name !== 'AbortError') {
+                searchInput.classList.add('invalid');
+                console.error('Search error:', error);
+            }
+        })
+        .finally(() => {
+            showSearchLoading(searchInput, false);
+        });
 }
 
 function clearSearchResults(searchInput) {
+    cancelSuggestions(searchInput);
+    
     // Clear any search results
     const results = searchInput.parentNode.querySelector('.search-results');
     if (results) {
@@ -469,17 +552,40 @@ function trackSearch(query, resultsCount, context = 'general') {
 }
 
 // Auto-complete functionality
+// Without a static suggestions list, matches come from the suggest endpoint
 function initAutoComplete(searchInput, suggestions = []) {
     let currentFocus = -1;
+    const remote = suggestions.length === 0;
+    
+    const fetchRemote = debounce(query => {
+        fetchSuggestions(query, searchInput)
+            .then(patients => {
+                if (searchInput.value.trim().toLowerCase() === query) {
+                    showSearchResults(toSearchResults(patients), searchInput);
+                }
+            })
+            .catch(error => {
+                if (error.name !== 'AbortError') {
+                    console.error('Autocomplete error:', error);
+                }
+            });
+    }, 250);
     
     searchInput.addEventListener('input', function(e) {
-        const query = e.target.value.toLowerCase();
+        const query = e.target.value.trim().toLowerCase();
+        currentFocus = -1;
         
         if (query.length < 2) {
+            cancelSuggestions(searchInput);
             hideAutoComplete(searchInput);
             return;
         }
         
+        if (remote) {
+            fetchRemote(query);
+            return;
+        }
+        
         const filteredSuggestions = suggestions.filter(s => 
             s.toLowerCase().includes(query)
         );
@@ -0,0 +1,111 @@
+"""
+Shared fixtures: a freshly migrated SQLite database per test, helpers to
+fill it, and a logged-in client for the Flask app.
+"""
+import os
+import sys
+import tempfile
+
+# app_new opens (and creates) its database when imported, configures the pool
+# from its own config and would start the job sweeper; point it at a throwaway
+# directory and import it once here, before any test configures its database
+_APP_DIR = tempfile.mkdtemp(prefix='oncobloom_tests_')
+os.environ['DATABASE'] = os.path.join(_APP_DIR, 'app.db')
+os.environ['JOB_SWEEP_INTERVAL'] = '0'
+os.environ.setdefault('SECRET_KEY', 'tests')
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+import app_new
+from utils import db
+from utils.ids import reserve_patient_ids
+from utils.schema import ensure_schema
+
+PATIENT_DEFAULTS = {
+    'full_name': 'Test Patient',
+    'age': 50,
+    'gender': 'Female',
+    'cancer_type': 'Lung Cancer',
+    'cancer_stage': 'Stage II',
+    'current_status': 'Active Treatment',
+    'diagnosis_date': '2025-01-15',
+}
+
+
+@pytest.fixture
+def database(tmp_path):
+    """Path of an empty database at the current schema version, served by the pool"""
+    path = str(tmp_path / 'oncobloom.db')
+    db.configure(database=path)
+    conn = db.get_pool().acquire()
+    ensure_schema(conn)
+    conn.close()
+    yield path
+    # Drop this database's pooled connections
+    db.configure()
+
+
+@pytest.fixture
+def conn(database):
+    """A pooled connection to the test database"""
+    conn = db.get_pool().acquire()
+    yield conn
+    conn.close()
+
+
+def create_user(conn, username='clerk', is_admin=False):
+    """Insert a user; returns its id"""
+    cursor = conn.execute('INSERT INTO users (username, full_name, password_hash, is_admin) VALUES (?, ?, ?, ?)',
+                          (username, username.title(), 'x', is_admin))
+    conn.commit()
+    return cursor.lastrowid
+
+
+def add_patients(conn, count=1, created_by=None, **fields):
+    """Insert ``count`` patients (PATIENT_DEFAULTS overridden by ``fields``); returns their row ids"""
+    values = dict(PATIENT_DEFAULTS, **fields)
+    columns = ['patient_id'] + list(values) + ['created_by']
+    sql = f"INSERT INTO patients ({', '.join(columns)}) VALUES ({', '.join(['?'] * len(columns))})"
+    ids = []
+    for patient_id in reserve_patient_ids(conn, count):
+        ids.append(conn.execute(sql, [patient_id] + list(values.values()) + [created_by]).lastrowid)
+    conn.commit()
+    return ids
+
+
+@pytest.fixture
+def app(database):
+    app_new.app.config['TESTING'] = True
+    return app_new.app
+
+
+@pytest.fixture
+def client(app, conn):
+    """Test client logged in as an admin user"""
+    user_id = create_user(conn, 'admin_user', is_admin=True)
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['user_id'] = user_id
+        session['username'] = 'admin_user'
+        session['is_admin'] = True
+    return client
+
+
+@pytest.fixture
+def statements(conn, monkeypatch):
+    """Every SQL statement run on ``conn`` and on pooled connections opened from now on"""
+    seen = []
+    conn.set_trace_callback(seen.append)
+    connect = db.ConnectionPool._connect
+
+    def traced_connect(self, factory=db.PooledConnection):
+        conn = connect(self, factory)
+        conn.set_trace_callback(seen.append)
+        return conn
+
+    monkeypatch.setattr(db.ConnectionPool, '_connect', traced_connect)
+    # Reopen the pool so every connection it hands out is traced
+    db.configure()
+    return seen
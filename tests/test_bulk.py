@@ -0,0 +1,51 @@
+"""
+Bulk operations: the dry run, chunked apply and selection rules.
+"""
+import pytest
+
+from conftest import add_patients
+from utils.bulk import BulkOperationError, apply_bulk_operation, preview_bulk_operation
+from utils.stats import check_patient_stats
+
+
+def _count(conn, where='1', params=()):
+    return conn.execute(f'SELECT COUNT(*) FROM patients WHERE {where}', params).fetchone()[0]
+
+
+def test_preview_matches_apply(conn):
+    ids = add_patients(conn, 4, doctor_name='Dr. Smith', current_status='Critical')
+    add_patients(conn, 2, doctor_name='Dr. Smith', current_status='Remission')
+    add_patients(conn, 3, doctor_name='Dr. Jones', current_status='Critical')
+    filters = {'doctor_name': 'Dr. Smith'}
+
+    preview = preview_bulk_operation(conn, 'update_status', 'Remission', filters=filters)
+    assert (preview.matched, preview.affected) == (6, 4)
+    assert preview.by_value == [('Critical', 4), ('Remission', 2)]
+    assert _count(conn, "current_status = 'Remission'") == 2
+
+    progress = []
+    result = apply_bulk_operation(conn, 'update_status', 'Remission', filters=filters, chunk_size=4,
+                                  progress=lambda done, total: progress.append((done, total)))
+    assert (result.matched, result.affected) == (6, 4)
+    assert progress == [(4, 6), (6, 6)]
+    assert _count(conn, "current_status = 'Remission'") == 6
+    assert _count(conn, "current_status = 'Critical' AND doctor_name = 'Dr. Jones'") == 3
+
+    # Explicit ids win over filters; ids that no longer exist are dropped
+    result = apply_bulk_operation(conn, 'delete', ids=ids[:2] + [10 ** 6], filters=filters, chunk_size=1)
+    assert (result.matched, result.affected) == (2, 2)
+    assert _count(conn) == 7
+    assert check_patient_stats(conn) == []
+
+
+@pytest.mark.parametrize('operation, value, filters', [
+    ('archive', None, {'doctor_name': 'Dr. Smith'}),
+    ('assign_doctor', '', {'doctor_name': 'Dr. Smith'}),
+    ('delete', None, {}),
+    ('delete', None, {'unknown': 'x'}),
+])
+def test_rejected_operations(conn, operation, value, filters):
+    add_patients(conn, 2, doctor_name='Dr. Smith')
+    with pytest.raises(BulkOperationError):
+        apply_bulk_operation(conn, operation, value, filters=filters)
+    assert _count(conn) == 2
@@ -0,0 +1,73 @@
+"""
+Patient ID allocation: consecutive, never duplicated, never reused.
+"""
+import threading
+
+from conftest import PATIENT_DEFAULTS, add_patients
+from utils import db
+from utils.ids import format_patient_id, reserve_patient_ids
+
+WRITERS = 6
+BATCHES = 20
+
+
+def _insert(conn, patient_ids):
+    conn.executemany(
+        'INSERT INTO patients (patient_id, full_name, age, gender, cancer_type, cancer_stage, current_status) '
+        'VALUES (?, ?, ?, ?, ?, ?, ?)',
+        [(patient_id, PATIENT_DEFAULTS['full_name'], PATIENT_DEFAULTS['age'], PATIENT_DEFAULTS['gender'],
+          PATIENT_DEFAULTS['cancer_type'], PATIENT_DEFAULTS['cancer_stage'], PATIENT_DEFAULTS['current_status'])
+         for patient_id in patient_ids]
+    )
+
+
+def test_concurrent_writers(conn):
+    errors = []
+    start = threading.Barrier(WRITERS)
+
+    def writer(number):
+        writer_conn = db.get_pool().acquire()
+        try:
+            start.wait()
+            for batch in range(BATCHES):
+                patient_ids = reserve_patient_ids(writer_conn, 1 + (number + batch) % 3, year=2030)
+                _insert(writer_conn, patient_ids)
+                # A rolled-back reservation is handed out again, not skipped
+                if batch % 5 == 4:
+                    writer_conn.rollback()
+                else:
+                    writer_conn.commit()
+        except Exception as error:
+            errors.append(error)
+            writer_conn.rollback()
+        finally:
+            writer_conn.close()
+
+    threads = [threading.Thread(target=writer, args=(number,)) for number in range(WRITERS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    patient_ids = [row[0] for row in conn.execute(
+        "SELECT patient_id FROM patients WHERE patient_id LIKE 'ONC-2030-%' ORDER BY patient_id")]
+    assert patient_ids == [format_patient_id(2030, sequence) for sequence in range(1, len(patient_ids) + 1)]
+    assert conn.execute('SELECT last_value FROM patient_id_sequences WHERE year = 2030').fetchone()[0] == len(patient_ids)
+
+
+def test_ids_are_not_reused_after_delete(conn):
+    add_patients(conn, 3)
+    conn.execute('DELETE FROM patients WHERE id = (SELECT MAX(id) FROM patients)')
+    conn.commit()
+    year, last_value = conn.execute('SELECT year, last_value FROM patient_id_sequences').fetchone()
+    assert last_value == 3
+    assert reserve_patient_ids(conn, 2, year=year) == [format_patient_id(year, 4), format_patient_id(year, 5)]
+    conn.rollback()
+
+
+def test_new_year_seeds_from_existing_ids(conn):
+    _insert(conn, [format_patient_id(2031, 41)])
+    conn.commit()
+    assert reserve_patient_ids(conn, 1, year=2031) == [format_patient_id(2031, 42)]
+    conn.rollback()
@@ -0,0 +1,96 @@
+"""
+Bulk import: per-row error reporting and the set-based catch-up of the
+derived tables whose INSERT triggers are suspended during the load.
+"""
+import io
+
+import pytest
+
+from conftest import add_patients
+from utils.importer import ImportFormatError, import_patients, iter_csv_records
+from utils.schema import deferred_insert_triggers
+from utils.search import search_patients
+from utils.stats import check_patient_stats, get_data_version
+from utils.workload import check_appointment_stats
+
+HEADER = 'Name,Age,Gender,Cancer Type,Stage,Status,Diagnosis Date,Doctor,Hospital,Next Appointment\n'
+
+
+def _csv(*rows):
+    return iter_csv_records(io.StringIO(HEADER + ''.join(row + '\n' for row in rows)))
+
+
+def _triggers(conn):
+    return conn.execute("SELECT name, sql FROM sqlite_master WHERE type = 'trigger' ORDER BY name").fetchall()
+
+
+def test_rejected_rows_are_reported_by_line(conn):
+    records = _csv(
+        'Ada Quill,61,Female,Lung Cancer,Stage II,Active Treatment,2025-02-01,Dr. Smith,City Hospital,2026-01-05',
+        ',40,Male,Colon Cancer,Stage I,Remission,2025-02-01,,,',
+        'Bo Quill,abc,Male,Colon Cancer,Stage I,Remission,2025-02-01,,,',
+        '',
+        'Cy Quill,200,Male,Colon Cancer,Stage I,Remission,2025-02-01,,,',
+        'Di Quill,30,Female,Breast Cancer,,Remission,2999-01-01,,,',
+        'Ed Quill,45,Male,Colon Cancer,Stage I,Remission,2025-03-01,Dr. Jones,City Hospital,2026-01-06',
+    )
+    result = import_patients(conn, records, batch_size=2)
+
+    assert (result.inserted, result.rejected) == (2, 4)
+    assert result.errors == [
+        (3, 'Required fields missing: Full Name'),
+        (4, 'Age must be a valid number'),
+        (6, 'Please enter a valid age (1-150)'),
+        (7, 'Required fields missing: Cancer Stage'),
+    ]
+    names = [row[0] for row in conn.execute('SELECT full_name FROM patients WHERE full_name LIKE ? ORDER BY id',
+                                            ('% Quill',))]
+    assert names == ['Ada Quill', 'Ed Quill']
+
+
+def test_missing_required_column():
+    records = iter_csv_records(io.StringIO('Name,Age\nAda,40\n'))
+    with pytest.raises(ImportFormatError):
+        import_patients(None, records)
+
+
+def test_trigger_catch_up(conn):
+    add_patients(conn, 2, doctor_name='Dr. Smith', hospital_name='City Hospital', next_appointment='2026-01-05')
+    triggers = _triggers(conn)
+    inserts, changes = get_data_version(conn)
+
+    rows = [f'Zed Patient{number},{30 + number},Male,Lung Cancer,Stage {"I" * (1 + number % 3)},Remission,'
+            f'2025-01-0{1 + number % 9},Dr. {"Smith" if number % 2 else "Jones"},City Hospital,2026-01-0{5 + number % 3}'
+            for number in range(7)]
+    result = import_patients(conn, _csv(*rows), batch_size=3)
+
+    assert result.inserted == 7
+    assert _triggers(conn) == triggers
+    assert check_patient_stats(conn) == []
+    assert check_appointment_stats(conn) == []
+    assert get_data_version(conn) == (inserts + 7, changes)
+    assert len(search_patients(conn, 'Zed')) == 7
+    assert len(search_patients(conn, 'atient5')) == 1
+
+    # The restored triggers keep maintaining the tables for ordinary writes
+    add_patients(conn, 1, full_name='Zed Later', next_appointment='2026-01-05')
+    assert check_patient_stats(conn) == []
+    assert check_appointment_stats(conn) == []
+    assert len(search_patients(conn, 'Zed')) == 8
+
+
+def test_rollback_restores_triggers(conn):
+    triggers = _triggers(conn)
+    conn.execute('BEGIN IMMEDIATE')
+    with pytest.raises(RuntimeError):
+        with deferred_insert_triggers(conn):
+            conn.execute("INSERT INTO patients (patient_id, full_name, age, gender, cancer_type, cancer_stage, "
+                         "current_status) VALUES ('ONC-2030-0001', 'Lost', 40, 'Male', 'Lung Cancer', 'Stage I', "
+                         "'Remission')")
+            raise RuntimeError('load failed')
+    conn.rollback()
+
+    assert _triggers(conn) == triggers
+    add_patients(conn, 2)
+    assert check_patient_stats(conn) == []
+    assert get_data_version(conn)[0] == 2
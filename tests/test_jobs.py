@@ -0,0 +1,55 @@
+"""
+Background jobs: expiry of finished artifacts.
+"""
+import time
+
+from utils import jobs
+
+
+def _wait_for(conn, job_id, status, timeout=5):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = jobs.get_job(conn, job_id)
+        if job['status'] == status:
+            return job
+        conn.commit()
+        time.sleep(0.01)
+    raise AssertionError(f'job {job_id} never reached {status}')
+
+
+def _export(context, path):
+    with open(path, 'w') as f:
+        f.write('report')
+    return {'path': path, 'name': 'report.pdf'}
+
+
+def _broken_export(context):
+    raise RuntimeError('renderer crashed')
+
+
+def test_expired_artifacts_are_purged(conn, tmp_path, monkeypatch):
+    # Jobs finish already past their TTL
+    monkeypatch.setitem(jobs._settings, 'ttl', -1)
+    path = str(tmp_path / 'report.pdf')
+    done_id = jobs.submit_job(conn, 'export_pdf', _export, path)
+    failed_id = jobs.submit_job(conn, 'export_pdf', _broken_export)
+    _wait_for(conn, done_id, jobs.STATUS_DONE)
+    _wait_for(conn, failed_id, jobs.STATUS_FAILED)
+
+    assert jobs.purge_expired_jobs(conn) == 1
+    done = jobs.get_job(conn, done_id)
+    assert done['status'] == jobs.STATUS_EXPIRED and done['result_path'] is None
+    assert not (tmp_path / 'report.pdf').exists()
+
+
+def test_failed_job_stays_failed_after_its_ttl(conn, monkeypatch):
+    monkeypatch.setitem(jobs._settings, 'ttl', -1)
+    job_id = jobs.submit_job(conn, 'export_pdf', _broken_export)
+    _wait_for(conn, job_id, jobs.STATUS_FAILED)
+
+    jobs.purge_expired_jobs(conn)
+    job = jobs.get_job(conn, job_id)
+    assert job['status'] == jobs.STATUS_FAILED
+    assert jobs.job_to_dict(job)['status'] == jobs.STATUS_FAILED
+    assert jobs.job_to_dict(job)['error'] == 'renderer crashed'
+    assert [row['status'] for row in jobs.recent_jobs(conn, ['export_pdf'])] == [jobs.STATUS_FAILED]
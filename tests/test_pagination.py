@@ -0,0 +1,76 @@
+"""
+Keyset pagination of /records: cursor tokens and paging over tied created_at.
+"""
+import re
+
+import pytest
+
+from conftest import add_patients
+from utils.helpers import decode_cursor, encode_cursor
+
+PATIENT_ID = re.compile(r'ONC-\d{4}-\d{4}')
+NEXT = re.compile(r'after=([A-Za-z0-9_-]+)')
+PREVIOUS = re.compile(r'before=([A-Za-z0-9_-]+)')
+
+
+@pytest.mark.parametrize('created_at, row_id', [
+    ('2026-01-01 09:30:00', 1),
+    ('2026-01-01 09:30:00.123456', 987654321),
+    ('odd|value with ünicode', 7),
+])
+def test_cursor_round_trip(created_at, row_id):
+    token = encode_cursor(created_at, row_id)
+    assert re.fullmatch(r'[A-Za-z0-9_-]+', token)
+    assert decode_cursor(token) == (created_at, row_id)
+
+
+@pytest.mark.parametrize('token', ['', None, '!!!', encode_cursor('2026-01-01', 'x'), 'bm8tc2VwYXJhdG9y'])
+def test_malformed_cursor(token):
+    assert decode_cursor(token) is None
+
+
+def _page(client, url):
+    html = client.get(url).get_data(as_text=True)
+    next_cursor = NEXT.search(html)
+    previous_cursor = PREVIOUS.search(html)
+    return (PATIENT_ID.findall(html),
+            next_cursor.group(1) if next_cursor else None,
+            previous_cursor.group(1) if previous_cursor else None)
+
+
+def test_paging_over_tied_created_at(client, conn):
+    # Seven patients share one timestamp, so only the id orders them
+    add_patients(conn, 2, created_at='2026-01-02 08:00:00')
+    add_patients(conn, 7, created_at='2026-01-01 08:00:00')
+    add_patients(conn, 2, created_at='2025-12-31 08:00:00')
+    expected = [row[0] for row in conn.execute('SELECT patient_id FROM patients ORDER BY created_at DESC, id DESC')]
+
+    pages = []
+    ids, next_cursor, previous_cursor = _page(client, '/records?per_page=3')
+    assert previous_cursor is None
+    pages.append(ids)
+    while next_cursor:
+        ids, next_cursor, previous_cursor = _page(client, f'/records?per_page=3&after={next_cursor}')
+        assert previous_cursor is not None
+        pages.append(ids)
+
+    assert [len(page) for page in pages] == [3, 3, 3, 2]
+    assert sum(pages, []) == expected
+
+    # Walking back from the last page gives the same pages in reverse
+    backwards = [pages[-1]]
+    while previous_cursor:
+        ids, _, previous_cursor = _page(client, f'/records?per_page=3&before={previous_cursor}')
+        backwards.append(ids)
+    assert backwards[::-1] == pages
+
+
+def test_paging_with_filter(client, conn):
+    add_patients(conn, 4, current_status='Critical', created_at='2026-01-01 08:00:00')
+    add_patients(conn, 4, current_status='Remission', created_at='2026-01-01 08:00:00')
+
+    ids, next_cursor, _ = _page(client, '/records?per_page=3&status=Critical')
+    more, last_cursor, _ = _page(client, f'/records?per_page=3&status=Critical&after={next_cursor}')
+    assert len(ids) == 3 and len(more) == 1 and last_cursor is None
+    critical = {row[0] for row in conn.execute("SELECT patient_id FROM patients WHERE current_status = 'Critical'")}
+    assert set(ids + more) == critical
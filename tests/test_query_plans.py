@@ -0,0 +1,127 @@
+"""
+EXPLAIN QUERY PLAN regression tests for the SQL the routes really run.
+
+Each test drives a route or query builder against a freshly migrated
+database, records the statements it issues through SQLite's trace callback,
+and asks SQLite how it would run every one of them that reads ``patients``:
+no full scan of the table and no temporary sort B-tree.
+"""
+import re
+
+import pytest
+
+from conftest import add_patients, create_user
+from utils.bulk import apply_bulk_operation, preview_bulk_operation, remove_user
+from utils.helpers import encode_cursor
+from utils.query_plans import FULL_SCAN, TEMP_BTREE, explain
+from utils.users import list_users
+
+PATIENTS = re.compile(r'\bpatients\b')
+CURSOR = encode_cursor('2026-01-01 00:00:00', 5)
+
+
+def plan_problems(conn, statements, sorts=True):
+    """(statement, plan detail) for every patients query with a bad plan"""
+    problems = []
+    # Copied first: explaining on a traced connection records more statements
+    for sql in list(statements):
+        sql = sql.strip()
+        # Trigger bodies are traced as '-- TRIGGER name' comments
+        if not sql.upper().startswith(('SELECT', 'UPDATE', 'DELETE', 'INSERT')) or not PATIENTS.search(sql):
+            continue
+        for detail in explain(conn, sql):
+            if FULL_SCAN.match(detail) or (sorts and TEMP_BTREE in detail):
+                problems.append((' '.join(sql.split()), detail))
+    return problems
+
+
+@pytest.mark.parametrize('query', [
+    '',
+    'status=Critical',
+    f'cancer_type=Lung+Cancer&after={CURSOR}',
+    f'cancer_stage=Stage+IV&before={CURSOR}',
+    'status=Critical&cancer_type=Lung+Cancer&count=1',
+    'status=Critical&cancer_type=Lung+Cancer&cancer_stage=Stage+IV&count=1',
+])
+def test_records_listing(client, conn, statements, query):
+    add_patients(conn, 3)
+    statements.clear()
+    assert client.get(f'/records?{query}').status_code == 200
+    assert statements
+    assert plan_problems(conn, statements) == []
+
+
+def test_records_search_uses_index(client, conn, statements):
+    add_patients(conn, 3, full_name='Jane Smith')
+    statements.clear()
+    assert client.get('/records?search=smit').status_code == 200
+    # Matches come from the FTS index and are then sorted, which is expected
+    assert plan_problems(conn, statements, sorts=False) == []
+
+
+@pytest.mark.parametrize('query', [
+    '',
+    'hospital=City+Hospital',
+    'group=doctor&day=2026-01-05',
+    'group=doctor&hospital=City+Hospital&day=2026-01-05',
+])
+def test_workload(client, conn, statements, query):
+    add_patients(conn, 3, hospital_name='City Hospital', chemo_cycles_planned=6, chemo_cycles_completed=1,
+                 radiation_sessions_planned=20, radiation_sessions_completed=2, next_appointment='2026-01-05')
+    statements.clear()
+    assert client.get(f'/workload?{query}').status_code == 200
+    assert any('chemo_cycles_planned' in sql for sql in statements)
+    assert plan_problems(conn, statements) == []
+
+
+@pytest.mark.parametrize('query', [
+    '',
+    'current_status=Critical',
+    f'doctor_name=Dr.+Smith&after={CURSOR}',
+    'cancer_type=Lung+Cancer&hospital_name=City+Hospital',
+])
+def test_bulk_listing(client, conn, statements, query):
+    add_patients(conn, 3, doctor_name='Dr. Smith')
+    statements.clear()
+    assert client.get(f'/admin/enhanced/bulk_operations?{query}').status_code == 200
+    assert plan_problems(conn, statements) == []
+
+
+@pytest.mark.parametrize('operation, value', [
+    ('delete', None),
+    ('update_status', 'Remission'),
+    ('assign_doctor', 'Dr. Jones'),
+])
+def test_bulk_operations(conn, statements, operation, value):
+    add_patients(conn, 5, doctor_name='Dr. Smith')
+    filters = {'doctor_name': 'Dr. Smith'}
+    statements.clear()
+    preview_bulk_operation(conn, operation, value, filters=filters)
+    # The dry run groups the staged rows by their current value, which needs a sort
+    assert plan_problems(conn, statements, sorts=False) == []
+    statements.clear()
+    apply_bulk_operation(conn, operation, value, filters=filters, chunk_size=2)
+    assert plan_problems(conn, statements) == []
+
+
+@pytest.mark.parametrize('reassign', [False, True])
+def test_remove_user(conn, statements, reassign):
+    user_id = create_user(conn, 'leaving')
+    other_id = create_user(conn, 'staying')
+    add_patients(conn, 5, created_by=user_id)
+    statements.clear()
+    remove_user(conn, user_id, other_id if reassign else None, chunk_size=2, pause=0)
+    assert plan_problems(conn, statements) == []
+
+
+@pytest.mark.parametrize('search', ['', 'clerk'])
+def test_user_listing(conn, statements, search):
+    for number in range(3):
+        add_patients(conn, 2, created_by=create_user(conn, f'clerk{number}'))
+    statements.clear()
+    list_users(conn, search=search)
+    listing = [sql for sql in statements if 'FROM users u' in sql and not sql.startswith('EXPLAIN')]
+    assert listing
+    for sql in listing:
+        plan = explain(conn, sql)
+        assert not any(TEMP_BTREE in detail or FULL_SCAN.match(detail) for detail in plan), plan
@@ -0,0 +1,70 @@
+"""
+Removing a user: their patients are deleted or reassigned a chunk at a time.
+"""
+from conftest import add_patients, create_user
+from utils.bulk import remove_user
+from utils.stats import check_patient_stats
+
+
+def _count(conn, where='1', params=()):
+    return conn.execute(f'SELECT COUNT(*) FROM patients WHERE {where}', params).fetchone()[0]
+
+
+def _user_exists(conn, user_id):
+    return conn.execute('SELECT 1 FROM users WHERE id = ?', (user_id,)).fetchone() is not None
+
+
+def test_remove_user_deletes_patients_in_chunks(conn):
+    leaving = create_user(conn, 'leaving')
+    staying = create_user(conn, 'staying')
+    add_patients(conn, 5, created_by=leaving)
+    add_patients(conn, 2, created_by=staying)
+
+    progress = []
+    assert remove_user(conn, leaving, chunk_size=2, progress=progress.append, pause=0) == 5
+    assert progress == [2, 4, 5]
+    assert not _user_exists(conn, leaving)
+    assert _count(conn) == _count(conn, 'created_by = ?', (staying,)) == 2
+    assert check_patient_stats(conn) == []
+
+
+def test_remove_user_reassigns_patients(conn):
+    leaving = create_user(conn, 'leaving')
+    staying = create_user(conn, 'staying')
+    add_patients(conn, 5, created_by=leaving)
+
+    assert remove_user(conn, leaving, staying, chunk_size=2, pause=0) == 5
+    assert not _user_exists(conn, leaving)
+    assert _count(conn, 'created_by = ?', (staying,)) == 5
+    assert check_patient_stats(conn) == []
+
+
+def test_remove_user_catches_patients_added_meanwhile(conn):
+    leaving = create_user(conn, 'leaving')
+    add_patients(conn, 3, created_by=leaving)
+
+    def add_one_more(done):
+        if done == 2:
+            add_patients(conn, 1, created_by=leaving)
+
+    assert remove_user(conn, leaving, chunk_size=2, progress=add_one_more, pause=0) == 4
+    assert not _user_exists(conn, leaving)
+    assert _count(conn) == 0
+
+
+def test_remove_user_with_legacy_patients(conn):
+    # Left behind by the pre-registry schema; still references users(id)
+    conn.execute('''
+        CREATE TABLE patients_old (
+            id INTEGER PRIMARY KEY,
+            user_id INTEGER NOT NULL REFERENCES users(id),
+            name TEXT NOT NULL
+        )
+    ''')
+    leaving = create_user(conn, 'leaving')
+    conn.execute('INSERT INTO patients_old (user_id, name) VALUES (?, ?)', (leaving, 'Old Record'))
+    conn.commit()
+    add_patients(conn, 3, created_by=leaving)
+
+    assert remove_user(conn, leaving, chunk_size=2, pause=0) == 3
+    assert not _user_exists(conn, leaving)
@@ -0,0 +1,60 @@
+"""
+The trigger-maintained patient_stats table against a fresh scan, and the
+dashboard snapshot cached on the shared data version.
+"""
+import sqlite3
+
+from conftest import add_patients, create_user
+from utils.cache import invalidate_patient_caches
+from utils.stats import (check_patient_stats, get_dashboard_stats, get_data_version, get_total_patients,
+                         rebuild_patient_stats)
+
+
+def test_consistent_after_insert_update_and_delete(conn):
+    clerk = create_user(conn, 'clerk')
+    add_patients(conn, 3, created_by=clerk, age=17, current_status='Critical', diagnosis_date='2024-12-31')
+    add_patients(conn, 2, age=70, cancer_stage='Stage IV', gender='Male')
+    add_patients(conn, 1, diagnosis_date=None, cancer_type='Rare Cancer')
+    assert check_patient_stats(conn) == []
+    assert get_total_patients(conn) == 6
+
+    conn.execute("UPDATE patients SET current_status = 'Remission', age = age + 30 WHERE created_by = ?", (clerk,))
+    conn.execute("UPDATE patients SET created_by = ?, diagnosis_date = '2025-01-01' WHERE cancer_type = 'Rare Cancer'",
+                 (clerk,))
+    conn.execute("UPDATE patients SET cancer_stage = 'Stage III', doctor_name = 'Dr. Jones' WHERE gender = 'Male'")
+    conn.commit()
+    assert check_patient_stats(conn) == []
+
+    conn.execute('DELETE FROM patients WHERE id IN (SELECT id FROM patients ORDER BY id LIMIT 2)')
+    conn.execute("DELETE FROM patients WHERE gender = 'Male'")
+    conn.commit()
+    assert check_patient_stats(conn) == []
+    assert get_total_patients(conn) == conn.execute('SELECT COUNT(*) FROM patients').fetchone()[0] == 2
+
+
+def test_mismatches_are_reported_and_rebuilt(conn):
+    add_patients(conn, 2, current_status='Critical')
+    conn.execute("UPDATE patient_stats SET count = count + 1 WHERE dimension = 'status' AND value = 'Critical'")
+    conn.commit()
+    assert check_patient_stats(conn) == [('status', 'Critical', 3, 2)]
+
+    rebuild_patient_stats(conn)
+    assert check_patient_stats(conn) == []
+
+
+def test_dashboard_sees_writes_from_other_connections(conn, database):
+    invalidate_patient_caches()
+    add_patients(conn, 2)
+    snapshot, cache_hit = get_dashboard_stats(conn)
+    assert (snapshot['total_patients'], cache_hit) == (2, False)
+    assert get_dashboard_stats(conn)[1] is True
+
+    # A write from outside this process's pool, e.g. another worker
+    other = sqlite3.connect(database)
+    other.execute("UPDATE patients SET current_status = 'Recovered' WHERE id = (SELECT MIN(id) FROM patients)")
+    other.commit()
+    other.close()
+
+    snapshot, cache_hit = get_dashboard_stats(conn)
+    assert (snapshot['recovered_patients'], cache_hit) == (1, False)
+    assert get_data_version(conn) == (2, 1)
@@ -0,0 +1,73 @@
+"""
+The single-row and vectorized modes of the patient schema must agree.
+"""
+import pandas as pd
+import pytest
+
+from utils.validation import (PATIENT_COLUMNS, error_messages, frame_to_rows, rejected_rows,
+                              validate_patient, validate_patient_frame)
+
+VALID = {
+    'full_name': 'Ada Quill',
+    'age': '61',
+    'gender': 'Female',
+    'cancer_type': 'Lung Cancer',
+    'cancer_stage': 'Stage II',
+    'current_status': 'Active Treatment',
+    'diagnosis_date': '2025-02-01',
+    'height': '170',
+    'weight': '65.5',
+    'chemo_cycles_planned': '6',
+    'heart_rate': 'fast',
+}
+
+BAD_INPUTS = [
+    {'full_name': ''},
+    {'full_name': '   ', 'gender': '', 'age': ''},
+    {'age': 'abc'},
+    {'age': '6.5'},
+    {'age': '0'},
+    {'age': '151'},
+    {'age': '-3'},
+    {'diagnosis_date': '01/02/2025'},
+    {'diagnosis_date': '2025-02-30'},
+    {'diagnosis_date': '2999-01-01'},
+    {'diagnosis_date': '1800-01-01'},
+    {'age': 'abc', 'diagnosis_date': 'soon'},
+    {'cancer_stage': '', 'diagnosis_date': '2999-01-01'},
+]
+
+
+def _frame(rows):
+    return pd.DataFrame([dict(VALID, **row) for row in rows], columns=PATIENT_COLUMNS, dtype=object).fillna('')
+
+
+@pytest.mark.parametrize('changes', BAD_INPUTS)
+def test_same_message(changes):
+    values, message = validate_patient(dict(VALID, **changes))
+    assert values is None
+
+    _, masks = validate_patient_frame(_frame([changes]))
+    assert rejected_rows(masks, 1).tolist() == [True]
+    assert error_messages(masks, [0]) == [message]
+
+
+def test_same_messages_in_one_frame():
+    rows = [{}] + BAD_INPUTS + [{'age': '45'}]
+    _, masks = validate_patient_frame(_frame(rows))
+    rejected = rejected_rows(masks, len(rows))
+    positions = rejected.nonzero()[0]
+
+    expected = [validate_patient(dict(VALID, **row))[1] for row in rows]
+    assert [message is not None for message in expected] == rejected.tolist()
+    assert error_messages(masks, positions) == [message for message in expected if message]
+
+
+def test_same_values():
+    values, message = validate_patient(VALID)
+    assert message is None
+
+    clean, masks = validate_patient_frame(_frame([{}]))
+    assert not rejected_rows(masks, 1).any()
+    columns = PATIENT_COLUMNS + ['bmi']
+    assert dict(zip(columns, next(iter(frame_to_rows(clean, columns))))) == values
@@ -0,0 +1,70 @@
+"""
+Analytics page data served from the materialized patient counts.
+
+Every chart on the analytics page - status, type, gender and stage
+distributions, age buckets and the monthly diagnosis trend - is a dimension
+of the trigger-maintained ``patient_stats`` table (see utils/stats.py), so
+building the page reads a few hundred summary rows instead of scanning
+patients, and adding or editing a patient updates the counts in place.
+
+The snapshot is cached per process and carries a content hash used as the
+ETag, so unchanged pages are revalidated with a 304 and never rendered. The
+hash is the same in every gunicorn worker; no Last-Modified is sent, since a
+per-process timestamp would differ between workers and defeat revalidation.
+"""
+import hashlib
+import json
+from datetime import date
+
+from utils.cache import patient_cache
+from utils.stats import get_category_counts, get_data_version
+
+ANALYTICS_TTL = 30
+
+# Calendar months shown in the diagnosis trend, ending with the current one
+TREND_MONTHS = 12
+
+_analytics_cache = patient_cache(maxsize=1, ttl=ANALYTICS_TTL, name='analytics')
+
+
+def trend_start(today=None, months=TREND_MONTHS):
+    """First month ('YYYY-MM') of the trend window"""
+    today = today or date.today()
+    index = today.year * 12 + today.month - months
+    return f'{index // 12:04d}-{index % 12 + 1:02d}'
+
+
+def compute_analytics(conn):
+    """Every analytics chart from patient_stats"""
+    counts = get_category_counts(conn)
+    start = trend_start()
+    return {
+        'status_distribution': counts['status'],
+        'cancer_distribution': counts['type'],
+        'gender_distribution': counts['gender'],
+        'stage_distribution': counts['stage'],
+        'age_groups': counts['age_group'],
+        'monthly_trend': {month: count for month, count in counts['diagnosis_month'].items() if month >= start},
+    }
+
+
+def snapshot_etag(snapshot):
+    """Content hash of a snapshot, identical in every process"""
+    return hashlib.sha1(json.dumps(snapshot, sort_keys=True).encode()).hexdigest()[:20]
+
+
+def get_analytics(conn):
+    """Return (snapshot, etag, cache_hit) for the analytics page"""
+    key = get_data_version(conn)
+    cached = _analytics_cache.get(key)
+    if cached is not None:
+        return cached + (True,)
+    snapshot = compute_analytics(conn)
+    cached = (snapshot, snapshot_etag(snapshot))
+    _analytics_cache.set(key, cached)
+    return cached + (False,)
+
+
+def page_etag(data_etag, *parts):
+    """ETag of a rendered page: the data version plus whatever else the page shows (user, role)"""
+    return hashlib.sha1('|'.join([data_etag] + [str(part) for part in parts]).encode()).hexdigest()[:20]
@@ -0,0 +1,236 @@
+"""
+Set-based bulk operations on patients (admin bulk delete/status/doctor).
+
+A selection - explicit ids or a filter expression - is staged once into the
+connection's ``temp.bulk_selection`` table, so it never has to fit into one
+``IN (?, ?, ...)`` list. The operation is then applied to consecutive id
+ranges of the staged set, one short write transaction per chunk, so other
+writers get the lock between chunks and progress can be reported. A dry run
+stages the selection and only counts what would change.
+
+Removing a user works the same way: their patients are deleted (or handed to
+another user) a chunk at a time before the user row itself goes.
+"""
+import time
+from datetime import datetime
+
+from utils.search import search_condition
+
+DEFAULT_BULK_CHUNK_SIZE = 2000
+
+# Pause between user-removal chunks so request writers waiting on the lock get in
+BULK_PAUSE = 0.05
+
+# Filter field -> patients column (equality match)
+BULK_FILTER_COLUMNS = {
+    'current_status': 'current_status',
+    'cancer_type': 'cancer_type',
+    'cancer_stage': 'cancer_stage',
+    'doctor_name': 'doctor_name',
+    'hospital_name': 'hospital_name',
+}
+
+# Operation -> column it sets (None deletes the rows)
+BULK_OPERATIONS = {
+    'delete': None,
+    'update_status': 'current_status',
+    'assign_doctor': 'doctor_name',
+}
+
+
+class BulkOperationError(ValueError):
+    """Raised for an unknown operation, a missing value or an empty selection"""
+
+
+class BulkResult:
+    """Counts for one bulk operation (or its dry run)"""
+
+    def __init__(self, operation, dry_run=False):
+        self.operation = operation
+        self.dry_run = dry_run
+        self.matched = 0
+        self.affected = 0
+        self.by_value = []
+        self.seconds = 0.0
+
+    def summary(self):
+        if self.dry_run:
+            return f'{self.matched} patients selected, {self.affected} would change'
+        return f'{self.affected} of {self.matched} selected patients changed in {self.seconds:.2f}s'
+
+    def to_dict(self):
+        return {
+            'operation': self.operation,
+            'dry_run': self.dry_run,
+            'matched': self.matched,
+            'affected': self.affected,
+            'by_value': [{'value': value, 'count': count} for value, count in self.by_value],
+            'seconds': round(self.seconds, 3),
+        }
+
+
+def filter_conditions(filters):
+    """WHERE conditions and params for a bulk filter expression"""
+    conditions = []
+    params = []
+    for field, column in BULK_FILTER_COLUMNS.items():
+        value = (filters or {}).get(field)
+        if value:
+            conditions.append(f'{column} = ?')
+            params.append(value)
+    search = (filters or {}).get('search')
+    if search:
+        search_sql, search_params = search_condition(search)
+        conditions.append(search_sql)
+        params.extend(search_params)
+    return conditions, params
+
+
+def stage_selection(conn, ids=None, filters=None):
+    """Stage the selected patient ids in temp.bulk_selection; returns how many exist.
+
+    Explicit ``ids`` take precedence over ``filters``. An empty filter
+    expression selects nothing rather than the whole registry.
+    """
+    conn.execute('CREATE TEMP TABLE IF NOT EXISTS bulk_selection (id INTEGER PRIMARY KEY)')
+    conn.execute('DELETE FROM temp.bulk_selection')
+    if ids:
+        conn.executemany('INSERT OR IGNORE INTO temp.bulk_selection (id) VALUES (?)',
+                         ((int(patient_id),) for patient_id in ids))
+        # Drop ids that no longer exist
+        conn.execute('DELETE FROM temp.bulk_selection WHERE id NOT IN (SELECT id FROM patients)')
+    else:
+        conditions, params = filter_conditions(filters)
+        if not conditions:
+            raise BulkOperationError('Select patients or set at least one filter')
+        conn.execute('INSERT INTO temp.bulk_selection (id) SELECT id FROM patients WHERE '
+                     + ' AND '.join(conditions), params)
+    conn.commit()
+    return conn.execute('SELECT COUNT(*) FROM temp.bulk_selection').fetchone()[0]
+
+
+def _check_operation(operation, value):
+    if operation not in BULK_OPERATIONS:
+        raise BulkOperationError(f'Unknown bulk operation: {operation}')
+    if BULK_OPERATIONS[operation] and not value:
+        raise BulkOperationError('Choose the new value for this operation')
+    return BULK_OPERATIONS[operation]
+
+
+def _change_condition(column):
+    """Rows of the staged range the operation would actually change"""
+    return f'{column} IS NOT ?' if column else '1'
+
+
+def preview_bulk_operation(conn, operation, value=None, ids=None, filters=None):
+    """Dry run: stage the selection and count what the operation would change"""
+    column = _check_operation(operation, value)
+    started = datetime.now()
+    result = BulkResult(operation, dry_run=True)
+    result.matched = stage_selection(conn, ids, filters)
+
+    if column:
+        result.by_value = [tuple(row) for row in conn.execute(f'''
+            SELECT IFNULL({column}, ''), COUNT(*) FROM patients
+            WHERE id IN (SELECT id FROM temp.bulk_selection)
+            GROUP BY 1 ORDER BY 2 DESC
+        ''')]
+        result.affected = sum(count for current, count in result.by_value if current != value)
+    else:
+        result.affected = result.matched
+    result.seconds = (datetime.now() - started).total_seconds()
+    return result
+
+
+def apply_bulk_operation(conn, operation, value=None, ids=None, filters=None,
+                         chunk_size=DEFAULT_BULK_CHUNK_SIZE, progress=None):
+    """Stage the selection and apply the operation one chunk per transaction.
+
+    ``progress(done, total)`` is called after each chunk with the number of
+    staged ids processed so far.
+    """
+    column = _check_operation(operation, value)
+    started = datetime.now()
+    result = BulkResult(operation)
+    result.matched = stage_selection(conn, ids, filters)
+
+    if column:
+        statement = (f'UPDATE patients SET {column} = ? WHERE id IN '
+                     f'(SELECT id FROM temp.bulk_selection WHERE id > ? AND id <= ?) '
+                     f'AND {_change_condition(column)}')
+    else:
+        statement = ('DELETE FROM patients WHERE id IN '
+                     '(SELECT id FROM temp.bulk_selection WHERE id > ? AND id <= ?)')
+
+    done = 0
+    last_id = 0
+    while True:
+        bounds = conn.execute('''
+            SELECT MAX(id), COUNT(*) FROM (
+                SELECT id FROM temp.bulk_selection WHERE id > ? ORDER BY id LIMIT ?
+            )
+        ''', (last_id, chunk_size)).fetchone()
+        if not bounds[1]:
+            break
+        upper = bounds[0]
+        params = (value, last_id, upper, value) if column else (last_id, upper)
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            result.affected += conn.execute(statement, params).rowcount
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        last_id = upper
+        done += bounds[1]
+        if progress:
+            progress(done, result.matched)
+
+    conn.execute('DELETE FROM temp.bulk_selection')
+    conn.commit()
+    result.seconds = (datetime.now() - started).total_seconds()
+    return result
+
+
+def count_user_patients(conn, user_id):
+    """Patients created by a user"""
+    return conn.execute('SELECT COUNT(*) FROM patients WHERE created_by = ?', (user_id,)).fetchone()[0]
+
+
+def remove_user(conn, user_id, reassign_to=None, chunk_size=DEFAULT_BULK_CHUNK_SIZE,
+                progress=None, pause=BULK_PAUSE):
+    """Delete a user after deleting, or reassigning to ``reassign_to``, their patients.
+
+    Patients are handled ``chunk_size`` at a time, one transaction per chunk.
+    The user row is deleted in the same transaction that finds no patients
+    left, so rows added while the removal runs are not orphaned.
+    ``progress(done)`` is called after each chunk. Returns the number of
+    patients deleted or reassigned.
+    """
+    if reassign_to is not None:
+        statement = ('UPDATE patients SET created_by = ? WHERE id IN '
+                     '(SELECT id FROM patients WHERE created_by = ? LIMIT ?)')
+        params = (reassign_to, user_id, chunk_size)
+    else:
+        statement = ('DELETE FROM patients WHERE id IN '
+                     '(SELECT id FROM patients WHERE created_by = ? LIMIT ?)')
+        params = (user_id, chunk_size)
+
+    done = 0
+    while True:
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            rows = conn.execute(statement, params).rowcount
+            if not rows:
+                conn.execute('DELETE FROM users WHERE id = ?', (user_id,))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        if not rows:
+            return done
+        done += rows
+        if progress:
+            progress(done)
+        if pause:
+            time.sleep(pause)
@@ -0,0 +1,86 @@
+"""
+Small in-process caches used to keep hot read paths off the database.
+
+Patient-derived caches are per process, but their callers key every entry on
+the shared ``patient_data_version`` write counters (see utils/stats.py), so a
+write in any gunicorn worker makes the other workers' entries unreachable at
+once; ``invalidate_patient_caches`` only frees this process's memory early.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+
+class TTLCache:
+    """Thread-safe LRU cache whose entries expire after ``ttl`` seconds"""
+
+    def __init__(self, maxsize=1024, ttl=30, name=None):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        """Return a cached value, or ``default`` when missing or expired"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or entry[0] <= now:
+                if entry is not None:
+                    del self._data[key]
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, value, ttl=None):
+        """Store a value, evicting the least recently used entry if full"""
+        expires = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._data[key] = (expires, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        """Drop every entry"""
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        """Hit/miss counters for this cache"""
+        with self._lock:
+            size = len(self._data)
+        lookups = self.hits + self.misses
+        return {
+            'size': size,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+# Caches holding data derived from the patients table
+_patient_caches = []
+
+
+def patient_cache(maxsize=1024, ttl=30, name=None):
+    """Create a TTLCache for patient data; key its entries on ``get_data_version``"""
+    cache = TTLCache(maxsize=maxsize, ttl=ttl, name=name)
+    _patient_caches.append(cache)
+    return cache
+
+
+def patient_cache_stats():
+    """Hit/miss counters of every named patient cache in this process"""
+    return {cache.name: cache.stats() for cache in _patient_caches if cache.name}
+
+
+def invalidate_patient_caches():
+    """Drop every patient-derived cache in this process (call after writes)"""
+    for cache in _patient_caches:
+        cache.clear()
@@ -0,0 +1,345 @@
+"""
+Cohort crosstabs (``/api/analytics/crosstab``) computed in memory.
+
+The patients columns clinicians slice by are kept per process as compact
+arrays - categoricals for the text columns, uint8/float32 for the numbers,
+diagnosis dates as float32 day numbers - loaded on first use and keyed on
+the patients data version (see ``get_data_version`` in utils/stats.py).
+When only inserts happened since, the new rows are appended; an update or
+delete drops the columns so they are reloaded.
+
+A crosstab over 1-3 dimensions is then a few vectorized passes: each
+dimension becomes an integer code array, the codes are combined into one
+flat cell index, and ``np.bincount`` counts (or sums) every cell at once.
+No SQL runs per query, so arbitrary cubes cost milliseconds.
+"""
+import math
+import threading
+from datetime import date
+
+import numpy as np
+import pandas as pd
+
+from utils.stats import get_data_version
+
+MAX_DIMENSIONS = 3
+MAX_CELLS = 50000
+LOAD_BATCH_SIZE = 50000
+
+# Text dimension -> patients column (loaded as a categorical)
+CATEGORY_COLUMNS = {
+    'stage': 'cancer_stage',
+    'type': 'cancer_type',
+    'status': 'current_status',
+    'gender': 'gender',
+    'treatment': 'treatment_type',
+    'phase': 'treatment_phase',
+    'surgery': 'surgery_status',
+    'metastasis': 'metastasis',
+    'risk': 'risk_level',
+    'hospital': 'hospital_name',
+    'doctor': 'doctor_name',
+    'blood_group': 'blood_group',
+    'city': 'city',
+    'state': 'state',
+}
+
+# Numeric frame column -> (patients column, dtype)
+NUMBER_COLUMNS = {
+    'age': ('age', np.uint8),
+    'tumor_size': ('tumor_size', np.float32),
+    'bmi': ('bmi', np.float32),
+}
+
+# Bucketed dimensions derived at query time: name -> (bin edges, labels)
+AGE_GROUPS = ([18, 36, 51, 66], ['Under 18', '18-35', '36-50', '51-65', 'Over 65'])
+FOLLOWUP_BANDS = ([6, 12, 24, 36, 60],
+                  ['0-6 months', '6-12 months', '1-2 years', '2-3 years', '3-5 years', '5+ years'])
+DERIVED_DIMENSIONS = ['age_group', 'diagnosis_year', 'followup']
+
+DIMENSIONS = list(CATEGORY_COLUMNS) + DERIVED_DIMENSIONS
+
+# Values that can be aggregated per cell; followup_months is time since diagnosis
+MEASURES = list(NUMBER_COLUMNS) + ['followup_months']
+AGGREGATIONS = ['count', 'mean', 'sum', 'min', 'max', 'median']
+
+DAYS_PER_MONTH = 30.4375
+
+# Label used for NULL/blank values (as in patient_stats)
+BLANK = ''
+
+
+class CohortError(ValueError):
+    """Raised for an unknown dimension, measure or aggregation, or a cube that is too large"""
+
+
+# ==================== FRAME ====================
+
+# Frame column -> patients column
+SOURCE_COLUMNS = dict(CATEGORY_COLUMNS, **{name: column for name, (column, _) in NUMBER_COLUMNS.items()},
+                      diagnosis_day='diagnosis_date')
+
+# Frame columns behind the derived dimensions and measures
+DERIVED_SOURCES = {'age_group': 'age', 'diagnosis_year': 'diagnosis_day', 'followup': 'diagnosis_day',
+                   'followup_months': 'diagnosis_day'}
+
+
+def required_columns(dimensions, measure=None):
+    """Frame columns needed for the given dimensions and measure"""
+    columns = []
+    for name in list(dimensions) + ([measure] if measure else []):
+        column = DERIVED_SOURCES.get(name, name)
+        if column not in SOURCE_COLUMNS:
+            kind, choices = ('measure', MEASURES) if name == measure else ('dimension', DIMENSIONS)
+            raise CohortError(f"Unknown {kind} '{name}' (choose from {', '.join(choices)})")
+        if column not in columns:
+            columns.append(column)
+    return columns
+
+
+def _convert(name, values):
+    """Compact array for one frame column from an object array of SQL values"""
+    if name in CATEGORY_COLUMNS:
+        # TEXT affinity: values are str or None; NULL gets the blank label
+        codes, labels = pd.factorize(values, sort=True)
+        missing = codes < 0
+        if missing.any():
+            if BLANK in labels:
+                codes[missing] = list(labels).index(BLANK)
+            else:
+                labels = np.insert(labels, 0, BLANK)
+                codes += 1
+        return pd.Categorical.from_codes(codes, categories=labels)
+    if name == 'diagnosis_day':
+        dates = pd.to_datetime(pd.Series(values), errors='coerce', format='ISO8601')
+        return ((dates - pd.Timestamp(0)) / pd.Timedelta(days=1)).to_numpy(dtype=np.float32)
+    numbers = pd.to_numeric(pd.Series(values), errors='coerce').to_numpy(dtype=np.float64)
+    dtype = NUMBER_COLUMNS[name][1]
+    if np.issubdtype(dtype, np.integer):
+        info = np.iinfo(dtype)
+        numbers = np.clip(np.nan_to_num(numbers, nan=0), info.min, info.max)
+    return numbers.astype(dtype)
+
+
+def load_columns(conn, names, after_id=0):
+    """{'id': ids, name: array} for patients with id > after_id, in id order"""
+    names = ['id'] + [name for name in names if name != 'id']
+    query = (f"SELECT {', '.join(SOURCE_COLUMNS.get(name, name) for name in names)} "
+             f"FROM patients WHERE id > ? ORDER BY id")
+    cursor = conn.execute(query, (after_id,))
+    # Plain tuples: much cheaper to turn into arrays than sqlite3.Row
+    cursor.row_factory = None
+    batches = []
+    while True:
+        batch = cursor.fetchmany(LOAD_BATCH_SIZE)
+        if not batch:
+            break
+        batches.append(np.array(batch, dtype=object))
+    values = np.concatenate(batches) if batches else np.empty((0, len(names)), dtype=object)
+    columns = {'id': values[:, 0].astype(np.int64)}
+    for index, name in enumerate(names[1:], 1):
+        columns[name] = _convert(name, values[:, index])
+    return columns
+
+
+def _concat(old, new):
+    """Append one column to another; categoricals gain any new labels"""
+    if not isinstance(old, pd.Categorical):
+        return np.concatenate([old, new])
+    extra = new.categories.difference(old.categories)
+    if len(extra):
+        old = old.add_categories(extra)
+    new = new.set_categories(old.categories)
+    return pd.Categorical.from_codes(np.concatenate([old.codes, new.codes]), dtype=old.dtype)
+
+
+# Columns loaded so far, all aligned with 'ids' and valid for 'version'
+_frame_lock = threading.Lock()
+_frame_state = {'version': None, 'ids': None, 'columns': {}}
+
+
+def get_frame(conn, names):
+    """Return (frame with the named columns, data version, 'hit' | 'append' | 'load').
+
+    Columns are loaded on first use and kept until the data version says a
+    patient was updated or deleted; rows inserted meanwhile are appended.
+    """
+    with _frame_lock:
+        # One read snapshot for the version and every column loaded below
+        started = not conn.in_transaction
+        if started:
+            conn.execute('BEGIN')
+        try:
+            state = _frame_state
+            version = get_data_version(conn)
+            status = 'hit'
+            if state['version'] != version:
+                if state['version'] is not None and state['version'][1] == version[1]:
+                    # Only inserts since the columns were loaded
+                    new_rows = load_columns(conn, state['columns'], int(state['ids'][-1]) if len(state['ids']) else 0)
+                    state['ids'] = np.concatenate([state['ids'], new_rows.pop('id')])
+                    for name, column in new_rows.items():
+                        state['columns'][name] = _concat(state['columns'][name], column)
+                    status = 'append'
+                else:
+                    state.update(ids=None, columns={})
+                state['version'] = version
+            missing = [name for name in names if name not in state['columns']]
+            if missing or state['ids'] is None:
+                loaded = load_columns(conn, missing)
+                state['ids'] = loaded.pop('id')
+                state['columns'].update(loaded)
+                status = 'load'
+        except Exception:
+            state.update(version=None, ids=None, columns={})
+            raise
+        finally:
+            if started:
+                conn.commit()
+        frame = pd.DataFrame({name: state['columns'][name] for name in names}, copy=False)
+        return frame, version, status
+
+
+def clear_frame():
+    """Drop every loaded column (tests, memory pressure)"""
+    with _frame_lock:
+        _frame_state.update(version=None, ids=None, columns={})
+
+
+# ==================== CROSSTABS ====================
+
+def _today_day(today=None):
+    return float((pd.Timestamp(today or date.today()) - pd.Timestamp(0)).days)
+
+
+def _followup_months(frame, today=None):
+    return (_today_day(today) - frame['diagnosis_day'].to_numpy(dtype=np.float64)) / DAYS_PER_MONTH
+
+
+def _bucket(values, edges, labels):
+    """Codes of numeric values in labelled buckets (NaN -> blank)"""
+    codes = np.digitize(values, edges)
+    missing = np.isnan(values)
+    if missing.any():
+        codes[missing] = len(labels)
+        labels = labels + [BLANK]
+    return codes, labels
+
+
+def dimension_codes(frame, dimension, today=None):
+    """(integer code per row, labels) for one dimension"""
+    if dimension in CATEGORY_COLUMNS:
+        categorical = frame[dimension].array
+        return categorical.codes.astype(np.intp), list(categorical.categories)
+    if dimension == 'age_group':
+        return _bucket(frame['age'].to_numpy(dtype=np.float64), *AGE_GROUPS)
+    if dimension == 'diagnosis_year':
+        days = frame['diagnosis_day'].to_numpy(dtype=np.float64)
+        years = np.full(len(days), -1, dtype=np.int64)
+        known = ~np.isnan(days)
+        years[known] = days[known].astype('int64').astype('datetime64[D]').astype('datetime64[Y]').astype(int) + 1970
+        values, codes = np.unique(years, return_inverse=True)
+        return codes, [BLANK if year < 0 else str(year) for year in values]
+    if dimension == 'followup':
+        return _bucket(_followup_months(frame, today), *FOLLOWUP_BANDS)
+    raise CohortError(f"Unknown dimension '{dimension}' (choose from {', '.join(DIMENSIONS)})")
+
+
+def measure_values(frame, measure, today=None):
+    """float64 values of a measure (NaN where unknown)"""
+    if measure == 'followup_months':
+        return _followup_months(frame, today)
+    if measure in NUMBER_COLUMNS:
+        return frame[measure].to_numpy(dtype=np.float64)
+    raise CohortError(f"Unknown measure '{measure}' (choose from {', '.join(MEASURES)})")
+
+
+def _aggregate(cells, size, values, aggregation):
+    """Per-cell aggregate of ``values`` (NaN for empty cells)"""
+    valid = ~np.isnan(values)
+    cells, values = cells[valid], values[valid]
+    counts = np.bincount(cells, minlength=size)
+    if aggregation in ('sum', 'mean'):
+        totals = np.bincount(cells, weights=values, minlength=size)
+        if aggregation == 'sum':
+            return totals
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.where(counts > 0, totals / np.maximum(counts, 1), np.nan)
+    result = np.full(size, np.nan)
+    grouped = pd.Series(values).groupby(cells).agg(aggregation)
+    result[grouped.index.to_numpy()] = grouped.to_numpy()
+    return result
+
+
+def _to_json(values, decimals):
+    """Nested lists with NaN as None"""
+    rounded = np.round(values.astype(np.float64), decimals)
+    return np.where(np.isnan(rounded), None, rounded).tolist()
+
+
+def crosstab(frame, dimensions, aggregation='count', measure=None, filters=None, normalize=None, today=None):
+    """Counts (or an aggregate of ``measure``) for every combination of 1-3 dimensions.
+
+    ``filters`` maps dimensions to the values to keep. ``normalize`` turns
+    counts into shares of the grand total ('all') or of each value of one of
+    the dimensions. Labels whose cells are all empty are dropped.
+    """
+    if not 1 <= len(dimensions) <= MAX_DIMENSIONS:
+        raise CohortError(f'Choose 1 to {MAX_DIMENSIONS} dimensions')
+    if len(set(dimensions)) != len(dimensions):
+        raise CohortError('Each dimension can only be used once')
+    if aggregation not in AGGREGATIONS:
+        raise CohortError(f"Unknown aggregation '{aggregation}' (choose from {', '.join(AGGREGATIONS)})")
+    if aggregation != 'count' and not measure:
+        raise CohortError(f"'{aggregation}' needs a measure (choose from {', '.join(MEASURES)})")
+    if normalize and (aggregation != 'count' or (normalize != 'all' and normalize not in dimensions)):
+        raise CohortError("normalize applies to counts, by 'all' or one of the requested dimensions")
+
+    mask = np.ones(len(frame), dtype=bool)
+    for dimension, wanted in (filters or {}).items():
+        codes, labels = dimension_codes(frame, dimension, today)
+        keep = [labels.index(value) for value in wanted if value in labels]
+        mask &= np.isin(codes, keep)
+
+    axes = [dimension_codes(frame, dimension, today) for dimension in dimensions]
+    shape = tuple(len(labels) for _, labels in axes)
+    size = math.prod(shape)
+    if size > MAX_CELLS:
+        raise CohortError(f'The cube would have {size} cells (limit {MAX_CELLS}); filter or use fewer dimensions')
+
+    cells = np.ravel_multi_index([codes[mask] for codes, _ in axes], shape)
+    counts = np.bincount(cells, minlength=size).reshape(shape)
+    if aggregation == 'count':
+        values, decimals = counts.astype(np.float64), 0
+    else:
+        values = _aggregate(cells, size, measure_values(frame, measure, today)[mask], aggregation).reshape(shape)
+        decimals = 2
+
+    # Drop labels without any patient in the selection
+    keep = [np.flatnonzero(counts.sum(axis=tuple(other for other in range(len(shape)) if other != axis)))
+            for axis in range(len(shape))]
+    counts = counts[np.ix_(*keep)]
+    values = values[np.ix_(*keep)]
+    labels = [[axis_labels[index] for index in kept] for (_, axis_labels), kept in zip(axes, keep)]
+
+    total = int(mask.sum())
+    if normalize == 'all':
+        values, decimals = values / max(total, 1), 4
+    elif normalize:
+        axis = dimensions.index(normalize)
+        others = tuple(other for other in range(len(shape)) if other != axis)
+        sums = values.sum(axis=others, keepdims=True)
+        values, decimals = values / np.where(sums > 0, sums, 1), 4
+
+    result = {
+        'dimensions': list(dimensions),
+        'labels': labels,
+        'aggregation': aggregation,
+        'measure': measure,
+        'normalize': normalize,
+        'total': total,
+        'values': _to_json(values, decimals),
+    }
+    if aggregation != 'count' or normalize:
+        result['counts'] = counts.tolist()
+    return result
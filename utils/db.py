@@ -0,0 +1,269 @@
+"""
+Shared SQLite connection layer for the Oncobloom application.
+
+Connections are kept in a small per-process pool and bound to Flask's
+application context through ``g``, so every helper that runs during a request
+reuses the same connection and it is handed back to the pool on teardown.
+"""
+import os
+import sqlite3
+import threading
+import time
+from queue import LifoQueue, Empty
+
+from flask import g, has_app_context
+
+from utils.profiling import active_profile, ProfiledCursor
+
+# Database configuration
+DATABASE = os.environ.get('DATABASE') or 'oncology_system.db'
+
+DEFAULT_POOL_SIZE = 8
+DEFAULT_POOL_TIMEOUT = 10            # seconds to wait for a free connection
+DEFAULT_BUSY_TIMEOUT_MS = 5000       # wait for a writer instead of "database is locked"
+DEFAULT_MMAP_SIZE = 256 * 1024 * 1024
+DEFAULT_CACHE_SIZE_KB = 16 * 1024
+
+
+class PoolExhaustedError(RuntimeError):
+    """Raised when no pooled connection becomes available in time"""
+
+
+class PooledConnection(sqlite3.Connection):
+    """sqlite3 connection whose close() hands it back to the pool"""
+
+    _pool = None
+    _bound = False
+
+    def close(self):
+        """Discard any uncommitted work and release the connection"""
+        if self.in_transaction:
+            self.rollback()
+        # Request-bound connections are released by the teardown handler
+        if self._pool is not None and not self._bound:
+            self._pool.release(self)
+
+    def execute(self, sql, parameters=()):
+        """Run a statement, timing it when the current request is being profiled"""
+        profile = active_profile()
+        if profile is None:
+            return sqlite3.Connection.execute(self, sql, parameters)
+        return ProfiledCursor(self.cursor(), profile).execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        profile = active_profile()
+        if profile is None:
+            return sqlite3.Connection.executemany(self, sql, seq_of_parameters)
+        return ProfiledCursor(self.cursor(), profile).executemany(sql, seq_of_parameters)
+
+    def dispose(self):
+        """Really close the underlying sqlite handle"""
+        self._pool = None
+        sqlite3.Connection.close(self)
+
+
+class ConnectionPool:
+    """Bounded LIFO pool of tuned SQLite connections for one process"""
+
+    def __init__(self, database, size=DEFAULT_POOL_SIZE, timeout=DEFAULT_POOL_TIMEOUT,
+                 busy_timeout_ms=DEFAULT_BUSY_TIMEOUT_MS, mmap_size=DEFAULT_MMAP_SIZE,
+                 cache_size_kb=DEFAULT_CACHE_SIZE_KB):
+        self.database = database
+        self.size = size
+        self.timeout = timeout
+        self.busy_timeout_ms = busy_timeout_ms
+        self.mmap_size = mmap_size
+        self.cache_size_kb = cache_size_kb
+        self.pid = os.getpid()
+
+        self._idle = LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+        self._lock = threading.Lock()
+        self._stats = {
+            'created': 0,
+            'acquired': 0,
+            'released': 0,
+            'in_use': 0,
+            'peak_in_use': 0,
+            'waits': 0,
+            'wait_time_ms': 0.0,
+            'timeouts': 0,
+        }
+
+    def _connect(self, factory=PooledConnection):
+        """Open a new connection and apply the performance PRAGMAs"""
+        conn = sqlite3.connect(
+            self.database,
+            timeout=self.busy_timeout_ms / 1000.0,
+            check_same_thread=False,
+            factory=factory,
+        )
+        conn.row_factory = sqlite3.Row
+        conn.execute('PRAGMA journal_mode = WAL')
+        conn.execute('PRAGMA synchronous = NORMAL')
+        conn.execute(f'PRAGMA busy_timeout = {int(self.busy_timeout_ms)}')
+        conn.execute(f'PRAGMA mmap_size = {int(self.mmap_size)}')
+        conn.execute(f'PRAGMA cache_size = -{int(self.cache_size_kb)}')
+        conn.execute('PRAGMA temp_store = MEMORY')
+        return conn
+
+    def open_reader(self):
+        """Open a read-only connection outside the pool (the caller closes it)"""
+        conn = self._connect(sqlite3.Connection)
+        conn.execute('PRAGMA query_only = ON')
+        return conn
+
+    def acquire(self):
+        """Take a connection from the pool, opening one if needed"""
+        start = time.perf_counter()
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self._stats['waits'] += 1
+            if not self._slots.acquire(timeout=self.timeout):
+                with self._lock:
+                    self._stats['timeouts'] += 1
+                raise PoolExhaustedError(
+                    f'No database connection available after {self.timeout}s'
+                )
+        waited_ms = (time.perf_counter() - start) * 1000
+
+        try:
+            conn = self._idle.get_nowait()
+        except Empty:
+            try:
+                conn = self._connect()
+            except Exception:
+                self._slots.release()
+                raise
+            with self._lock:
+                self._stats['created'] += 1
+
+        conn._pool = self
+        conn._bound = False
+        with self._lock:
+            self._stats['acquired'] += 1
+            self._stats['wait_time_ms'] += waited_ms
+            self._stats['in_use'] += 1
+            self._stats['peak_in_use'] = max(self._stats['peak_in_use'], self._stats['in_use'])
+        return conn
+
+    def release(self, conn):
+        """Return a connection to the pool"""
+        if conn._pool is not self:
+            return
+        if conn.in_transaction:
+            conn.rollback()
+        conn.row_factory = sqlite3.Row
+        conn._pool = None
+        conn._bound = False
+        self._idle.put(conn)
+        with self._lock:
+            self._stats['released'] += 1
+            self._stats['in_use'] -= 1
+        self._slots.release()
+
+    def close_all(self):
+        """Close every idle connection"""
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except Empty:
+                break
+            conn.dispose()
+
+    def stats(self):
+        """Snapshot of pool metrics"""
+        with self._lock:
+            stats = dict(self._stats)
+        stats['size'] = self.size
+        stats['idle'] = self._idle.qsize()
+        stats['avg_wait_ms'] = round(stats['wait_time_ms'] / stats['acquired'], 3) if stats['acquired'] else 0.0
+        stats['wait_time_ms'] = round(stats['wait_time_ms'], 3)
+        return stats
+
+
+_pool = None
+_pool_settings = {'database': DATABASE}
+_pool_lock = threading.Lock()
+
+
+def configure(database=None, **settings):
+    """Set pool parameters; takes effect for the next pool created"""
+    global _pool
+    with _pool_lock:
+        if database:
+            _pool_settings['database'] = database
+        _pool_settings.update({k: v for k, v in settings.items() if v is not None})
+        if _pool is not None:
+            _pool.close_all()
+            _pool = None
+
+
+def get_pool():
+    """Return this process's pool, recreating it after a fork"""
+    global _pool
+    pool = _pool
+    if pool is None or pool.pid != os.getpid():
+        with _pool_lock:
+            if _pool is None or _pool.pid != os.getpid():
+                _pool = ConnectionPool(**_pool_settings)
+            pool = _pool
+    return pool
+
+
+def get_db_connection():
+    """Get a database connection (shared for the current request when in app context)"""
+    if has_app_context():
+        conn = g.get('_db_conn')
+        if conn is None:
+            conn = get_pool().acquire()
+            conn._bound = True
+            g._db_conn = conn
+        return conn
+    return get_pool().acquire()
+
+
+def close_db(exception=None):
+    """Teardown handler: hand the request's connection back to the pool"""
+    conn = g.pop('_db_conn', None)
+    if conn is not None and conn._pool is not None:
+        conn._pool.release(conn)
+
+
+def pool_stats():
+    """Metrics for the current process's pool"""
+    return get_pool().stats()
+
+
+def init_app(app):
+    """Configure the pool from the Flask config and register teardown"""
+    configure(
+        database=app.config.get('DATABASE'),
+        size=app.config.get('DB_POOL_SIZE'),
+        timeout=app.config.get('DB_POOL_TIMEOUT'),
+        busy_timeout_ms=app.config.get('DB_BUSY_TIMEOUT_MS'),
+        mmap_size=app.config.get('DB_MMAP_SIZE'),
+        cache_size_kb=app.config.get('DB_CACHE_SIZE_KB'),
+    )
+    app.teardown_appcontext(close_db)
+
+
+def stream_query(query, params=(), batch_size=1000):
+    """Yield result rows in ``fetchmany`` batches from a dedicated connection.
+
+    The read-only connection is opened outside the pool and held only while
+    the generator runs, so a slow download never ties up a pooled slot and it
+    is safe to use from a streamed response after the request's own connection
+    is gone.
+    """
+    conn = get_pool().open_reader()
+    try:
+        cursor = conn.execute(query, params)
+        while True:
+            batch = cursor.fetchmany(batch_size)
+            if not batch:
+                break
+            yield batch
+        cursor.close()
+    finally:
+        conn.close()
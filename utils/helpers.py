@@ -1,10 +1,15 @@
+import base64
+import csv
+import io
+import os
 import random
 import string
 from datetime import datetime, timedelta
+from xml.sax.saxutils import escape
 from flask import current_app
-import pandas as pd
-from reportlab.lib.pagesizes import letter
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
+from reportlab.lib.pagesizes import letter, landscape
+from reportlab.lib.units import inch
+from reportlab.platypus import SimpleDocTemplate, LongTable, TableStyle, Paragraph, Spacer
 from reportlab.lib.styles import getSampleStyleSheet
 from reportlab.lib import colors
 
@@ -27,50 +32,201 @@ def calculate_age(birth_date):
         return age
     return 0
 
-def export_to_csv(data, filename):
-    """Export data to CSV file"""
-    df = pd.DataFrame(data)
-    df.to_csv(filename, index=False)
-    return filename
+def encode_cursor(created_at, row_id):
+    """Encode a (created_at, id) keyset position as an opaque URL-safe token"""
+    raw = f'{created_at}|{row_id}'.encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
 
-def export_to_excel(data, filename):
-    """Export data to Excel file"""
-    df = pd.DataFrame(data)
-    df.to_excel(filename, index=False, engine='openpyxl')
-    return filename
+def decode_cursor(token):
+    """Decode a cursor token back to (created_at, id); None if malformed"""
+    if not token:
+        return None
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        created_at, row_id = base64.urlsafe_b64decode(padded).decode('utf-8').rsplit('|', 1)
+        return created_at, int(row_id)
+    except (ValueError, UnicodeDecodeError):
+        return None
 
-def export_to_pdf(data, filename, title='Patient Records'):
-    """Export data to PDF file"""
-    doc = SimpleDocTemplate(filename, pagesize=letter)
-    styles = getSampleStyleSheet()
-    elements = []
+def iter_csv(headers, batches):
+    """Yield CSV text chunks: the header line, then one chunk per batch of rows"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(headers)
+    yield buffer.getvalue()
+    
+    for batch in batches:
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows(batch)
+        yield buffer.getvalue()
+
+# Excel's hard limit is 1,048,576 rows per sheet, one of which is the header
+EXCEL_MAX_DATA_ROWS = 1048575
+
+def export_rows_to_excel(headers, batches, filename, sheet_title='Patients',
+                         max_rows_per_sheet=EXCEL_MAX_DATA_ROWS):
+    """Write row batches to an XLSX file in constant memory.
+    
+    Rows are flushed to disk as they are written (xlsxwriter constant_memory,
+    or openpyxl write_only when xlsxwriter is missing). A new sheet is started
+    whenever one fills up. Returns the number of data rows written.
+    """
+    try:
+        import xlsxwriter
+    except ImportError:
+        xlsxwriter = None
     
-    # Title
-    title_style = styles['Title']
-    elements.append(Paragraph(title, title_style))
-    elements.append(Spacer(1, 12))
+    if xlsxwriter is not None:
+        workbook = xlsxwriter.Workbook(filename, {'constant_memory': True})
+        header_format = workbook.add_format({'bold': True})
+        
+        def add_sheet(title):
+            sheet = workbook.add_worksheet(title)
+            sheet.write_row(0, 0, headers, header_format)
+            return sheet
+        
+        def append(sheet, row_index, row):
+            sheet.write_row(row_index, 0, row)
+    else:
+        from openpyxl import Workbook
+        workbook = Workbook(write_only=True)
+        
+        def add_sheet(title):
+            sheet = workbook.create_sheet(title)
+            sheet.append(headers)
+            return sheet
+        
+        def append(sheet, row_index, row):
+            sheet.append(list(row))
+    
+    sheet_number = 1
+    sheet = add_sheet(sheet_title)
+    rows_in_sheet = 0
+    total = 0
+    for batch in batches:
+        for row in batch:
+            if rows_in_sheet == max_rows_per_sheet:
+                sheet_number += 1
+                sheet = add_sheet(f'{sheet_title} ({sheet_number})')
+                rows_in_sheet = 0
+            rows_in_sheet += 1
+            append(sheet, rows_in_sheet, tuple(row))
+        total += len(batch)
+    
+    if xlsxwriter is not None:
+        workbook.close()
+    else:
+        workbook.save(filename)
+    return total
+
+def iter_file(path, chunk_size=64 * 1024, remove=False):
+    """Yield a file's bytes in chunks, optionally deleting it once read or abandoned"""
+    try:
+        with open(path, 'rb') as f:
+            while True:
+                chunk = f.read(chunk_size)
+                if not chunk:
+                    break
+                yield chunk
+    finally:
+        if remove and os.path.exists(path):
+            os.remove(path)
+
+# PDF layout: landscape letter, small fixed-height rows so no cell needs measuring
+PDF_FONT_SIZE = 7
+PDF_HEADER_FONT_SIZE = 8
+PDF_ROW_HEIGHT = 11
+PDF_MARGIN = 0.4 * inch
+
+def _pdf_column_widths(headers, sample_rows, available_width):
+    """Split the page width between columns in proportion to their typical text length"""
+    lengths = []
+    for index, header in enumerate(headers):
+        values = [len(str(row[index])) for row in sample_rows if row[index] is not None]
+        typical = max(values) if values else 0
+        lengths.append(max(len(header), min(typical, 40), 4))
+    total = sum(lengths)
+    return [available_width * length / total for length in lengths]
+
+def _pdf_cell(value, max_chars):
+    """Render a cell as text clipped to its column"""
+    text = '' if value is None else str(value)
+    return text if len(text) <= max_chars else text[:max_chars - 1] + '…'
+
+def export_rows_to_pdf(headers, batches, filename, title='Patient Records', group_by=None,
+                       rows_per_table=None):
+    """Write row batches to a landscape PDF as a series of page-sized LongTables.
     
-    # Table headers
-    headers = list(data[0].keys()) if data else []
-    table_data = [headers]
+    Column widths and the table style are computed once; every chunk repeats
+    the header row. With ``group_by`` (a header name) a new titled section is
+    started whenever that column's value changes, so rows should arrive sorted
+    by it. Returns the number of data rows written.
+    """
+    pagesize = landscape(letter)
+    doc = SimpleDocTemplate(filename, pagesize=pagesize, title=title,
+                            leftMargin=PDF_MARGIN, rightMargin=PDF_MARGIN,
+                            topMargin=PDF_MARGIN, bottomMargin=PDF_MARGIN)
+    styles = getSampleStyleSheet()
+    elements = [Paragraph(title, styles['Title']), Spacer(1, 6)]
     
-    # Table rows
-    for row in data:
-        table_data.append([str(row.get(header, '')) for header in headers])
+    if rows_per_table is None:
+        # Roughly one page of rows per table keeps each layout pass small
+        rows_per_table = max(10, int(doc.height // PDF_ROW_HEIGHT) - 4)
     
-    # Create table
-    table = Table(table_data)
-    table.setStyle(TableStyle([
+    table_style = TableStyle([
         ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
         ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
         ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, 0), 14),
-        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-        ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-        ('GRID', (0, 0), (-1, -1), 1, colors.black)
-    ]))
+        ('FONTSIZE', (0, 0), (-1, 0), PDF_HEADER_FONT_SIZE),
+        ('FONTSIZE', (0, 1), (-1, -1), PDF_FONT_SIZE),
+        ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+        ('TOPPADDING', (0, 0), (-1, -1), 1),
+        ('BOTTOMPADDING', (0, 0), (-1, -1), 1),
+        ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.beige]),
+        ('GRID', (0, 0), (-1, -1), 0.25, colors.black),
+    ])
+    
+    group_index = headers.index(group_by) if group_by else None
+    col_widths = None
+    max_chars = None
+    pending = []
+    current_group = object()
+    total = 0
+    
+    def flush():
+        if pending:
+            rows = [headers] + pending
+            elements.append(LongTable(rows, colWidths=col_widths,
+                                      rowHeights=[PDF_ROW_HEIGHT + 2] + [PDF_ROW_HEIGHT] * len(pending),
+                                      repeatRows=1, style=table_style))
+            del pending[:]
+    
+    for batch in batches:
+        if col_widths is None and batch:
+            col_widths = _pdf_column_widths(headers, batch, doc.width)
+            max_chars = [max(3, int(width / (PDF_FONT_SIZE * 0.5))) for width in col_widths]
+        for row in batch:
+            if group_index is not None and row[group_index] != current_group:
+                flush()
+                current_group = row[group_index]
+                label = current_group if current_group not in (None, '') else 'Not specified'
+                elements.append(Spacer(1, 8))
+                elements.append(Paragraph(escape(f'{group_by}: {label}'), styles['Heading3']))
+            pending.append([_pdf_cell(value, limit) for value, limit in zip(row, max_chars)])
+            if len(pending) >= rows_per_table:
+                flush()
+        total += len(batch)
+    flush()
+    
+    if total == 0:
+        elements.append(Paragraph('No records found.', styles['Normal']))
+    
+    def draw_page_number(canvas, document):
+        canvas.saveState()
+        canvas.setFont('Helvetica', PDF_FONT_SIZE)
+        canvas.drawRightString(pagesize[0] - PDF_MARGIN, PDF_MARGIN / 2, f'Page {document.page}')
+        canvas.restoreState()
     
-    elements.append(table)
-    doc.build(elements)
-    return filename
+    doc.build(elements, onFirstPage=draw_page_number, onLaterPages=draw_page_number)
+    return total
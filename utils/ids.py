@@ -0,0 +1,74 @@
+"""
+Patient ID allocation (``ONC-YYYY-NNNN``) from a per-year sequence table.
+
+IDs are handed out by bumping ``patient_id_sequences.last_value`` inside the
+caller's transaction, so the allocation commits or rolls back together with
+the INSERT that uses it. The UPDATE takes SQLite's write lock, which
+serializes concurrent allocators: IDs are monotonic and never reused, even
+after deletes.
+"""
+from datetime import datetime
+
+PATIENT_ID_PREFIX = 'ONC'
+
+
+def ensure_patient_id_sequence(conn):
+    """Create the sequence table and seed it from existing patient IDs (in the caller's transaction)"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS patient_id_sequences (
+            year INTEGER PRIMARY KEY,
+            last_value INTEGER NOT NULL
+        )
+    ''')
+    conn.execute(f'''
+        INSERT INTO patient_id_sequences (year, last_value)
+        SELECT CAST(substr(patient_id, 5, 4) AS INTEGER),
+               MAX(CAST(substr(patient_id, 10) AS INTEGER))
+        FROM patients
+        WHERE patient_id LIKE '{PATIENT_ID_PREFIX}-____-%'
+        GROUP BY 1
+        ON CONFLICT(year) DO UPDATE SET last_value = MAX(last_value, excluded.last_value)
+    ''')
+
+
+def format_patient_id(year, sequence):
+    """Render a sequence number as a patient ID"""
+    return f'{PATIENT_ID_PREFIX}-{year}-{sequence:04d}'
+
+
+def _seed_value(conn, year):
+    """Highest sequence already used for ``year`` (one-off scan for a new year)"""
+    row = conn.execute(
+        'SELECT MAX(CAST(substr(patient_id, 10) AS INTEGER)) FROM patients WHERE patient_id LIKE ?',
+        (f'{PATIENT_ID_PREFIX}-{year}-%',)
+    ).fetchone()
+    return row[0] or 0
+
+
+def reserve_patient_ids(conn, count=1, year=None):
+    """Reserve a block of ``count`` consecutive patient IDs; returns them in order.
+
+    Runs inside the connection's current transaction (opening one if needed);
+    the caller commits it together with the rows that use the IDs.
+    """
+    if count < 1:
+        return []
+    year = year or datetime.now().year
+    row = conn.execute(
+        'UPDATE patient_id_sequences SET last_value = last_value + ? WHERE year = ? RETURNING last_value',
+        (count, year)
+    ).fetchone()
+    if row is None:
+        # First allocation this year
+        last_value = _seed_value(conn, year) + count
+        conn.execute('INSERT INTO patient_id_sequences (year, last_value) VALUES (?, ?)',
+                     (year, last_value))
+    else:
+        last_value = row[0]
+    first = last_value - count + 1
+    return [format_patient_id(year, sequence) for sequence in range(first, last_value + 1)]
+
+
+def next_patient_id(conn):
+    """Allocate a single patient ID in the current transaction"""
+    return reserve_patient_ids(conn, 1)[0]
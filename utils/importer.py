@@ -0,0 +1,205 @@
+"""
+Bulk patient import from CSV/XLSX registry dumps.
+
+Rows are streamed from the file in batches. Each batch is validated in one
+vectorized pass with the shared patient schema (the same rules as the
+``add_patient`` form), given patient IDs reserved as a block and written
+with ``executemany`` in its own transaction. Invalid rows are reported with
+their line number and skipped; they never abort the import.
+"""
+import csv
+import io
+from operator import itemgetter
+from datetime import datetime
+
+import pandas as pd
+
+from utils.ids import reserve_patient_ids
+from utils.schema import deferred_insert_triggers
+from utils.validation import (PATIENT_COLUMNS, REQUIRED_FIELDS, validate_patient_frame,
+                              rejected_rows, error_messages, frame_to_rows)
+
+DEFAULT_IMPORT_BATCH_SIZE = 5000
+MAX_REPORTED_ERRORS = 1000
+
+# Export headings that don't normalize to a column name
+HEADER_ALIASES = {
+    'name': 'full_name',
+    'stage': 'cancer_stage',
+    'status': 'current_status',
+    'doctor': 'doctor_name',
+    'hospital': 'hospital_name',
+}
+
+INSERT_COLUMNS = PATIENT_COLUMNS + ['bmi']
+
+INSERT_PATIENT_SQL = 'INSERT INTO patients (patient_id, {columns}, created_by) VALUES ({placeholders})'.format(
+    columns=', '.join(INSERT_COLUMNS),
+    placeholders=', '.join(['?'] * (len(INSERT_COLUMNS) + 2)),
+)
+
+
+class ImportFormatError(ValueError):
+    """Raised when an import file can't be read at all (bad header, wrong type)"""
+
+
+class ImportResult:
+    """Counts and per-row errors for one import run"""
+
+    def __init__(self):
+        self.inserted = 0
+        self.rejected = 0
+        self.errors = []
+        self.first_id = None
+        self.last_id = None
+        self.seconds = 0.0
+
+    @property
+    def processed(self):
+        return self.inserted + self.rejected
+
+    @property
+    def rows_per_second(self):
+        return round(self.processed / self.seconds) if self.seconds else 0
+
+    def summary(self):
+        return (f'{self.inserted} patients imported, {self.rejected} rows rejected '
+                f'in {self.seconds:.2f}s ({self.rows_per_second} rows/s)')
+
+
+def normalize_header(name):
+    """Map a file heading ("Diagnosis Date", "doctor") to a patient column"""
+    key = (name or '').strip().lower().replace(' ', '_').replace('-', '_')
+    return HEADER_ALIASES.get(key, key)
+
+
+def column_positions(headers):
+    """Map each patient column found in the file to its position there"""
+    positions = {}
+    for index, header in enumerate(headers):
+        column = normalize_header(header)
+        if column in PATIENT_COLUMNS and column not in positions:
+            positions[column] = index
+    missing = [label for column, label in REQUIRED_FIELDS.items() if column not in positions]
+    if missing:
+        raise ImportFormatError(f"Missing required columns: {', '.join(missing)}")
+    return positions
+
+
+def _text(value):
+    if value is None:
+        return ''
+    if isinstance(value, datetime):
+        return value.strftime('%Y-%m-%d')
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return str(value).strip()
+
+
+def iter_csv_records(stream, encoding='utf-8-sig'):
+    """Yield (line_number, values) from a binary or text CSV stream"""
+    if not isinstance(stream.read(0), str):
+        stream = io.TextIOWrapper(stream, encoding=encoding, newline='')
+    reader = csv.reader(stream)
+    for values in reader:
+        yield reader.line_num, values
+
+
+def iter_xlsx_records(source):
+    """Yield (row_number, values) from the first worksheet of an XLSX file"""
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(source, read_only=True, data_only=True)
+    try:
+        sheet = workbook.worksheets[0]
+        for line, values in enumerate(sheet.iter_rows(values_only=True), start=1):
+            yield line, [_text(value) for value in values]
+    finally:
+        workbook.close()
+
+
+def iter_import_records(source, filename):
+    """Pick the reader for an upload by its file extension"""
+    name = (filename or '').lower()
+    if name.endswith('.xlsx'):
+        return iter_xlsx_records(source)
+    if name.endswith('.csv') or name.endswith('.txt'):
+        return iter_csv_records(source)
+    raise ImportFormatError('Unsupported file type (use .csv or .xlsx)')
+
+
+def _flush(conn, columns, lines, batch, created_by, result):
+    """Validate one batch of raw rows and insert the valid ones in their own transaction"""
+    frame = pd.DataFrame(batch, columns=columns, dtype=object)
+    clean, masks = validate_patient_frame(frame)
+    rejected = rejected_rows(masks, len(frame))
+
+    if rejected.any():
+        positions = rejected.nonzero()[0]
+        room = max(0, MAX_REPORTED_ERRORS - len(result.errors))
+        messages = error_messages(masks, positions[:room])
+        for position, message in zip(positions[:room], messages):
+            result.errors.append((lines[position], message))
+        result.rejected += len(positions)
+        clean = clean[~rejected]
+    if clean.empty:
+        return
+
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        with deferred_insert_triggers(conn):
+            patient_ids = reserve_patient_ids(conn, len(clean))
+            conn.executemany(INSERT_PATIENT_SQL, [
+                (patient_id,) + row + (created_by,)
+                for patient_id, row in zip(patient_ids, frame_to_rows(clean, INSERT_COLUMNS))
+            ])
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    result.inserted += len(clean)
+    result.first_id = result.first_id or patient_ids[0]
+    result.last_id = patient_ids[-1]
+
+
+def import_patients(conn, records, created_by=None, batch_size=DEFAULT_IMPORT_BATCH_SIZE, progress=None):
+    """Validate and insert patients from ``(line, values)`` records; the first record is the header.
+
+    ``progress(result)`` is called after each batch.
+    """
+    started = datetime.now()
+    result = ImportResult()
+
+    records = iter(records)
+    try:
+        _, headers = next(records)
+    except StopIteration:
+        raise ImportFormatError('The file is empty')
+    width = len(headers)
+    # Only the columns present in the file are read; the schema treats the rest as blank
+    positions = column_positions(headers)
+    columns = list(positions)
+    pick = itemgetter(*positions.values())
+    padding = [''] * width
+
+    lines, batch = [], []
+    try:
+        for line, raw in records:
+            if not any(raw):
+                continue
+            lines.append(line)
+            if len(raw) < width:
+                raw = raw + padding[len(raw):]
+            batch.append(pick(raw))
+            if len(batch) >= batch_size:
+                _flush(conn, columns, lines, batch, created_by, result)
+                lines, batch = [], []
+                if progress:
+                    progress(result)
+        if batch:
+            _flush(conn, columns, lines, batch, created_by, result)
+            if progress:
+                progress(result)
+    finally:
+        result.seconds = (datetime.now() - started).total_seconds()
+    return result
@@ -0,0 +1,324 @@
+"""
+Background job runner backed by a SQLite ``background_jobs`` table.
+
+Long-running work (large PDF/Excel exports, ...) is handed to a small local
+thread pool. Job state and progress live in the database, so any gunicorn
+worker can answer status polls and serve finished artifacts, which are written
+to a shared directory and expire automatically: a sweeper thread in every
+process deletes them once past their TTL, and an expired artifact is never
+served even if the sweep has not reached it yet.
+
+The same sweeper stamps ``heartbeat_at`` on the jobs its process owns, and
+every progress write does too. A queued or running job whose heartbeat is
+older than the stale window belongs to a worker that died; it is failed so
+the work can be retried.
+
+The job threads share the gunicorn worker's GIL (and, with gevent workers,
+its event loop), so a CPU-bound PDF or Excel export slows the requests that
+worker is handling. Keep ``JOB_WORKERS`` low and the async thresholds high
+enough that only genuinely large exports end up here.
+"""
+import json
+import os
+import threading
+import time
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from utils.db import get_pool
+
+DEFAULT_WORKERS = 2
+DEFAULT_JOB_TTL = 3600                 # seconds a finished artifact is kept
+DEFAULT_SWEEP_INTERVAL = 15            # seconds between heartbeat/expiry sweeps (0 disables)
+DEFAULT_STALE_AFTER = 120              # seconds without a heartbeat before a job counts as dead
+PROGRESS_INTERVAL = 0.5                # min seconds between progress writes
+
+STATUS_QUEUED = 'queued'
+STATUS_RUNNING = 'running'
+STATUS_DONE = 'done'
+STATUS_FAILED = 'failed'
+STATUS_EXPIRED = 'expired'
+
+_settings = {'workers': DEFAULT_WORKERS, 'ttl': DEFAULT_JOB_TTL, 'sweep_interval': DEFAULT_SWEEP_INTERVAL,
+             'stale_after': DEFAULT_STALE_AFTER}
+_executor = None
+_executor_pid = None
+_executor_lock = threading.Lock()
+_sweeper_pid = None
+
+# Ids of the jobs queued or running in this process
+_active = set()
+
+
+def configure(workers=None, ttl=None, sweep_interval=None, stale_after=None):
+    """Set the worker count, artifact lifetime, sweep interval and stale window; starts the sweeper"""
+    if workers:
+        _settings['workers'] = workers
+    if ttl:
+        _settings['ttl'] = ttl
+    if sweep_interval is not None:
+        _settings['sweep_interval'] = sweep_interval
+    if stale_after:
+        _settings['stale_after'] = stale_after
+    _ensure_sweeper()
+
+
+def ensure_job_table(conn):
+    """Create the background_jobs table if missing (in the caller's transaction)"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS background_jobs (
+            id TEXT PRIMARY KEY,
+            kind TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'queued',
+            progress INTEGER NOT NULL DEFAULT 0,
+            total INTEGER,
+            message TEXT,
+            params TEXT,
+            result_path TEXT,
+            result_name TEXT,
+            error TEXT,
+            created_by INTEGER,
+            created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+            started_at TEXT,
+            finished_at TEXT,
+            expires_at TEXT
+        )
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_background_jobs_expires ON background_jobs(expires_at)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_background_jobs_status ON background_jobs(status)')
+
+
+def ensure_job_heartbeat(conn):
+    """Add the heartbeat_at column to background_jobs (in the caller's transaction)"""
+    columns = {row[1] for row in conn.execute('PRAGMA table_info(background_jobs)')}
+    if 'heartbeat_at' not in columns:
+        conn.execute('ALTER TABLE background_jobs ADD COLUMN heartbeat_at TEXT')
+
+
+def _now():
+    return datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+
+
+def _get_executor():
+    """Per-process executor, recreated after a fork"""
+    global _executor, _executor_pid
+    if _executor is None or _executor_pid != os.getpid():
+        with _executor_lock:
+            if _executor is None or _executor_pid != os.getpid():
+                _executor = ThreadPoolExecutor(max_workers=_settings['workers'],
+                                               thread_name_prefix='job')
+                _executor_pid = os.getpid()
+    _ensure_sweeper()
+    return _executor
+
+
+def _sweep_loop():
+    """Heartbeat this process's jobs and purge expired ones every sweep interval"""
+    while _settings['sweep_interval']:
+        time.sleep(_settings['sweep_interval'])
+        try:
+            conn = get_pool().acquire()
+            try:
+                active = list(_active)
+                if active:
+                    conn.execute(
+                        f"UPDATE background_jobs SET heartbeat_at = ? WHERE id IN ({', '.join(['?'] * len(active))})",
+                        [_now()] + active
+                    )
+                    conn.commit()
+                purge_expired_jobs(conn)
+            finally:
+                conn.close()
+        except Exception:
+            traceback.print_exc()
+
+
+def _ensure_sweeper():
+    """Start this process's sweeper thread (again after a fork)"""
+    global _sweeper_pid
+    if not _settings['sweep_interval'] or _sweeper_pid == os.getpid():
+        return
+    with _executor_lock:
+        if _sweeper_pid != os.getpid():
+            threading.Thread(target=_sweep_loop, name='job-sweeper', daemon=True).start()
+            _sweeper_pid = os.getpid()
+
+
+def update_job(job_id, **fields):
+    """Write job fields (and a fresh heartbeat) using a short-lived pooled connection"""
+    if not fields:
+        return
+    fields['heartbeat_at'] = _now()
+    assignments = ', '.join(f'{name} = ?' for name in fields)
+    conn = get_pool().acquire()
+    try:
+        conn.execute(f'UPDATE background_jobs SET {assignments} WHERE id = ?',
+                     list(fields.values()) + [job_id])
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def get_job(conn, job_id):
+    """Fetch one job row (or None)"""
+    _ensure_sweeper()
+    return conn.execute('SELECT * FROM background_jobs WHERE id = ?', (job_id,)).fetchone()
+
+
+def recent_jobs(conn, kinds, limit=10):
+    """Latest jobs of the given kinds, unfinished ones first"""
+    placeholders = ', '.join(['?'] * len(kinds))
+    return conn.execute(
+        f'SELECT * FROM background_jobs WHERE kind IN ({placeholders}) '
+        'ORDER BY status NOT IN (?, ?), created_at DESC LIMIT ?',
+        list(kinds) + [STATUS_QUEUED, STATUS_RUNNING, limit]
+    ).fetchall()
+
+
+def job_queue_depth(conn):
+    """Number of jobs waiting or running"""
+    return conn.execute(
+        'SELECT COUNT(*) FROM background_jobs WHERE status IN (?, ?)',
+        (STATUS_QUEUED, STATUS_RUNNING)
+    ).fetchone()[0]
+
+
+class JobContext:
+    """Handle passed to job functions for reporting progress"""
+
+    def __init__(self, job_id):
+        self.job_id = job_id
+        self.progress = 0
+        self._last_write = 0.0
+
+    def set_total(self, total):
+        update_job(self.job_id, total=total)
+
+    def report(self, progress, message=None, force=False):
+        """Record progress, throttled so frequent calls don't hammer the writer lock"""
+        self.progress = progress
+        now = time.monotonic()
+        if force or now - self._last_write >= PROGRESS_INTERVAL:
+            self._last_write = now
+            fields = {'progress': progress}
+            if message is not None:
+                fields['message'] = message
+            update_job(self.job_id, **fields)
+
+    def track(self, batches):
+        """Wrap an iterable of row batches, reporting rows seen so far"""
+        for batch in batches:
+            yield batch
+            self.report(self.progress + len(batch))
+
+
+def _run(job_id, func, args, kwargs):
+    """Execute a job function and record its outcome"""
+    context = JobContext(job_id)
+    try:
+        update_job(job_id, status=STATUS_RUNNING, started_at=_now())
+        result = func(context, *args, **kwargs) or {}
+    except Exception as e:
+        traceback.print_exc()
+        update_job(job_id, status=STATUS_FAILED, error=str(e), finished_at=_now(),
+                   expires_at=(datetime.now() + timedelta(seconds=_settings['ttl'])).strftime('%Y-%m-%d %H:%M:%S'))
+        return
+    finally:
+        _active.discard(job_id)
+    update_job(
+        job_id,
+        status=STATUS_DONE,
+        progress=context.progress,
+        result_path=result.get('path'),
+        result_name=result.get('name'),
+        message=result.get('message'),
+        finished_at=_now(),
+        expires_at=(datetime.now() + timedelta(seconds=_settings['ttl'])).strftime('%Y-%m-%d %H:%M:%S'),
+    )
+
+
+def submit_job(conn, kind, func, *args, created_by=None, params=None, **kwargs):
+    """Queue ``func(context, *args, **kwargs)`` on the worker pool; returns the job id.
+
+    ``func`` should return a dict with optional ``path``/``name`` of the
+    artifact it produced and a ``message``.
+    """
+    job_id = uuid.uuid4().hex
+    conn.execute(
+        'INSERT INTO background_jobs (id, kind, status, params, created_by, created_at, heartbeat_at) '
+        'VALUES (?, ?, ?, ?, ?, ?, ?)',
+        (job_id, kind, STATUS_QUEUED, json.dumps(params or {}), created_by, _now(), _now())
+    )
+    conn.commit()
+    _active.add(job_id)
+    _get_executor().submit(_run, job_id, func, args, kwargs)
+    return job_id
+
+
+def purge_expired_jobs(conn):
+    """Delete expired artifacts and mark their jobs expired; returns how many"""
+    # A failed job has no artifact to expire: it keeps its status, and only a
+    # stray result_path is cleared
+    rows = conn.execute(
+        'SELECT id, status, result_path FROM background_jobs WHERE expires_at <= ? '
+        'AND (status = ? OR (status = ? AND result_path IS NOT NULL))',
+        (_now(), STATUS_DONE, STATUS_FAILED)
+    ).fetchall()
+    for row in rows:
+        path = row['result_path']
+        if path and os.path.exists(path):
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+        status = STATUS_EXPIRED if row['status'] == STATUS_DONE else row['status']
+        conn.execute('UPDATE background_jobs SET status = ?, result_path = NULL WHERE id = ?',
+                     (status, row['id']))
+
+    conn.commit()
+    fail_stale_jobs(conn)
+    return len(rows)
+
+
+def fail_stale_jobs(conn):
+    """Fail queued/running jobs whose worker stopped heartbeating; returns how many"""
+    stale = (datetime.now() - timedelta(seconds=_settings['stale_after'])).strftime('%Y-%m-%d %H:%M:%S')
+    failed = conn.execute(
+        'UPDATE background_jobs SET status = ?, error = ?, finished_at = ?, expires_at = ? '
+        'WHERE status IN (?, ?) AND IFNULL(heartbeat_at, created_at) <= ?',
+        (STATUS_FAILED, 'Job was interrupted', _now(),
+         (datetime.now() + timedelta(seconds=_settings['ttl'])).strftime('%Y-%m-%d %H:%M:%S'),
+         STATUS_QUEUED, STATUS_RUNNING, stale)
+    ).rowcount
+    conn.commit()
+    return failed
+
+
+def is_expired(job):
+    """Whether a job's artifact is past its expiry (whether or not it was purged yet)"""
+    return job['status'] == STATUS_EXPIRED or bool(job['expires_at'] and job['expires_at'] <= _now())
+
+
+def job_to_dict(job):
+    """Public JSON view of a job row"""
+    total = job['total']
+    percent = None
+    if total:
+        percent = min(100, round(job['progress'] * 100 / total, 1))
+    elif job['status'] == STATUS_DONE:
+        percent = 100
+    return {
+        'id': job['id'],
+        'kind': job['kind'],
+        'status': STATUS_EXPIRED if job['status'] == STATUS_DONE and is_expired(job) else job['status'],
+        'progress': job['progress'],
+        'total': total,
+        'percent': percent,
+        'message': job['message'],
+        'error': job['error'],
+        'created_at': job['created_at'],
+        'finished_at': job['finished_at'],
+        'expires_at': job['expires_at'],
+    }
@@ -0,0 +1,204 @@
+"""
+Prometheus metrics exporter (``GET /metrics``).
+
+Request counts and latencies are recorded by this module's own request
+hooks, so they are kept with profiling switched off; query and template
+times come from the per-request profile when it is on (see
+utils/profiling.py). Pool and cache counters are pushed from each worker
+after every request. With several gunicorn workers, ``PROMETHEUS_MULTIPROC_DIR``
+must point at an empty, writable directory: prometheus_client then keeps
+every worker's values in memory-mapped files there and ``/metrics``
+aggregates them, whichever worker serves the scrape. gunicorn.conf.py sets
+this up and calls ``mark_worker_dead(worker.pid)`` from its ``child_exit``
+hook so a dead worker's live gauges are dropped.
+
+Database-wide values (SQLite page/freelist/WAL sizes, job queue depth,
+patients per category) are read from the database at scrape time.
+
+prometheus_client is optional; without it ``/metrics`` answers 501.
+"""
+import hmac
+import os
+import time
+
+try:
+    from prometheus_client import (CollectorRegistry, Counter, Gauge, Histogram, REGISTRY,
+                                   CONTENT_TYPE_LATEST, generate_latest, multiprocess)
+    from prometheus_client.core import GaugeMetricFamily
+    METRICS_AVAILABLE = True
+except ImportError:
+    METRICS_AVAILABLE = False
+
+from flask import g, request
+
+from utils import profiling
+from utils.cache import patient_cache_stats
+from utils.db import get_pool, pool_stats
+from utils.jobs import job_queue_depth
+from utils.stats import get_category_counts, TOTAL_DIMENSION
+
+NAMESPACE = 'oncobloom'
+
+REQUEST_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+QUERY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 5)
+QUERY_COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100)
+
+# Clients allowed to scrape when no METRICS_TOKEN is configured
+LOOPBACK_ADDRESSES = ('127.0.0.1', '::1')
+
+# patient_stats dimensions exported as gauges ('creator' is one series per user)
+CATEGORY_DIMENSIONS = ['status', 'stage', 'type', 'gender']
+
+if METRICS_AVAILABLE:
+    REQUEST_LATENCY = Histogram(
+        'http_request_duration_seconds', 'Request handling time by endpoint',
+        ['endpoint', 'method'], namespace=NAMESPACE, buckets=REQUEST_BUCKETS)
+    REQUESTS = Counter(
+        'http_requests', 'Requests handled by endpoint and status code',
+        ['endpoint', 'method', 'status'], namespace=NAMESPACE)
+    QUERY_LATENCY = Histogram(
+        'db_query_duration_seconds', 'SQL statement time (execute and fetch) by endpoint',
+        ['endpoint'], namespace=NAMESPACE, buckets=QUERY_BUCKETS)
+    QUERIES_PER_REQUEST = Histogram(
+        'db_queries_per_request', 'SQL statements run per request',
+        ['endpoint'], namespace=NAMESPACE, buckets=QUERY_COUNT_BUCKETS)
+    RENDER_LATENCY = Histogram(
+        'template_render_duration_seconds', 'Template rendering time by endpoint',
+        ['endpoint'], namespace=NAMESPACE, buckets=REQUEST_BUCKETS)
+
+    POOL_CONNECTIONS = Gauge(
+        'db_pool_connections', 'Pooled SQLite connections by state, summed over live workers',
+        ['state'], namespace=NAMESPACE, multiprocess_mode='livesum')
+    POOL_EVENTS = Counter(
+        'db_pool_events', 'Pool acquisitions, waits for a free connection and timeouts',
+        ['event'], namespace=NAMESPACE)
+    CACHE_LOOKUPS = Counter(
+        'cache_lookups', 'In-process cache lookups by cache and result',
+        ['cache', 'result'], namespace=NAMESPACE)
+
+# Counter values already pushed by this process: {(metric, labels): value}
+_pushed = {}
+
+
+def _push_delta(counter, key, labels, value):
+    """Increment a Prometheus counter by the growth of a cumulative local count"""
+    previous = _pushed.get(key, 0)
+    if value > previous:
+        counter.labels(*labels).inc(value - previous)
+    _pushed[key] = value
+
+
+def _start_request():
+    g._metrics_started = time.perf_counter()
+
+
+def _finish_request(response):
+    """Record one finished request, profiled or not"""
+    started = g.pop('_metrics_started', None)
+    if started is None:
+        return response
+    route = profiling.route_name()
+    REQUEST_LATENCY.labels(route, request.method).observe(time.perf_counter() - started)
+    REQUESTS.labels(route, request.method, str(response.status_code)).inc()
+
+    pool = pool_stats()
+    POOL_CONNECTIONS.labels('in_use').set(pool['in_use'])
+    POOL_CONNECTIONS.labels('idle').set(pool['idle'])
+    POOL_CONNECTIONS.labels('size').set(pool['size'])
+    for event in ('acquired', 'waits', 'timeouts'):
+        _push_delta(POOL_EVENTS, ('pool', event), (event,), pool[event])
+
+    for name, stats in patient_cache_stats().items():
+        for result, key in (('hit', 'hits'), ('miss', 'misses')):
+            _push_delta(CACHE_LOOKUPS, ('cache', name, result), (name, result), stats[key])
+    return response
+
+
+def _observe_profile(route, method, status, total_ms, profile):
+    """Profiling observer: query and template times of one finished request"""
+    query_latency = QUERY_LATENCY.labels(route)
+    for query in profile.queries:
+        query_latency.observe(query['ms'] / 1000)
+    QUERIES_PER_REQUEST.labels(route).observe(len(profile.queries))
+    if profile.render_ms:
+        RENDER_LATENCY.labels(route).observe(profile.render_ms / 1000)
+
+
+class DatabaseCollector:
+    """Database-wide gauges read at scrape time"""
+
+    def collect(self):
+        conn = get_pool().acquire()
+        try:
+            page_size = conn.execute('PRAGMA page_size').fetchone()[0]
+            page_count = conn.execute('PRAGMA page_count').fetchone()[0]
+            freelist = conn.execute('PRAGMA freelist_count').fetchone()[0]
+            queue_depth = job_queue_depth(conn)
+            counts = get_category_counts(conn)
+            database = get_pool().database
+        finally:
+            conn.close()
+
+        yield GaugeMetricFamily(f'{NAMESPACE}_sqlite_page_size_bytes', 'SQLite page size', value=page_size)
+        yield GaugeMetricFamily(f'{NAMESPACE}_sqlite_pages', 'Pages in the database file', value=page_count)
+        yield GaugeMetricFamily(f'{NAMESPACE}_sqlite_freelist_pages', 'Unused pages in the database file',
+                                value=freelist)
+        wal_path = f'{database}-wal'
+        wal_size = os.path.getsize(wal_path) if os.path.exists(wal_path) else 0
+        yield GaugeMetricFamily(f'{NAMESPACE}_sqlite_wal_bytes', 'Size of the write-ahead log file',
+                                value=wal_size)
+        yield GaugeMetricFamily(f'{NAMESPACE}_job_queue_depth', 'Background jobs queued or running',
+                                value=queue_depth)
+
+        patients = GaugeMetricFamily(f'{NAMESPACE}_patients', 'Patients by category (patient_stats)',
+                                     labels=['dimension', 'value'])
+        patients.add_metric([TOTAL_DIMENSION, ''], counts[TOTAL_DIMENSION])
+        for dimension in CATEGORY_DIMENSIONS:
+            for value, count in counts[dimension].items():
+                patients.add_metric([dimension, value], count)
+        yield patients
+
+
+def multiprocess_enabled():
+    return bool(os.environ.get('PROMETHEUS_MULTIPROC_DIR'))
+
+
+def render_metrics():
+    """(body, content type) of the Prometheus text exposition"""
+    if multiprocess_enabled():
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = CollectorRegistry()
+        registry.register(_ProcessCollector())
+    registry.register(DatabaseCollector())
+    return generate_latest(registry), CONTENT_TYPE_LATEST
+
+
+class _ProcessCollector:
+    """This process's metrics from the default registry (single-process mode)"""
+
+    def collect(self):
+        return REGISTRY.collect()
+
+
+def mark_worker_dead(pid):
+    """gunicorn child_exit hook: drop a dead worker's live gauges"""
+    if METRICS_AVAILABLE and multiprocess_enabled():
+        multiprocess.mark_process_dead(pid)
+
+
+def scrape_allowed(token):
+    """Bearer ``token`` when configured, otherwise only direct loopback clients"""
+    if token:
+        return hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}')
+    # A local reverse proxy also connects from loopback; it adds X-Forwarded-For
+    return request.remote_addr in LOOPBACK_ADDRESSES and 'X-Forwarded-For' not in request.headers
+
+
+def init_app(app):
+    """Record request metrics and feed request profiles into them"""
+    if METRICS_AVAILABLE:
+        app.before_request(_start_request)
+        app.after_request(_finish_request)
+        profiling.add_observer(_observe_profile)
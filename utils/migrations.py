@@ -0,0 +1,402 @@
+"""
+Versioned schema migrations for the patients database.
+
+The schema version is stored in ``PRAGMA user_version``. Each migration runs
+once, in order, in its own transaction together with the version bump, so a
+failed migration leaves the database at the previous version. Migrations
+only ever add or rename objects; nothing here drops user data.
+
+Data copies that can be arbitrarily large (e.g. moving ``patients_old`` rows
+into the current ``patients`` table) are not done inside a migration.
+Instead a migration *schedules* a backfill, which ``run_backfills`` then
+works through in batches of N rows, one short transaction per batch. The
+position reached is committed with each batch in ``schema_backfills``, so an
+interrupted backfill resumes where it stopped and the database is never
+locked for longer than one batch.
+"""
+import time
+
+from utils.search import ensure_search_index
+from utils.stats import ensure_patient_stats, ensure_data_version, rebuild_stat_dimension, DERIVED_DIMENSIONS
+from utils.jobs import ensure_job_table, ensure_job_heartbeat
+from utils.workload import ensure_appointment_stats, ensure_workload_indexes
+from utils.ids import ensure_patient_id_sequence, reserve_patient_ids
+
+DEFAULT_BACKFILL_BATCH_SIZE = 1000
+
+# Pause between backfill batches so request writers waiting on the lock get in
+BACKFILL_PAUSE = 0.05
+
+# Cancer stage recorded for legacy rows, which never captured one
+LEGACY_CANCER_STAGE = 'Unknown'
+
+
+class MigrationError(RuntimeError):
+    """Raised when the database is in a state a migration can't handle"""
+
+
+def table_exists(conn, name):
+    """Check whether a table (or virtual table) exists"""
+    row = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (name,)
+    ).fetchone()
+    return row is not None
+
+
+def _columns(conn, table):
+    return {row[1] for row in conn.execute(f'PRAGMA table_info({table})')}
+
+
+USERS_TABLE = '''
+    CREATE TABLE IF NOT EXISTS users (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        username VARCHAR(80) UNIQUE NOT NULL,
+        full_name VARCHAR(120),
+        password_hash VARCHAR(255) NOT NULL,
+        is_admin BOOLEAN DEFAULT FALSE,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+'''
+
+PATIENTS_TABLE = '''
+    CREATE TABLE IF NOT EXISTS patients (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        patient_id TEXT UNIQUE NOT NULL,
+        full_name TEXT NOT NULL,
+        age INTEGER NOT NULL,
+        gender TEXT NOT NULL,
+        blood_group TEXT,
+        contact_number TEXT,
+        email TEXT,
+        city TEXT,
+        state TEXT,
+        emergency_contact_name TEXT,
+        emergency_contact_number TEXT,
+        cancer_type TEXT NOT NULL,
+        cancer_stage TEXT NOT NULL,
+        tumor_size REAL,
+        metastasis TEXT,
+        diagnosis_date TEXT,
+        treatment_type TEXT,
+        treatment_phase TEXT,
+        chemo_cycles_planned INTEGER,
+        chemo_cycles_completed INTEGER,
+        radiation_sessions_planned INTEGER,
+        radiation_sessions_completed INTEGER,
+        surgery_status TEXT,
+        doctor_name TEXT,
+        hospital_name TEXT,
+        height REAL,
+        weight REAL,
+        bmi REAL,
+        blood_pressure TEXT,
+        heart_rate INTEGER,
+        risk_level TEXT,
+        current_status TEXT,
+        next_appointment TEXT,
+        created_by INTEGER,
+        created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (created_by) REFERENCES users (id)
+    )
+'''
+
+# Indexes matching the real query shapes. created_at is appended to the
+# equality columns so filtered listings can walk the index in
+# ORDER BY created_at DESC order (the rowid/id tiebreaker is implicit).
+QUERY_INDEXES = [
+    # /records, dashboard "recent patients", unfiltered exports
+    'CREATE INDEX IF NOT EXISTS idx_patients_created_at ON patients(created_at)',
+    # /records filters and the admin critical-patients list
+    'CREATE INDEX IF NOT EXISTS idx_patients_status_created ON patients(current_status, created_at)',
+    'CREATE INDEX IF NOT EXISTS idx_patients_type_created ON patients(cancer_type, created_at)',
+    'CREATE INDEX IF NOT EXISTS idx_patients_stage_created ON patients(cancer_stage, created_at)',
+    # Ownership checks, per-user patient counts, deleting a user's patients
+    'CREATE INDEX IF NOT EXISTS idx_patients_created_by ON patients(created_by, created_at)',
+    # Doctor/hospital grouping (PDF sections ORDER BY name, created_at DESC;
+    # hospital list, doctor picker)
+    'CREATE INDEX IF NOT EXISTS idx_patients_doctor_created ON patients(doctor_name, created_at DESC)',
+    'CREATE INDEX IF NOT EXISTS idx_patients_hospital_created ON patients(hospital_name, created_at DESC)',
+    # Analytics date ranges (covering for the monthly trend)
+    'CREATE INDEX IF NOT EXISTS idx_patients_diagnosis_date ON patients(diagnosis_date)',
+]
+
+# Superseded: patient_id already has the UNIQUE constraint's index and the
+# stage index is a prefix of idx_patients_stage_created
+REDUNDANT_INDEXES = ['idx_patients_patient_id', 'idx_patients_stage']
+
+
+def _base_tables(conn):
+    """users and the comprehensive patients table, moving a legacy patients table aside"""
+    conn.execute(USERS_TABLE)
+    # init_db.py used to create users with email instead of full_name
+    if 'full_name' not in _columns(conn, 'users'):
+        conn.execute('ALTER TABLE users ADD COLUMN full_name VARCHAR(120)')
+
+    if table_exists(conn, 'patients') and 'patient_id' not in _columns(conn, 'patients'):
+        # Pre-registry schema (user_id/name/status): keep its rows in
+        # patients_old; migration 6 copies them across
+        if table_exists(conn, 'patients_old'):
+            raise MigrationError('Both a legacy patients table and patients_old exist; '
+                                 'rename one of them before migrating')
+        conn.execute('ALTER TABLE patients RENAME TO patients_old')
+    conn.execute(PATIENTS_TABLE)
+
+
+def _query_indexes(conn):
+    """Composite indexes for listing, filter and analytics queries"""
+    for name in REDUNDANT_INDEXES:
+        # Only drop the patients index of that name, never patients_old's
+        row = conn.execute(
+            "SELECT tbl_name FROM sqlite_master WHERE type = 'index' AND name = ?", (name,)
+        ).fetchone()
+        if row and row[0] == 'patients':
+            conn.execute(f'DROP INDEX {name}')
+    for statement in QUERY_INDEXES:
+        conn.execute(statement)
+
+
+def _initial_schema(conn):
+    """Base tables and query indexes"""
+    _base_tables(conn)
+    _query_indexes(conn)
+
+
+def _job_table(conn):
+    """background_jobs table for exports and other long-running work"""
+    ensure_job_table(conn)
+
+
+def _patient_id_sequence(conn):
+    """Per-year patient ID sequences, seeded from existing IDs"""
+    ensure_patient_id_sequence(conn)
+
+
+def _patient_stats(conn):
+    """Trigger-maintained per-category patient counts"""
+    ensure_patient_stats(conn)
+
+
+def _search_index(conn):
+    """FTS5 search tables and their sync triggers (skipped without FTS5)"""
+    ensure_search_index(conn)
+
+
+def _schedule_legacy_patients(conn):
+    """Schedule copying patients_old rows into patients"""
+    if table_exists(conn, 'patients_old'):
+        schedule_backfill(conn, 'legacy_patients')
+
+
+def _creator_stats(conn):
+    """Per-user patient counts (patient_stats 'creator' dimension) and their triggers"""
+    ensure_patient_stats(conn)
+    rebuild_stat_dimension(conn, 'creator')
+
+
+def _analytics_stats(conn):
+    """Age bucket and diagnosis month counts (derived patient_stats dimensions) and their triggers"""
+    ensure_patient_stats(conn)
+    for dimension in DERIVED_DIMENSIONS:
+        rebuild_stat_dimension(conn, dimension)
+
+
+def _data_version(conn):
+    """Insert/change counters versioning the patients data for in-process caches"""
+    ensure_data_version(conn)
+
+
+def _workload(conn):
+    """Per-day appointment counts, treatment due-date and appointment indexes"""
+    ensure_appointment_stats(conn)
+    ensure_workload_indexes(conn)
+
+
+def _job_heartbeat(conn):
+    """Heartbeat column used to detect jobs orphaned by a dead worker"""
+    ensure_job_heartbeat(conn)
+
+
+def _user_listing_index(conn):
+    """Lets the admin user list (newest first) read users in order instead of sorting them"""
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_users_created_at ON users(created_at)')
+
+
+# (version, migration) in application order; never renumber or remove entries
+MIGRATIONS = [
+    (1, _initial_schema),
+    (2, _job_table),
+    (3, _patient_id_sequence),
+    (4, _patient_stats),
+    (5, _search_index),
+    (6, _schedule_legacy_patients),
+    (7, _creator_stats),
+    (8, _analytics_stats),
+    (9, _data_version),
+    (10, _workload),
+    (11, _job_heartbeat),
+    (12, _user_listing_index),
+]
+
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+
+def get_schema_version(conn):
+    """Current PRAGMA user_version"""
+    return conn.execute('PRAGMA user_version').fetchone()[0]
+
+
+def pending_migrations(conn):
+    """Migrations newer than the database's version"""
+    current = get_schema_version(conn)
+    return [(version, migration) for version, migration in MIGRATIONS if version > current]
+
+
+def _ensure_backfill_table(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS schema_backfills (
+            name TEXT PRIMARY KEY,
+            last_id INTEGER NOT NULL DEFAULT 0,
+            rows_copied INTEGER NOT NULL DEFAULT 0,
+            scheduled_at TEXT DEFAULT CURRENT_TIMESTAMP,
+            updated_at TEXT,
+            finished_at TEXT
+        )
+    ''')
+    conn.commit()
+
+
+def migrate(conn):
+    """Apply pending migrations; returns the versions applied"""
+    _ensure_backfill_table(conn)
+    applied = []
+    for version, migration in pending_migrations(conn):
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            # Another process may have applied it while we waited for the lock
+            if get_schema_version(conn) >= version:
+                conn.rollback()
+                continue
+            migration(conn)
+            conn.execute(f'PRAGMA user_version = {int(version)}')
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        applied.append(version)
+    return applied
+
+
+# ==================== BACKFILLS ====================
+
+def _copy_legacy_patients(conn, after_id, limit):
+    """Copy the next ``limit`` patients_old rows; returns (last id read, rows copied) or None when done.
+
+    Rows already present in patients (same name, diagnosis date and cancer
+    type, e.g. re-entered by hand) are skipped. patients_old itself is left
+    in place, so its notes column is not lost.
+    """
+    from utils.schema import deferred_insert_triggers
+
+    rows = conn.execute('''
+        SELECT o.id, o.name, o.age, o.gender, o.cancer_type, o.status, o.diagnosis_date,
+               (SELECT id FROM users WHERE id = o.user_id), o.created_at,
+               EXISTS (SELECT 1 FROM patients p
+                       WHERE p.diagnosis_date = o.diagnosis_date AND p.full_name = o.name
+                         AND p.cancer_type = o.cancer_type) AS migrated
+        FROM patients_old o
+        WHERE o.id > ?
+        ORDER BY o.id
+        LIMIT ?
+    ''', (after_id, limit)).fetchall()
+    if not rows:
+        return None
+
+    missing = [row for row in rows if not row[-1]]
+    if missing:
+        with deferred_insert_triggers(conn):
+            patient_ids = reserve_patient_ids(conn, len(missing))
+            conn.executemany('''
+                INSERT INTO patients (patient_id, full_name, age, gender, cancer_type, cancer_stage,
+                                      current_status, diagnosis_date, created_by, created_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, IFNULL(?, CURRENT_TIMESTAMP))
+            ''', [
+                (patient_id, name, age, gender, cancer_type, LEGACY_CANCER_STAGE,
+                 status, diagnosis_date, created_by, created_at)
+                for patient_id, (_, name, age, gender, cancer_type, status, diagnosis_date,
+                                 created_by, created_at, _) in zip(patient_ids, missing)
+            ])
+    return rows[-1][0], len(missing)
+
+
+# name -> step(conn, after_id, limit) -> (last id, rows copied) | None
+BACKFILLS = {
+    'legacy_patients': _copy_legacy_patients,
+}
+
+
+def schedule_backfill(conn, name):
+    """Queue a registered backfill (in the caller's transaction)"""
+    if name not in BACKFILLS:
+        raise MigrationError(f'Unknown backfill: {name}')
+    conn.execute('INSERT OR IGNORE INTO schema_backfills (name) VALUES (?)', (name,))
+
+
+def backfill_status(conn):
+    """All scheduled backfills, oldest first"""
+    return conn.execute(
+        'SELECT name, last_id, rows_copied, scheduled_at, updated_at, finished_at '
+        'FROM schema_backfills ORDER BY rowid'
+    ).fetchall()
+
+
+def pending_backfills(conn):
+    """Names of backfills that haven't finished"""
+    return [row[0] for row in conn.execute(
+        'SELECT name FROM schema_backfills WHERE finished_at IS NULL ORDER BY rowid'
+    )]
+
+
+def run_backfill(conn, name, batch_size=DEFAULT_BACKFILL_BATCH_SIZE, progress=None, pause=BACKFILL_PAUSE):
+    """Work through one backfill, one batch per transaction; returns rows copied by this call.
+
+    The batch and its new position commit together, so it is safe to stop
+    at any point and to run several copies at once (each batch re-reads the
+    position under the write lock). ``progress(name, last_id, copied)`` is
+    called after each batch.
+    """
+    step = BACKFILLS[name]
+    copied = 0
+    while True:
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            state = conn.execute(
+                'SELECT last_id, finished_at FROM schema_backfills WHERE name = ?', (name,)
+            ).fetchone()
+            if state is None or state[1]:
+                conn.rollback()
+                break
+            batch = step(conn, state[0], batch_size)
+            if batch is None:
+                conn.execute('UPDATE schema_backfills SET finished_at = CURRENT_TIMESTAMP, '
+                             'updated_at = CURRENT_TIMESTAMP WHERE name = ?', (name,))
+            else:
+                last_id, rows = batch
+                conn.execute('UPDATE schema_backfills SET last_id = ?, rows_copied = rows_copied + ?, '
+                             'updated_at = CURRENT_TIMESTAMP WHERE name = ?', (last_id, rows, name))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        if batch is None:
+            break
+        copied += rows
+        if progress:
+            progress(name, last_id, copied)
+        if pause:
+            time.sleep(pause)
+    return copied
+
+
+def run_backfills(conn, batch_size=DEFAULT_BACKFILL_BATCH_SIZE, progress=None, pause=BACKFILL_PAUSE):
+    """Run every pending backfill in scheduling order; returns {name: rows copied}"""
+    return {name: run_backfill(conn, name, batch_size, progress, pause) for name in pending_backfills(conn)}
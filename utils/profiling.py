@@ -0,0 +1,257 @@
+"""
+Per-request timing and SQL query profiling.
+
+While a request is being handled, every statement run through a pooled
+connection (see utils/db.py) is timed by ``ProfiledCursor``, including the
+time spent fetching its rows. At the end of the request the handler, database
+and template times are written to a ``Server-Timing`` header, added to a
+rolling per-route window for p50/p95/p99 reporting, and slow queries and
+requests are logged with their SQL (never their parameters, which can hold
+patient data).
+
+Connections used outside a request (background jobs, streamed exports) are
+not profiled.
+"""
+import logging
+import threading
+import time
+from collections import deque
+
+from flask import g, has_request_context, request, template_rendered, before_render_template
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SLOW_QUERY_MS = 100
+DEFAULT_SLOW_REQUEST_MS = 1000
+DEFAULT_ROUTE_WINDOW = 1000            # most recent requests kept per route
+
+_settings = {
+    'enabled': True,
+    'slow_query_ms': DEFAULT_SLOW_QUERY_MS,
+    'slow_request_ms': DEFAULT_SLOW_REQUEST_MS,
+}
+
+
+class RequestProfile:
+    """Queries and timings collected for one request"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = []
+        self.render_ms = 0.0
+        self._render_started = None
+
+    @property
+    def db_ms(self):
+        return sum(query['ms'] for query in self.queries)
+
+    @property
+    def rows(self):
+        return sum(query['rows'] for query in self.queries)
+
+    def record_query(self, sql, elapsed_ms):
+        query = {'sql': sql, 'ms': elapsed_ms, 'rows': 0}
+        self.queries.append(query)
+        return query
+
+
+class ProfiledCursor:
+    """Cursor wrapper timing execute and fetch calls into the request's profile"""
+
+    def __init__(self, cursor, profile):
+        self._cursor = cursor
+        self._profile = profile
+        self._query = None
+
+    def _timed(self, method, sql, *args):
+        start = time.perf_counter()
+        try:
+            method(sql, *args)
+        finally:
+            self._query = self._profile.record_query(sql, (time.perf_counter() - start) * 1000)
+        return self
+
+    def execute(self, sql, parameters=()):
+        return self._timed(self._cursor.execute, sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self._timed(self._cursor.executemany, sql, seq_of_parameters)
+
+    def executescript(self, sql_script):
+        return self._timed(self._cursor.executescript, sql_script)
+
+    def _fetch(self, method, *args):
+        start = time.perf_counter()
+        result = method(*args)
+        if self._query is not None:
+            self._query['ms'] += (time.perf_counter() - start) * 1000
+            if isinstance(result, list):
+                self._query['rows'] += len(result)
+            elif result is not None:
+                self._query['rows'] += 1
+        return result
+
+    def fetchone(self):
+        return self._fetch(self._cursor.fetchone)
+
+    def fetchmany(self, size=None):
+        return self._fetch(self._cursor.fetchmany, size or self._cursor.arraysize)
+
+    def fetchall(self):
+        return self._fetch(self._cursor.fetchall)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        row = self._fetch(self._cursor.fetchone)
+        if row is None:
+            raise StopIteration
+        return row
+
+    @property
+    def row_factory(self):
+        return self._cursor.row_factory
+
+    @row_factory.setter
+    def row_factory(self, factory):
+        self._cursor.row_factory = factory
+
+    def __getattr__(self, name):
+        # rowcount, lastrowid, description, close, ...
+        return getattr(self._cursor, name)
+
+
+def active_profile():
+    """The current request's profile, or None when not profiling"""
+    if not has_request_context():
+        return None
+    return g.get('_profile')
+
+
+class RouteStats:
+    """Rolling window of request timings per endpoint"""
+
+    def __init__(self, window=DEFAULT_ROUTE_WINDOW):
+        self.window = window
+        self._routes = {}
+        self._lock = threading.Lock()
+
+    def add(self, route, total_ms, db_ms, render_ms, queries):
+        with self._lock:
+            samples = self._routes.get(route)
+            if samples is None:
+                samples = self._routes[route] = {'count': 0, 'samples': deque(maxlen=self.window)}
+            samples['count'] += 1
+            samples['samples'].append((total_ms, db_ms, render_ms, queries))
+
+    def clear(self):
+        with self._lock:
+            self._routes.clear()
+
+    def snapshot(self):
+        """{route: {'count', 'p50', 'p95', 'p99', 'db_p95', ...}} slowest p95 first"""
+        with self._lock:
+            routes = {route: (entry['count'], list(entry['samples'])) for route, entry in self._routes.items()}
+        summary = {}
+        for route, (count, samples) in routes.items():
+            totals = sorted(sample[0] for sample in samples)
+            db_times = sorted(sample[1] for sample in samples)
+            summary[route] = {
+                'count': count,
+                'window': len(samples),
+                'p50': _percentile(totals, 50),
+                'p95': _percentile(totals, 95),
+                'p99': _percentile(totals, 99),
+                'max': round(totals[-1], 2),
+                'db_p50': _percentile(db_times, 50),
+                'db_p95': _percentile(db_times, 95),
+                'render_avg': round(sum(sample[2] for sample in samples) / len(samples), 2),
+                'queries_avg': round(sum(sample[3] for sample in samples) / len(samples), 2),
+            }
+        return dict(sorted(summary.items(), key=lambda item: -item[1]['p95']))
+
+
+def _percentile(sorted_values, percent):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    rank = max(0, min(len(sorted_values) - 1, -(-len(sorted_values) * percent // 100) - 1))
+    return round(sorted_values[int(rank)], 2)
+
+
+route_stats = RouteStats()
+
+# Callbacks run after every profiled request:
+# observer(route, method, status, total_ms, profile)
+_observers = []
+
+
+def add_observer(callback):
+    """Register a callback receiving each finished request's profile"""
+    _observers.append(callback)
+
+
+def route_name():
+    """Endpoint name for grouping (the URL rule for unmatched requests)"""
+    if request.url_rule is not None:
+        return request.endpoint or request.url_rule.rule
+    return '<unmatched>'
+
+
+def _start_request():
+    if _settings['enabled']:
+        g._profile = RequestProfile()
+
+
+def _start_render(sender, template, context, **extra):
+    profile = active_profile()
+    if profile is not None:
+        profile._render_started = time.perf_counter()
+
+
+def _finish_render(sender, template, context, **extra):
+    profile = active_profile()
+    if profile is not None and profile._render_started is not None:
+        profile.render_ms += (time.perf_counter() - profile._render_started) * 1000
+        profile._render_started = None
+
+
+def _finish_request(response):
+    profile = g.pop('_profile', None)
+    if profile is None:
+        return response
+
+    total_ms = (time.perf_counter() - profile.started) * 1000
+    db_ms = profile.db_ms
+    route = route_name()
+    route_stats.add(route, total_ms, db_ms, profile.render_ms, len(profile.queries))
+
+    response.headers.add('Server-Timing', f'db;dur={db_ms:.1f};desc="{len(profile.queries)} queries"')
+    response.headers.add('Server-Timing', f'tpl;dur={profile.render_ms:.1f}')
+    response.headers.add('Server-Timing', f'app;dur={total_ms:.1f}')
+
+    for observer in _observers:
+        observer(route, request.method, response.status_code, total_ms, profile)
+
+    for query in profile.queries:
+        if query['ms'] >= _settings['slow_query_ms']:
+            logger.warning('Slow query on %s: %.1f ms, %d rows: %s',
+                           route, query['ms'], query['rows'], ' '.join(query['sql'].split()))
+    if total_ms >= _settings['slow_request_ms']:
+        logger.warning('Slow request %s %s (%s): %.1f ms total, %.1f ms in %d queries, %.1f ms rendering',
+                       request.method, request.path, route, total_ms, db_ms, len(profile.queries),
+                       profile.render_ms)
+    return response
+
+
+def init_app(app):
+    """Register the profiling hooks and read settings from the Flask config"""
+    _settings['enabled'] = app.config.get('PROFILING_ENABLED', True)
+    _settings['slow_query_ms'] = app.config.get('SLOW_QUERY_MS', DEFAULT_SLOW_QUERY_MS)
+    _settings['slow_request_ms'] = app.config.get('SLOW_REQUEST_MS', DEFAULT_SLOW_REQUEST_MS)
+    route_stats.window = app.config.get('PROFILING_ROUTE_WINDOW', DEFAULT_ROUTE_WINDOW)
+    app.before_request(_start_request)
+    app.after_request(_finish_request)
+    before_render_template.connect(_start_render, app)
+    template_rendered.connect(_finish_render, app)
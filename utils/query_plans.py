@@ -0,0 +1,133 @@
+"""
+EXPLAIN QUERY PLAN regression check for the hot patient queries.
+
+Each entry mirrors a query shape issued by a route. ``check_query_plans``
+asks SQLite how it would run them and flags full table scans of ``patients``
+and, unless the query is known to need one, temporary sort B-trees. Run it
+via ``flask check-query-plans`` against a real database after schema or query
+changes; tests/test_query_plans.py checks the SQL the routes actually issue.
+"""
+import re
+
+from utils.workload import overdue_queries
+
+LISTING_COLUMNS = '''id, patient_id, full_name, age, gender, cancer_type, cancer_stage,
+                     current_status, diagnosis_date, doctor_name, created_at'''
+
+CURSOR = ('2026-01-01 00:00:00', 1000)
+
+# (name, sql, params, temp B-tree allowed)
+ROUTE_QUERIES = [
+    ('records: first page',
+     f'SELECT {LISTING_COLUMNS} FROM patients ORDER BY created_at DESC, id DESC LIMIT ?',
+     (26,), False),
+    ('records: next page',
+     f'SELECT {LISTING_COLUMNS} FROM patients WHERE (created_at, id) < (?, ?) '
+     'ORDER BY created_at DESC, id DESC LIMIT ?',
+     CURSOR + (26,), False),
+    ('records: previous page',
+     f'SELECT {LISTING_COLUMNS} FROM patients WHERE (created_at, id) > (?, ?) '
+     'ORDER BY created_at ASC, id ASC LIMIT ?',
+     CURSOR + (26,), False),
+    ('records: status filter',
+     f'SELECT {LISTING_COLUMNS} FROM patients WHERE current_status = ? '
+     'ORDER BY created_at DESC, id DESC LIMIT ?',
+     ('Critical', 26), False),
+    ('records: cancer type filter, next page',
+     f'SELECT {LISTING_COLUMNS} FROM patients WHERE cancer_type = ? AND (created_at, id) < (?, ?) '
+     'ORDER BY created_at DESC, id DESC LIMIT ?',
+     ('Lung Cancer',) + CURSOR + (26,), False),
+    ('records: stage filter',
+     f'SELECT {LISTING_COLUMNS} FROM patients WHERE cancer_stage = ? '
+     'ORDER BY created_at DESC, id DESC LIMIT ?',
+     ('Stage IV', 26), False),
+    ('records: filtered count',
+     'SELECT COUNT(*) FROM patients WHERE current_status = ? AND cancer_type = ?',
+     ('Critical', 'Lung Cancer'), False),
+    ('dashboard: recent patients',
+     'SELECT * FROM patients ORDER BY created_at DESC LIMIT 5',
+     (), False),
+    ('edit/delete record: owned patient',
+     'SELECT * FROM patients WHERE id = ? AND created_by = ?',
+     (1, 1), False),
+    ('patient lookup by patient_id',
+     'SELECT id FROM patients WHERE patient_id = ?',
+     ('ONC-2026-0001',), False),
+    ('admin: user list with patient counts',
+     "SELECT u.id, IFNULL(s.count, 0) AS patient_count FROM users u "
+     "LEFT JOIN patient_stats s ON s.dimension = 'creator' AND s.value = CAST(u.id AS TEXT) "
+     'ORDER BY u.created_at DESC, u.id DESC LIMIT ? OFFSET ?',
+     (25, 0), False),
+    ('admin: delete user patients (one batch)',
+     'DELETE FROM patients WHERE id IN (SELECT id FROM patients WHERE created_by = ? LIMIT ?)',
+     (0, 2000), False),
+    ('admin: reassign user patients (one batch)',
+     'UPDATE patients SET created_by = ? WHERE id IN (SELECT id FROM patients WHERE created_by = ? LIMIT ?)',
+     (1, 0, 2000), False),
+    ('admin dashboard: critical patients',
+     "SELECT * FROM patients WHERE cancer_stage = 'Stage IV' OR current_status = 'Critical' "
+     'ORDER BY created_at DESC LIMIT 10',
+     (), True),
+    ('bulk operations: doctor picker',
+     'SELECT DISTINCT doctor_name FROM patients WHERE doctor_name IS NOT NULL',
+     (), False),
+    ('bulk operations: stage doctor filter',
+     'SELECT id FROM patients WHERE doctor_name = ?',
+     ('Dr. Smith',), False),
+    ('bulk operations: filtered page',
+     f'SELECT {LISTING_COLUMNS} FROM patients WHERE doctor_name = ? AND (created_at, id) < (?, ?) '
+     'ORDER BY created_at DESC, id DESC LIMIT ?',
+     ('Dr. Smith',) + CURSOR + (51,), True),
+    ('manage hospitals: patients per hospital',
+     'SELECT hospital_name, COUNT(*) AS patient_count FROM patients WHERE hospital_name IS NOT NULL '
+     'GROUP BY hospital_name ORDER BY patient_count DESC',
+     (), True),
+    ('export: grouped by hospital',
+     'SELECT patient_id, full_name, hospital_name FROM patients ORDER BY hospital_name, created_at DESC',
+     (), False),
+    ('export: grouped by doctor',
+     'SELECT patient_id, full_name, doctor_name FROM patients ORDER BY doctor_name, created_at DESC',
+     (), False),
+    ('analytics: maintained counts',
+     'SELECT dimension, value, count FROM patient_stats WHERE count > 0 ORDER BY dimension, value',
+     (), False),
+    ('workload: appointments per day and hospital',
+     'SELECT day, hospital_name AS name, SUM(count) AS count FROM appointment_stats '
+     'WHERE day BETWEEN ? AND ? AND count > 0 GROUP BY day, hospital_name',
+     ('2026-01-01', '2026-03-31'), False),
+    ('workload: appointments on one day',
+     'SELECT id, full_name FROM patients WHERE next_appointment >= ? AND next_appointment < ? '
+     'ORDER BY next_appointment, id LIMIT ?',
+     ('2026-01-01', '2026-01-02', 200), False),
+    ('workload: patients behind on chemo (count)',
+     overdue_queries('chemo')[0], ('2026-01-01',), False),
+    ('workload: patients behind on chemo (most overdue)',
+     overdue_queries('chemo')[1], ('2026-01-01', 25), False),
+    ('workload: patients behind on radiation (count)',
+     overdue_queries('radiation')[0], ('2026-01-01',), False),
+    ('workload: patients behind on radiation (most overdue)',
+     overdue_queries('radiation')[1], ('2026-01-01', 25), False),
+]
+
+FULL_SCAN = re.compile(r'^SCAN (patients|p)\b(?! USING)')
+TEMP_BTREE = 'USE TEMP B-TREE'
+
+
+def explain(conn, sql, params=()):
+    """Plan detail lines for a query"""
+    return [row[3] for row in conn.execute(f'EXPLAIN QUERY PLAN {sql}', params)]
+
+
+def check_query_plans(conn, queries=None):
+    """Return (name, plan, problems) for every query; problems is empty when the plan is fine"""
+    results = []
+    for name, sql, params, allow_temp_btree in queries or ROUTE_QUERIES:
+        plan = explain(conn, sql, params)
+        problems = []
+        for detail in plan:
+            if FULL_SCAN.match(detail):
+                problems.append(f'full table scan: {detail}')
+            elif TEMP_BTREE in detail and not allow_temp_btree:
+                problems.append(f'unexpected sort: {detail}')
+        results.append((name, plan, problems))
+    return results
@@ -0,0 +1,60 @@
+"""
+Schema bootstrap for the patients database.
+
+``ensure_schema`` applies the versioned migrations in ``utils.migrations`` and
+detects optional features (FTS5) for this process. Safe to run on every
+startup. Also home to helpers that temporarily reshape the schema for bulk
+loads.
+"""
+from contextlib import contextmanager
+
+from utils import search, stats, workload
+from utils.search import detect_search_index
+from utils.migrations import migrate, table_exists
+
+
+def ensure_schema(conn):
+    """Bring the database up to the current schema version; returns the versions applied"""
+    # Tables, indexes, triggers and derived tables, tracked in PRAGMA user_version
+    applied = migrate(conn)
+
+    # Full-text search is optional (SQLite may lack FTS5)
+    detect_search_index(conn)
+    return applied
+
+
+# Derived tables maintained by per-row INSERT triggers: (trigger names, set-based catch-up)
+_INSERT_SYNCS = [
+    (search.INSERT_TRIGGERS, search.index_patients_since),
+    (stats.INSERT_TRIGGERS, stats.count_patients_since),
+    (stats.VERSION_INSERT_TRIGGERS, stats.count_inserts_since),
+    (workload.INSERT_TRIGGERS, workload.count_appointments_since),
+]
+
+
+@contextmanager
+def deferred_insert_triggers(conn):
+    """Swap the per-row INSERT triggers on patients for one set-based pass.
+
+    Use inside a write transaction (BEGIN IMMEDIATE) around a bulk INSERT:
+    the triggers are dropped, and on exit the rows added since entry are
+    pushed into the search index and patient_stats before the triggers are
+    recreated. DDL is transactional, so a rollback restores everything and
+    other connections never see the triggers missing.
+    """
+    min_id = conn.execute('SELECT IFNULL(MAX(id), 0) FROM patients').fetchone()[0]
+    suspended = []
+    for names, sync in _INSERT_SYNCS:
+        placeholders = ', '.join(['?'] * len(names))
+        definitions = conn.execute(
+            f"SELECT name, sql FROM sqlite_master WHERE type = 'trigger' AND name IN ({placeholders})", names
+        ).fetchall()
+        for name, _ in definitions:
+            conn.execute(f'DROP TRIGGER {name}')
+        if definitions:
+            suspended.append((sync, definitions))
+    yield
+    for sync, definitions in suspended:
+        sync(conn, min_id)
+        for _, sql in definitions:
+            conn.execute(sql)
@@ -0,0 +1,214 @@
+"""
+Full-text patient search backed by SQLite FTS5.
+
+Two external-content indexes mirror the searchable ``patients`` columns:
+
+* ``patients_fts``      - unicode61 tokens with prefix indexes, for word/prefix
+                          search ranked with bm25
+* ``patients_trigram``  - trigram tokens, for substring search (what the old
+                          ``LIKE '%q%'`` filter matched)
+
+Both are kept in sync by triggers, so writers never have to touch them.
+"""
+import re
+import sqlite3
+
+SEARCH_COLUMNS = ['full_name', 'patient_id', 'cancer_type', 'cancer_stage',
+                  'doctor_name', 'current_status']
+
+# bm25 column weights, same order as SEARCH_COLUMNS
+SEARCH_WEIGHTS = [10.0, 10.0, 2.0, 1.0, 3.0, 1.0]
+
+FTS_TABLES = {
+    'patients_fts': "tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3'",
+    'patients_trigram': "tokenize = 'trigram'",
+}
+
+MIN_TRIGRAM_LENGTH = 3
+
+# Set once the index has been verified for this process
+FTS_ENABLED = False
+
+
+# Per-row triggers fired by INSERT (suspended during bulk loads)
+INSERT_TRIGGERS = [f'{table}_ai' for table in FTS_TABLES]
+
+
+def _column_list(prefix=''):
+    return ', '.join(f'{prefix}{column}' for column in SEARCH_COLUMNS)
+
+
+def _trigger_statements(table):
+    """Triggers keeping an external-content FTS table in sync with patients"""
+    columns = _column_list()
+    new_values = _column_list('new.')
+    old_values = _column_list('old.')
+    return [
+        f'''CREATE TRIGGER IF NOT EXISTS {table}_ai AFTER INSERT ON patients BEGIN
+                INSERT INTO {table}(rowid, {columns}) VALUES (new.id, {new_values});
+            END''',
+        f'''CREATE TRIGGER IF NOT EXISTS {table}_ad AFTER DELETE ON patients BEGIN
+                INSERT INTO {table}({table}, rowid, {columns}) VALUES ('delete', old.id, {old_values});
+            END''',
+        f'''CREATE TRIGGER IF NOT EXISTS {table}_au AFTER UPDATE OF {columns} ON patients BEGIN
+                INSERT INTO {table}({table}, rowid, {columns}) VALUES ('delete', old.id, {old_values});
+                INSERT INTO {table}(rowid, {columns}) VALUES (new.id, {new_values});
+            END''',
+    ]
+
+
+def ensure_search_index(conn):
+    """Create the FTS tables and triggers if missing, backfilling new tables.
+
+    Runs in the caller's transaction. Returns True when full-text search is
+    usable on this connection.
+    """
+    global FTS_ENABLED
+    columns = {row[1] for row in conn.execute('PRAGMA table_info(patients)')}
+    if not set(SEARCH_COLUMNS) <= columns:
+        FTS_ENABLED = False
+        return False
+
+    created = []
+    conn.execute('SAVEPOINT search_index')
+    try:
+        for table, options in FTS_TABLES.items():
+            exists = conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)
+            ).fetchone()
+            if not exists:
+                conn.execute(f'''
+                    CREATE VIRTUAL TABLE {table} USING fts5(
+                        {_column_list()},
+                        content = 'patients', content_rowid = 'id', {options}
+                    )
+                ''')
+                created.append(table)
+            for statement in _trigger_statements(table):
+                conn.execute(statement)
+        # New indexes start empty; fill them from the existing rows
+        for table in created:
+            conn.execute(f"INSERT INTO {table}({table}) VALUES ('rebuild')")
+    except sqlite3.OperationalError:
+        # SQLite built without FTS5 (or trigram) - fall back to LIKE
+        conn.execute('ROLLBACK TO search_index')
+        conn.execute('RELEASE search_index')
+        FTS_ENABLED = False
+        return False
+    conn.execute('RELEASE search_index')
+
+    FTS_ENABLED = True
+    return True
+
+
+def detect_search_index(conn):
+    """Enable full-text search for this process if the FTS tables exist"""
+    global FTS_ENABLED
+    placeholders = ', '.join(['?'] * len(FTS_TABLES))
+    found = conn.execute(
+        f"SELECT COUNT(*) FROM sqlite_master WHERE type = 'table' AND name IN ({placeholders})",
+        list(FTS_TABLES)
+    ).fetchone()[0]
+    FTS_ENABLED = found == len(FTS_TABLES)
+    return FTS_ENABLED
+
+
+def rebuild_search_index(conn):
+    """Rebuild both FTS indexes from the patients table and optimize them"""
+    ensure_search_index(conn)
+    for table in FTS_TABLES:
+        conn.execute(f"INSERT INTO {table}({table}) VALUES ('rebuild')")
+        conn.execute(f"INSERT INTO {table}({table}) VALUES ('optimize')")
+    conn.commit()
+    return conn.execute('SELECT COUNT(*) FROM patients').fetchone()[0]
+
+
+def index_patients_since(conn, min_id):
+    """Add patients with id > min_id to both FTS indexes in one pass (bulk loads)"""
+    columns = _column_list()
+    for table in FTS_TABLES:
+        conn.execute(f'INSERT INTO {table}(rowid, {columns}) SELECT id, {columns} FROM patients WHERE id > ?',
+                     (min_id,))
+
+
+def prefix_query(text):
+    """Turn free text into an FTS5 query where every word is a prefix term"""
+    tokens = re.findall(r'\w+', text or '', re.UNICODE)
+    return ' '.join(f'"{token}"*' for token in tokens)
+
+
+def trigram_query(text):
+    """Quote free text as a single FTS5 string for substring matching"""
+    text = (text or '').strip()
+    if len(text) < MIN_TRIGRAM_LENGTH:
+        return ''
+    return '"' + text.replace('"', '""') + '"'
+
+
+def search_condition(text, column='id'):
+    """SQL condition restricting ``column`` to patients matching ``text``.
+
+    Matches words by prefix and, for 3+ characters, any substring.
+    Falls back to the original LIKE scan when FTS5 is unavailable.
+    """
+    if not FTS_ENABLED:
+        like_columns = ' OR '.join(f'{name} LIKE ?' for name in SEARCH_COLUMNS)
+        return f'({like_columns})', [f'%{text}%'] * len(SEARCH_COLUMNS)
+
+    subqueries = []
+    params = []
+    prefix = prefix_query(text)
+    if prefix:
+        subqueries.append('SELECT rowid FROM patients_fts WHERE patients_fts MATCH ?')
+        params.append(prefix)
+    trigram = trigram_query(text)
+    if trigram:
+        subqueries.append('SELECT rowid FROM patients_trigram WHERE patients_trigram MATCH ?')
+        params.append(trigram)
+    if not subqueries:
+        # Nothing searchable (e.g. only punctuation) - match nothing
+        return '0', []
+    return f"{column} IN ({' UNION '.join(subqueries)})", params
+
+
+def search_patients(conn, text, limit=20, substring=True):
+    """Return best matches for ``text`` ordered by bm25 relevance.
+
+    With ``substring`` the prefix matches are topped up from the trigram index.
+    """
+    limit = max(1, min(int(limit), 100))
+    columns = 'p.id, p.patient_id, p.full_name, p.cancer_type, p.cancer_stage, p.current_status, p.doctor_name'
+
+    if not FTS_ENABLED:
+        condition, params = search_condition(text, 'p.id')
+        return conn.execute(
+            f'SELECT {columns} FROM patients p WHERE {condition} ORDER BY p.created_at DESC LIMIT ?',
+            params + [limit]
+        ).fetchall()
+
+    weights = ', '.join(str(weight) for weight in SEARCH_WEIGHTS)
+    prefix = prefix_query(text)
+    rows = []
+    if prefix:
+        rows = conn.execute(f'''
+            SELECT {columns}, bm25(patients_fts, {weights}) AS rank
+            FROM patients_fts JOIN patients p ON p.id = patients_fts.rowid
+            WHERE patients_fts MATCH ?
+            ORDER BY rank
+            LIMIT ?
+        ''', (prefix, limit)).fetchall()
+
+    # Top up with substring matches (e.g. "0042" inside a patient ID)
+    trigram = trigram_query(text)
+    if substring and trigram and len(rows) < limit:
+        seen = [row['id'] for row in rows]
+        placeholders = ','.join('?' * len(seen))
+        exclude = f'AND p.id NOT IN ({placeholders})' if seen else ''
+        rows += conn.execute(f'''
+            SELECT {columns}, bm25(patients_trigram, {weights}) AS rank
+            FROM patients_trigram JOIN patients p ON p.id = patients_trigram.rowid
+            WHERE patients_trigram MATCH ? {exclude}
+            ORDER BY rank
+            LIMIT ?
+        ''', [trigram] + seen + [limit - len(rows)]).fetchall()
+    return rows
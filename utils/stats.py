@@ -0,0 +1,289 @@
+"""
+Patient statistics service.
+
+Per-category patient counts live in the ``patient_stats`` summary table, which
+SQLite triggers keep up to date on every INSERT/UPDATE/DELETE of ``patients``.
+Reading a distribution is therefore O(#categories) instead of a table scan.
+Besides plain columns, derived values (age bucket, diagnosis month) are
+maintained the same way for the analytics page (see utils/analytics.py).
+
+The dashboard snapshot built from it is additionally cached per process,
+keyed on the ``patient_data_version`` counters so a write in any process
+invalidates it.
+"""
+from utils.cache import patient_cache
+
+DASHBOARD_STATS_TTL = 30
+
+_dashboard_cache = patient_cache(maxsize=1, ttl=DASHBOARD_STATS_TTL, name='dashboard')
+
+# Summary dimension -> patients column
+STAT_DIMENSIONS = {
+    'status': 'current_status',
+    'stage': 'cancer_stage',
+    'type': 'cancer_type',
+    'gender': 'gender',
+    # Per-user patient counts for the admin user list (value is the user id)
+    'creator': 'created_by',
+}
+
+# Derived summary dimension -> (source columns, SQL expression over a row
+# prefix such as 'new.'), materialized for the analytics page
+AGE_GROUP_EXPRESSION = '''CASE
+        WHEN {row}age < 18 THEN 'Under 18'
+        WHEN {row}age BETWEEN 18 AND 35 THEN '18-35'
+        WHEN {row}age BETWEEN 36 AND 50 THEN '36-50'
+        WHEN {row}age BETWEEN 51 AND 65 THEN '51-65'
+        ELSE 'Over 65'
+    END'''
+DERIVED_DIMENSIONS = {
+    'age_group': (['age'], AGE_GROUP_EXPRESSION),
+    'diagnosis_month': (['diagnosis_date'], "strftime('%Y-%m', {row}diagnosis_date)"),
+}
+
+# Pseudo-dimension holding the overall row count
+TOTAL_DIMENSION = 'total'
+
+
+def _dimensions():
+    """(dimension, source columns, expression template) for every maintained dimension"""
+    for dimension, column in STAT_DIMENSIONS.items():
+        yield dimension, [column], '{row}' + column
+    for dimension, (columns, expression) in DERIVED_DIMENSIONS.items():
+        yield dimension, columns, expression
+
+
+def _stat_trigger_statements():
+    """Triggers maintaining patient_stats from writes to patients"""
+    statements = [
+        f'''CREATE TRIGGER IF NOT EXISTS patient_stats_total_ai AFTER INSERT ON patients BEGIN
+                INSERT INTO patient_stats(dimension, value, count) VALUES ('{TOTAL_DIMENSION}', '', 1)
+                ON CONFLICT(dimension, value) DO UPDATE SET count = count + 1;
+            END''',
+        f'''CREATE TRIGGER IF NOT EXISTS patient_stats_total_ad AFTER DELETE ON patients BEGIN
+                UPDATE patient_stats SET count = count - 1
+                WHERE dimension = '{TOTAL_DIMENSION}' AND value = '';
+            END''',
+    ]
+    for dimension, columns, expression in _dimensions():
+        new_value = expression.format(row='new.')
+        old_value = expression.format(row='old.')
+        increment = f'''INSERT INTO patient_stats(dimension, value, count)
+                VALUES ('{dimension}', IFNULL({new_value}, ''), 1)
+                ON CONFLICT(dimension, value) DO UPDATE SET count = count + 1;'''
+        decrement = f'''UPDATE patient_stats SET count = count - 1
+                WHERE dimension = '{dimension}' AND value = IFNULL({old_value}, '');'''
+        statements += [
+            f'''CREATE TRIGGER IF NOT EXISTS patient_stats_{dimension}_ai AFTER INSERT ON patients BEGIN
+                {increment}
+            END''',
+            f'''CREATE TRIGGER IF NOT EXISTS patient_stats_{dimension}_ad AFTER DELETE ON patients BEGIN
+                {decrement}
+            END''',
+            f'''CREATE TRIGGER IF NOT EXISTS patient_stats_{dimension}_au AFTER UPDATE OF {', '.join(columns)} ON patients
+            WHEN ({old_value}) IS NOT ({new_value}) BEGIN
+                {decrement}
+                {increment}
+            END''',
+        ]
+    return statements
+
+
+# Per-row triggers fired by INSERT (suspended during bulk loads)
+INSERT_TRIGGERS = ['patient_stats_total_ai'] + [
+    f'patient_stats_{dimension}_ai' for dimension in list(STAT_DIMENSIONS) + list(DERIVED_DIMENSIONS)
+]
+
+
+# Write counters for patients: 'inserts' is bumped by every INSERT, 'changes'
+# by every UPDATE and DELETE. Together they version the patient data for
+# caches that can append new rows but must be rebuilt after edits.
+VERSION_TRIGGERS = {
+    'patient_data_version_ai': 'AFTER INSERT ON patients BEGIN UPDATE patient_data_version SET inserts = inserts + 1',
+    'patient_data_version_au': 'AFTER UPDATE ON patients BEGIN UPDATE patient_data_version SET changes = changes + 1',
+    'patient_data_version_ad': 'AFTER DELETE ON patients BEGIN UPDATE patient_data_version SET changes = changes + 1',
+}
+
+# Per-row version trigger fired by INSERT (suspended during bulk loads)
+VERSION_INSERT_TRIGGERS = ['patient_data_version_ai']
+
+
+def ensure_data_version(conn):
+    """Create the patient_data_version counters and their triggers (in the caller's transaction)"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS patient_data_version (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            inserts INTEGER NOT NULL DEFAULT 0,
+            changes INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+    conn.execute('INSERT OR IGNORE INTO patient_data_version (id) VALUES (1)')
+    for name, body in VERSION_TRIGGERS.items():
+        conn.execute(f'CREATE TRIGGER IF NOT EXISTS {name} {body}; END')
+
+
+def get_data_version(conn):
+    """(inserts, changes) write counters of the patients table"""
+    row = conn.execute('SELECT inserts, changes FROM patient_data_version WHERE id = 1').fetchone()
+    return (row[0], row[1]) if row else (0, 0)
+
+
+def count_inserts_since(conn, min_id):
+    """Bump the insert counter for patients with id > min_id (bulk loads)"""
+    conn.execute('UPDATE patient_data_version SET inserts = inserts + (SELECT COUNT(*) FROM patients WHERE id > ?)',
+                 (min_id,))
+
+
+def _value_expression(dimension):
+    """patient_stats value of a dimension for a plain SELECT over patients"""
+    if dimension in DERIVED_DIMENSIONS:
+        expression = DERIVED_DIMENSIONS[dimension][1].format(row='')
+    else:
+        expression = STAT_DIMENSIONS[dimension]
+    return f"IFNULL(CAST({expression} AS TEXT), '')"
+
+
+def _expected_stats_query(where=''):
+    """GROUP BY query producing what patient_stats should contain"""
+    parts = [f"SELECT '{TOTAL_DIMENSION}', '', COUNT(*) FROM patients {where}"]
+    for dimension, _, _ in _dimensions():
+        parts.append(
+            f"SELECT '{dimension}', {_value_expression(dimension)}, COUNT(*) FROM patients {where} GROUP BY 2"
+        )
+    return ' UNION ALL '.join(parts)
+
+
+def ensure_patient_stats(conn):
+    """Create patient_stats and its triggers, backfilling a new table (in the caller's transaction)"""
+    exists = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'patient_stats'"
+    ).fetchone()
+    if not exists:
+        conn.execute('''
+            CREATE TABLE patient_stats (
+                dimension TEXT NOT NULL,
+                value TEXT NOT NULL,
+                count INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (dimension, value)
+            ) WITHOUT ROWID
+        ''')
+        conn.execute(f'INSERT INTO patient_stats(dimension, value, count) {_expected_stats_query()}')
+    for statement in _stat_trigger_statements():
+        conn.execute(statement)
+
+
+def rebuild_stat_dimension(conn, dimension):
+    """Recount one dimension of patient_stats (in the caller's transaction)"""
+    conn.execute('DELETE FROM patient_stats WHERE dimension = ?', (dimension,))
+    conn.execute(f'''
+        INSERT INTO patient_stats(dimension, value, count)
+        SELECT ?, {_value_expression(dimension)}, COUNT(*) FROM patients GROUP BY 2
+    ''', (dimension,))
+
+
+def rebuild_patient_stats(conn):
+    """Recompute patient_stats from scratch in one transaction"""
+    if not conn.in_transaction:
+        conn.execute('BEGIN IMMEDIATE')
+    try:
+        conn.execute('DELETE FROM patient_stats')
+        conn.execute(f'INSERT INTO patient_stats(dimension, value, count) {_expected_stats_query()}')
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+
+def count_patients_since(conn, min_id):
+    """Add patients with id > min_id to patient_stats in one grouped pass (bulk loads)"""
+    conn.execute(f'''
+        INSERT INTO patient_stats(dimension, value, count)
+        SELECT * FROM ({_expected_stats_query('WHERE id > ?')}) WHERE true
+        ON CONFLICT(dimension, value) DO UPDATE SET count = count + excluded.count
+    ''', [min_id] * (len(STAT_DIMENSIONS) + len(DERIVED_DIMENSIONS) + 1))
+
+
+def check_patient_stats(conn):
+    """Compare patient_stats with a fresh scan.
+
+    Returns a list of (dimension, value, stored, actual) mismatches.
+    """
+    actual = {(row[0], row[1]): row[2] for row in conn.execute(_expected_stats_query())}
+    stored = {
+        (row[0], row[1]): row[2]
+        for row in conn.execute('SELECT dimension, value, count FROM patient_stats WHERE count != 0')
+    }
+    mismatches = []
+    for key in sorted(set(actual) | set(stored)):
+        if actual.get(key, 0) != stored.get(key, 0):
+            mismatches.append((key[0], key[1], stored.get(key, 0), actual.get(key, 0)))
+    return mismatches
+
+
+def get_category_counts(conn):
+    """All maintained counts as {'total': n, 'status': {...}, 'stage': {...}, ...}"""
+    counts = {dimension: {} for dimension in list(STAT_DIMENSIONS) + list(DERIVED_DIMENSIONS)}
+    counts[TOTAL_DIMENSION] = 0
+    rows = conn.execute('''
+        SELECT dimension, value, count FROM patient_stats
+        WHERE count > 0
+        ORDER BY dimension, value
+    ''').fetchall()
+    for row in rows:
+        if row['dimension'] == TOTAL_DIMENSION:
+            counts[TOTAL_DIMENSION] = row['count']
+        elif row['dimension'] in counts:
+            counts[row['dimension']][row['value']] = row['count']
+    return counts
+
+
+def get_total_patients(conn):
+    """O(1) patient count from the summary table"""
+    row = conn.execute(
+        'SELECT count FROM patient_stats WHERE dimension = ? AND value = ?', (TOTAL_DIMENSION, '')
+    ).fetchone()
+    return row['count'] if row else 0
+
+
+def compute_dashboard_stats(conn):
+    """Compute every dashboard counter from the maintained summary table"""
+    counts = get_category_counts(conn)
+    stage_distribution = counts['stage']
+    status_distribution = counts['status']
+
+    # Same rule as the old LIKE '%Treatment%' (case-insensitive) filter
+    active_cases = sum(count for status, count in status_distribution.items()
+                       if 'treatment' in status.lower())
+
+    recent_patients = conn.execute('''
+        SELECT * FROM patients 
+        ORDER BY created_at DESC 
+        LIMIT 5
+    ''').fetchall()
+
+    return {
+        'total_patients': counts[TOTAL_DIMENSION],
+        'active_cases': active_cases,
+        'stage_iv_patients': stage_distribution.get('Stage IV', 0),
+        'recovered_patients': status_distribution.get('Recovered', 0),
+        'recent_patients': [dict(row) for row in recent_patients],
+        'stage_distribution': stage_distribution,
+        'status_distribution': dict(sorted(status_distribution.items(), key=lambda item: -item[1])),
+    }
+
+
+def get_dashboard_stats(conn):
+    """Return (snapshot, cache_hit) for the dashboard"""
+    # Read before computing, so a concurrent write can only make the entry fresher
+    key = get_data_version(conn)
+    snapshot = _dashboard_cache.get(key)
+    if snapshot is not None:
+        return snapshot, True
+    snapshot = compute_dashboard_stats(conn)
+    _dashboard_cache.set(key, snapshot)
+    return snapshot, False
+
+
+def dashboard_cache_stats():
+    """Hit/miss counters of the dashboard snapshot cache"""
+    return _dashboard_cache.stats()
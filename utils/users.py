@@ -0,0 +1,51 @@
+"""
+User listing for the admin panels.
+
+Per-user patient counts come from the trigger-maintained ``creator``
+dimension of ``patient_stats`` (see utils/stats.py), so a page of users costs
+one indexed lookup per user instead of counting that user's patients.
+"""
+USERS_PER_PAGE = 25
+
+# Sort key -> ORDER BY expression
+USER_SORTS = {
+    'username': 'u.username COLLATE NOCASE',
+    'full_name': 'u.full_name COLLATE NOCASE',
+    'role': 'u.is_admin',
+    'patients': 'patient_count',
+    'created': 'u.created_at',
+}
+
+USER_LIST_QUERY = '''
+    SELECT u.id, u.username, u.full_name, u.is_admin, u.created_at,
+           IFNULL(s.count, 0) AS patient_count
+    FROM users u
+    LEFT JOIN patient_stats s ON s.dimension = 'creator' AND s.value = CAST(u.id AS TEXT)
+'''
+
+
+def _search_condition(search):
+    return ' WHERE u.username LIKE ? OR u.full_name LIKE ?', [f'%{search}%'] * 2
+
+
+def list_users(conn, sort='created', descending=True, search='', limit=USERS_PER_PAGE, offset=0):
+    """One page of users with their patient counts"""
+    order = USER_SORTS.get(sort, USER_SORTS['created'])
+    direction = 'DESC' if descending else 'ASC'
+    query = USER_LIST_QUERY
+    params = []
+    if search:
+        condition, params = _search_condition(search)
+        query += condition
+    query += f' ORDER BY {order} {direction}, u.id {direction} LIMIT ? OFFSET ?'
+    return conn.execute(query, params + [limit, offset]).fetchall()
+
+
+def get_user_totals(conn, search=''):
+    """{'total', 'admins', 'matching'} user counts"""
+    row = conn.execute('SELECT COUNT(*), IFNULL(SUM(is_admin), 0) FROM users').fetchone()
+    totals = {'total': row[0], 'admins': row[1], 'matching': row[0]}
+    if search:
+        condition, params = _search_condition(search)
+        totals['matching'] = conn.execute(f'SELECT COUNT(*) FROM users u{condition}', params).fetchone()[0]
+    return totals
@@ -0,0 +1,313 @@
+"""
+Declarative patient schema shared by the forms and bulk loads.
+
+Every patient field is described once (type, label, required, limits). The
+schema can then be applied in two modes:
+
+* ``validate_patient``       - one submitted form/mapping at a time, returning
+                               coerced values or the first error message
+* ``validate_patient_frame`` - a pandas DataFrame of raw text columns at once,
+                               returning coerced columns plus boolean error
+                               masks, so imports don't pay per-row overhead
+
+Both modes apply the same rules and produce the same messages. Optional
+numeric fields that don't parse become NULL, as the original forms did.
+"""
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+INT_PATTERN = r'[+-]?\d+'
+
+
+class Field:
+    """A free-text patient field"""
+
+    def __init__(self, name, label, required=False):
+        self.name = name
+        self.label = label
+        self.required = required
+
+    def clean(self, value, now):
+        """Coerce one non-empty value; raise ValueError(message) to reject it"""
+        return value
+
+    def clean_column(self, column, present, now):
+        """Coerce a column of raw strings; returns (values, [(message, mask), ...])"""
+        return column.where(present, None), []
+
+
+class IntField(Field):
+    """Whole number; ``strict`` fields reject bad input instead of storing NULL"""
+
+    def __init__(self, name, label, required=False, strict=False, min_value=None, max_value=None):
+        super().__init__(name, label, required)
+        self.strict = strict or required
+        self.min_value = min_value
+        self.max_value = max_value
+
+    @property
+    def invalid_message(self):
+        return f'{self.label} must be a valid number'
+
+    @property
+    def range_message(self):
+        return f'Please enter a valid {self.label.lower()} ({self.min_value}-{self.max_value})'
+
+    def _out_of_range(self, value):
+        return ((self.min_value is not None and value < self.min_value)
+                or (self.max_value is not None and value > self.max_value))
+
+    def clean(self, value, now):
+        try:
+            value = int(value)
+        except ValueError:
+            if self.strict:
+                raise ValueError(self.invalid_message)
+            return None
+        if self.strict and self._out_of_range(value):
+            raise ValueError(self.range_message)
+        return value
+
+    def clean_column(self, column, present, now):
+        valid = present & column.str.fullmatch(INT_PATTERN).fillna(False).astype(bool)
+        values = pd.to_numeric(column.where(valid), errors='coerce').astype('Int64')
+        if not self.strict:
+            return values, []
+        masks = [(self.invalid_message, (present & ~valid).to_numpy())]
+        out_of_range = np.zeros(len(column), dtype=bool)
+        if self.min_value is not None:
+            out_of_range |= (values < self.min_value).fillna(False).to_numpy(dtype=bool)
+        if self.max_value is not None:
+            out_of_range |= (values > self.max_value).fillna(False).to_numpy(dtype=bool)
+        masks.append((self.range_message, out_of_range))
+        return values, masks
+
+
+class FloatField(Field):
+    """Decimal measurement; unparseable input is stored as NULL"""
+
+    def clean(self, value, now):
+        try:
+            return float(value)
+        except ValueError:
+            return None
+
+    def clean_column(self, column, present, now):
+        return pd.to_numeric(column.where(present), errors='coerce').astype('float64'), []
+
+
+class DateField(Field):
+    """YYYY-MM-DD date, optionally not in the future and within ``max_years_ago``"""
+
+    def __init__(self, name, label, required=False, allow_future=True, max_years_ago=None):
+        super().__init__(name, label, required)
+        self.allow_future = allow_future
+        self.max_years_ago = max_years_ago
+
+    @property
+    def invalid_message(self):
+        return f'Please enter a valid {self.label.lower()} (YYYY-MM-DD format)'
+
+    @property
+    def future_message(self):
+        return f'{self.label.capitalize()} cannot be in the future'
+
+    @property
+    def past_message(self):
+        return f'{self.label.capitalize()} cannot be more than {self.max_years_ago} years in the past'
+
+    def _earliest(self, now):
+        return now.replace(year=now.year - self.max_years_ago)
+
+    def clean(self, value, now):
+        try:
+            parsed = datetime.strptime(value, '%Y-%m-%d')
+        except ValueError:
+            raise ValueError(self.invalid_message)
+        if not self.allow_future and parsed > now:
+            raise ValueError(self.future_message)
+        if self.max_years_ago is not None and parsed < self._earliest(now):
+            raise ValueError(self.past_message)
+        return parsed.strftime('%Y-%m-%d')
+
+    def clean_column(self, column, present, now):
+        parsed = pd.to_datetime(column.where(present), format='%Y-%m-%d', errors='coerce')
+        masks = [(self.invalid_message, (present & parsed.isna()).to_numpy())]
+        if not self.allow_future:
+            masks.append((self.future_message, (parsed > now).to_numpy(dtype=bool)))
+        if self.max_years_ago is not None:
+            masks.append((self.past_message, (parsed < self._earliest(now)).to_numpy(dtype=bool)))
+        return parsed.dt.strftime('%Y-%m-%d').astype(object).where(parsed.notna(), None), masks
+
+
+PATIENT_FIELDS = [
+    Field('full_name', 'Full Name', required=True),
+    IntField('age', 'Age', required=True, min_value=1, max_value=150),
+    Field('gender', 'Gender', required=True),
+    Field('blood_group', 'Blood Group'),
+    Field('contact_number', 'Contact Number'),
+    Field('email', 'Email'),
+    Field('city', 'City'),
+    Field('state', 'State'),
+    Field('emergency_contact_name', 'Emergency Contact Name'),
+    Field('emergency_contact_number', 'Emergency Contact Number'),
+    Field('cancer_type', 'Cancer Type', required=True),
+    Field('cancer_stage', 'Cancer Stage', required=True),
+    FloatField('tumor_size', 'Tumor Size'),
+    Field('metastasis', 'Metastasis'),
+    DateField('diagnosis_date', 'Diagnosis Date', required=True, allow_future=False, max_years_ago=100),
+    Field('treatment_type', 'Treatment Type'),
+    Field('treatment_phase', 'Treatment Phase'),
+    IntField('chemo_cycles_planned', 'Chemo Cycles Planned'),
+    IntField('chemo_cycles_completed', 'Chemo Cycles Completed'),
+    IntField('radiation_sessions_planned', 'Radiation Sessions Planned'),
+    IntField('radiation_sessions_completed', 'Radiation Sessions Completed'),
+    Field('surgery_status', 'Surgery Status'),
+    Field('doctor_name', 'Doctor Name'),
+    Field('hospital_name', 'Hospital Name'),
+    FloatField('height', 'Height'),
+    FloatField('weight', 'Weight'),
+    Field('blood_pressure', 'Blood Pressure'),
+    IntField('heart_rate', 'Heart Rate'),
+    Field('risk_level', 'Risk Level'),
+    Field('current_status', 'Current Status', required=True),
+    Field('next_appointment', 'Next Appointment'),
+]
+
+PATIENT_SCHEMA = {field.name: field for field in PATIENT_FIELDS}
+
+# Column names in schema order (the patients INSERT column order)
+PATIENT_COLUMNS = [field.name for field in PATIENT_FIELDS]
+
+REQUIRED_FIELDS = {field.name: field.label for field in PATIENT_FIELDS if field.required}
+
+MISSING_PREFIX = 'Required fields missing: '
+
+
+def _select(names):
+    return PATIENT_FIELDS if names is None else [PATIENT_SCHEMA[name] for name in names]
+
+
+def calculate_bmi(height, weight):
+    """BMI from height (cm) and weight (kg), or None when either is missing"""
+    if not height or not weight:
+        return None
+    return round(weight / ((height / 100) ** 2), 2)
+
+
+def calculate_bmi_column(height, weight):
+    """Vectorized calculate_bmi over two float columns"""
+    valid = height.notna() & weight.notna() & (height != 0) & (weight != 0)
+    bmi = (weight / ((height / 100) ** 2)).round(2)
+    return bmi.where(valid)
+
+
+def validate_patient(data, fields=None, aliases=None):
+    """Validate one submission (e.g. ``request.form``) against the schema.
+
+    ``fields`` limits validation to those columns (default: all) and
+    ``aliases`` maps a column to the form key it is posted under. Returns
+    ``(values, None)`` with coerced values - plus ``bmi`` when height and
+    weight are part of the schema - or ``(None, message)``.
+    """
+    fields = _select(fields)
+    aliases = aliases or {}
+    now = datetime.now()
+
+    raw = {}
+    for field in fields:
+        value = data.get(aliases.get(field.name, field.name))
+        raw[field.name] = value.strip() if isinstance(value, str) else ('' if value is None else str(value))
+
+    missing = [field.label for field in fields if field.required and not raw[field.name]]
+    if missing:
+        return None, MISSING_PREFIX + ', '.join(missing)
+
+    values = {}
+    for field in fields:
+        value = raw[field.name]
+        if not value:
+            values[field.name] = None
+            continue
+        try:
+            values[field.name] = field.clean(value, now)
+        except ValueError as e:
+            return None, str(e)
+
+    if 'height' in values and 'weight' in values:
+        values['bmi'] = calculate_bmi(values['height'], values['weight'])
+    return values, None
+
+
+def _text_column(column):
+    """Stripped object-dtype strings, '' for missing (cheaper than the .str accessor)"""
+    values = column.to_numpy(dtype=object)
+    try:
+        # Files read as text: every cell is already a str
+        values = [value.strip() for value in values]
+    except AttributeError:
+        values = [value.strip() if isinstance(value, str) else ('' if pd.isna(value) else str(value))
+                  for value in values]
+    return pd.Series(values, index=column.index, dtype=object)
+
+
+def validate_patient_frame(frame, fields=None):
+    """Validate a DataFrame of raw text columns in one vectorized pass.
+
+    Missing columns are treated as blank. Returns ``(clean, masks)``: the
+    coerced frame (plus ``bmi`` when height and weight are included) and an
+    ordered list of ``(message, boolean array)`` marking rejected rows, in
+    the order ``validate_patient`` checks them. Use ``rejected_rows`` and
+    ``error_messages`` to turn the masks into a filter and per-row messages.
+    """
+    fields = _select(fields)
+    now = datetime.now()
+    blank = pd.Series('', index=frame.index, dtype=object)
+
+    clean = {}
+    required_masks = []
+    rule_masks = []
+    for field in fields:
+        column = _text_column(frame[field.name]) if field.name in frame else blank
+        present = column != ''
+        if field.required:
+            required_masks.append((MISSING_PREFIX + field.label, (~present).to_numpy()))
+        clean[field.name], masks = field.clean_column(column, present, now)
+        rule_masks.extend(masks)
+
+    clean = pd.DataFrame(clean, index=frame.index)
+    if 'height' in clean and 'weight' in clean:
+        clean['bmi'] = calculate_bmi_column(clean['height'], clean['weight'])
+    return clean, required_masks + rule_masks
+
+
+def rejected_rows(masks, length):
+    """Boolean array of rows failing any rule"""
+    rejected = np.zeros(length, dtype=bool)
+    for _, mask in masks:
+        rejected |= mask
+    return rejected
+
+
+def error_messages(masks, positions):
+    """The message ``validate_patient`` would give for each row position"""
+    messages = []
+    for position in positions:
+        missing = [message[len(MISSING_PREFIX):] for message, mask in masks
+                   if mask[position] and message.startswith(MISSING_PREFIX)]
+        if missing:
+            messages.append(MISSING_PREFIX + ', '.join(missing))
+            continue
+        messages.append(next(message for message, mask in masks if mask[position]))
+    return messages
+
+
+def frame_to_rows(clean, columns):
+    """Plain Python rows (None for missing values) ready for executemany"""
+    values = []
+    for column in columns:
+        series = clean[column].astype(object)
+        values.append(series.where(series.notna(), None).tolist())
+    return zip(*values)
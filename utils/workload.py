@@ -0,0 +1,302 @@
+"""
+Scheduling workload: appointments per day and patients behind on treatment.
+
+Appointment load is counted per (day, hospital, doctor) in the
+``appointment_stats`` summary table, which triggers on ``patients`` keep up
+to date the same way as ``patient_stats`` (see utils/stats.py). The 90-day
+calendar is therefore a primary-key range read of a few thousand rows,
+however many patients there are.
+
+Being behind on chemo cycles or radiation sessions depends on today's date,
+so it cannot be precounted. Instead, the due date of each patient's next
+cycle/session (diagnosis date + start delay + completed x cadence) is the key
+of a partial expression index over unfinished courses. Overdue patients are
+then an index range scan up to today, most overdue first.
+"""
+from datetime import date, timedelta
+
+from utils.cache import patient_cache
+from utils.stats import get_data_version
+
+WORKLOAD_DAYS = 90
+WORKLOAD_TTL = 30
+
+# Expected treatment cadence, counted from the diagnosis date
+TREATMENT_START_DAYS = 14
+CHEMO_CYCLE_DAYS = 21
+RADIATION_SESSIONS_PER_WEEK = 5
+# A course counts as behind once its next session is this many days overdue
+OVERDUE_GRACE_DAYS = 7
+
+# Patients expected to be receiving treatment
+TREATMENT_STATUSES = ('Active Treatment', 'Critical')
+
+BEHIND_LIMIT = 25
+DAY_LIST_LIMIT = 200
+
+_workload_cache = patient_cache(maxsize=64, ttl=WORKLOAD_TTL, name='workload')
+
+# course -> (label, completed, planned, days after the start when session n+1 is due)
+COURSES = {
+    'chemo': ('Chemotherapy cycles', 'IFNULL(chemo_cycles_completed, 0)', 'chemo_cycles_planned',
+              f'IFNULL(chemo_cycles_completed, 0) * {CHEMO_CYCLE_DAYS}'),
+    'radiation': ('Radiation sessions', 'IFNULL(radiation_sessions_completed, 0)', 'radiation_sessions_planned',
+                  f'IFNULL(radiation_sessions_completed, 0) * 7 / {RADIATION_SESSIONS_PER_WEEK}'),
+}
+
+_STATUS_LIST = ', '.join(f"'{status}'" for status in TREATMENT_STATUSES)
+
+
+def _due_expression(course):
+    """Date the next session of a course is due (the indexed expression)"""
+    offset = COURSES[course][3]
+    return f"date(diagnosis_date, '+' || ({TREATMENT_START_DAYS} + {offset}) || ' days')"
+
+
+def _pending_condition(course):
+    """Unfinished course (the partial index's WHERE)"""
+    _, completed, planned, _ = COURSES[course]
+    # Written planned-first: SQLite only matches the partial index to this exact form
+    return f'{planned} > {completed}'
+
+
+# Keyed on the due date, with status and hospital alongside so counts stay in the index
+TREATMENT_INDEXES = [
+    f'CREATE INDEX IF NOT EXISTS idx_patients_{course}_due '
+    f'ON patients({_due_expression(course)}, current_status, hospital_name) '
+    f'WHERE {_pending_condition(course)}'
+    for course in COURSES
+]
+
+# Day drill-down: appointments on one day
+APPOINTMENT_INDEX = 'CREATE INDEX IF NOT EXISTS idx_patients_next_appointment ON patients(next_appointment)'
+
+
+# ==================== APPOINTMENT COUNTS ====================
+
+def _appointment_key(row):
+    return (f"date({row}next_appointment)", f"IFNULL({row}hospital_name, '')", f"IFNULL({row}doctor_name, '')")
+
+
+def _appointment_trigger_statements():
+    """Triggers maintaining appointment_stats from writes to patients"""
+    new_day, new_hospital, new_doctor = _appointment_key('new.')
+    old_day, old_hospital, old_doctor = _appointment_key('old.')
+    increment = f'''INSERT INTO appointment_stats(day, hospital_name, doctor_name, count)
+                SELECT {new_day}, {new_hospital}, {new_doctor}, 1 WHERE {new_day} IS NOT NULL
+                ON CONFLICT(day, hospital_name, doctor_name) DO UPDATE SET count = count + 1;'''
+    # A NULL day matches no row
+    decrement = f'''UPDATE appointment_stats SET count = count - 1
+                WHERE day = {old_day} AND hospital_name = {old_hospital} AND doctor_name = {old_doctor};'''
+    return [
+        f'''CREATE TRIGGER IF NOT EXISTS appointment_stats_ai AFTER INSERT ON patients BEGIN
+                {increment}
+            END''',
+        f'''CREATE TRIGGER IF NOT EXISTS appointment_stats_ad AFTER DELETE ON patients BEGIN
+                {decrement}
+            END''',
+        f'''CREATE TRIGGER IF NOT EXISTS appointment_stats_au
+            AFTER UPDATE OF next_appointment, hospital_name, doctor_name ON patients
+            WHEN {old_day} IS NOT {new_day} OR {old_hospital} IS NOT {new_hospital}
+                OR {old_doctor} IS NOT {new_doctor} BEGIN
+                {decrement}
+                {increment}
+            END''',
+    ]
+
+
+# Per-row trigger fired by INSERT (suspended during bulk loads)
+INSERT_TRIGGERS = ['appointment_stats_ai']
+
+
+def _expected_appointments_query(where=''):
+    """GROUP BY query producing what appointment_stats should contain"""
+    day, hospital, doctor = _appointment_key('')
+    condition = f'{where} AND' if where else 'WHERE'
+    return f'''SELECT {day}, {hospital}, {doctor}, COUNT(*) FROM patients
+               {condition} {day} IS NOT NULL GROUP BY 1, 2, 3'''
+
+
+def ensure_appointment_stats(conn):
+    """Create appointment_stats and its triggers, backfilling a new table (in the caller's transaction)"""
+    exists = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'appointment_stats'"
+    ).fetchone()
+    if not exists:
+        conn.execute('''
+            CREATE TABLE appointment_stats (
+                day TEXT NOT NULL,
+                hospital_name TEXT NOT NULL,
+                doctor_name TEXT NOT NULL,
+                count INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (day, hospital_name, doctor_name)
+            ) WITHOUT ROWID
+        ''')
+        conn.execute(f'INSERT INTO appointment_stats(day, hospital_name, doctor_name, count) '
+                     f'{_expected_appointments_query()}')
+    for statement in _appointment_trigger_statements():
+        conn.execute(statement)
+
+
+def ensure_workload_indexes(conn):
+    """Due-date and appointment indexes for the workload report"""
+    for statement in TREATMENT_INDEXES + [APPOINTMENT_INDEX]:
+        conn.execute(statement)
+
+
+def count_appointments_since(conn, min_id):
+    """Add patients with id > min_id to appointment_stats in one grouped pass (bulk loads)"""
+    conn.execute(f'''
+        INSERT INTO appointment_stats(day, hospital_name, doctor_name, count)
+        {_expected_appointments_query('WHERE id > ?')}
+        ON CONFLICT(day, hospital_name, doctor_name) DO UPDATE SET count = count + excluded.count
+    ''', (min_id,))
+
+
+def check_appointment_stats(conn):
+    """Compare appointment_stats with a fresh scan.
+
+    Returns a list of ((day, hospital, doctor), stored, actual) mismatches.
+    """
+    actual = {(row[0], row[1], row[2]): row[3] for row in conn.execute(_expected_appointments_query())}
+    stored = {
+        (row[0], row[1], row[2]): row[3]
+        for row in conn.execute('SELECT day, hospital_name, doctor_name, count FROM appointment_stats WHERE count != 0')
+    }
+    return [(key, stored.get(key, 0), actual.get(key, 0))
+            for key in sorted(set(actual) | set(stored)) if actual.get(key, 0) != stored.get(key, 0)]
+
+
+def rebuild_appointment_stats(conn):
+    """Recompute appointment_stats from scratch in one transaction"""
+    if not conn.in_transaction:
+        conn.execute('BEGIN IMMEDIATE')
+    try:
+        conn.execute('DELETE FROM appointment_stats')
+        conn.execute(f'INSERT INTO appointment_stats(day, hospital_name, doctor_name, count) '
+                     f'{_expected_appointments_query()}')
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+
+# ==================== REPORT ====================
+
+def get_appointment_calendar(conn, start, days=WORKLOAD_DAYS, group='hospital', hospital=None):
+    """Appointments per day and hospital (or doctor) for ``days`` days from ``start``.
+
+    Returns (columns, rows): column names by total load, busiest first, and
+    one {'day', 'weekday', 'counts', 'total'} row per calendar day.
+    """
+    column = 'doctor_name' if group == 'doctor' else 'hospital_name'
+    end = start + timedelta(days=days - 1)
+    sql = f'''SELECT day, {column} AS name, SUM(count) AS count FROM appointment_stats
+              WHERE day BETWEEN ? AND ? AND count > 0'''
+    params = [start.isoformat(), end.isoformat()]
+    if hospital:
+        sql += ' AND hospital_name = ?'
+        params.append(hospital)
+    sql += f' GROUP BY day, {column}'
+
+    by_day, totals = {}, {}
+    for row in conn.execute(sql, params):
+        by_day.setdefault(row['day'], {})[row['name']] = row['count']
+        totals[row['name']] = totals.get(row['name'], 0) + row['count']
+    columns = sorted(totals, key=lambda name: (-totals[name], name))
+
+    rows = []
+    for offset in range(days):
+        day = start + timedelta(days=offset)
+        counts = by_day.get(day.isoformat(), {})
+        rows.append({'day': day.isoformat(), 'weekday': day.strftime('%a'),
+                     'counts': [counts.get(name, 0) for name in columns], 'total': sum(counts.values())})
+    return columns, rows
+
+
+def overdue_queries(course, by_hospital=False):
+    """(count SQL, most-overdue-first page SQL) for patients behind on ``course``.
+
+    Parameters: the due-date cutoff, then the hospital when ``by_hospital``
+    (and the LIMIT for the page).
+    """
+    _, completed, planned, _ = COURSES[course]
+    due = _due_expression(course)
+    # Unary + keeps the planner off the status/hospital indexes and on the due-date one
+    where = f'{_pending_condition(course)} AND {due} <= ? AND +current_status IN ({_STATUS_LIST})'
+    if by_hospital:
+        where += ' AND +hospital_name = ?'
+    count_sql = f'SELECT COUNT(*) FROM patients WHERE {where}'
+    page_sql = f'''SELECT id, patient_id, full_name, cancer_type, current_status, doctor_name, hospital_name,
+                        next_appointment, {completed} AS completed, {planned} AS planned, {due} AS due_date
+                 FROM patients WHERE {where}
+                 ORDER BY {due} LIMIT ?'''
+    return count_sql, page_sql
+
+
+def get_behind_on_treatment(conn, course, today, hospital=None, limit=BEHIND_LIMIT):
+    """Return (patients, total) whose next session of ``course`` is overdue, most overdue first"""
+    count_sql, page_sql = overdue_queries(course, bool(hospital))
+    params = [(today - timedelta(days=OVERDUE_GRACE_DAYS)).isoformat()]
+    if hospital:
+        params.append(hospital)
+    total = conn.execute(count_sql, params).fetchone()[0]
+    rows = conn.execute(page_sql, params + [limit]).fetchall()
+
+    patients = []
+    for row in rows:
+        patient = dict(row)
+        overdue = (today - date.fromisoformat(row['due_date'])).days
+        interval = CHEMO_CYCLE_DAYS if course == 'chemo' else 7 / RADIATION_SESSIONS_PER_WEEK
+        # Sessions that should have started by today, capped at the plan
+        patient['expected'] = min(row['planned'], row['completed'] + 1 + int(overdue / interval))
+        patient['days_overdue'] = overdue
+        patients.append(patient)
+    return patients, total
+
+
+def get_appointments_on(conn, day, hospital=None, limit=DAY_LIST_LIMIT):
+    """Patients with their next appointment on ``day``"""
+    sql = '''SELECT id, patient_id, full_name, cancer_type, cancer_stage, current_status,
+                    doctor_name, hospital_name, next_appointment
+             FROM patients WHERE next_appointment >= ? AND next_appointment < ?'''
+    params = [day.isoformat(), (day + timedelta(days=1)).isoformat()]
+    if hospital:
+        # Unary + so one day's range of the appointment index is read, not the whole hospital
+        sql += ' AND +hospital_name = ?'
+        params.append(hospital)
+    sql += ' ORDER BY next_appointment, id LIMIT ?'
+    return [dict(row) for row in conn.execute(sql, params + [limit])]
+
+
+def get_workload_hospitals(conn, today):
+    """Hospitals with appointments from ``today`` on (for the filter)"""
+    rows = conn.execute('''
+        SELECT DISTINCT hospital_name FROM appointment_stats
+        WHERE day >= ? AND count > 0 AND hospital_name != ''
+    ''', (today.isoformat(),)).fetchall()
+    return sorted(row[0] for row in rows)
+
+
+def get_workload(conn, group='hospital', hospital=None, today=None):
+    """Return (report, cache_hit): calendar and behind-on-treatment lists for the scheduling page"""
+    today = today or date.today()
+    key = (get_data_version(conn), today, group, hospital)
+    report = _workload_cache.get(key)
+    if report is not None:
+        return report, True
+    columns, calendar = get_appointment_calendar(conn, today, WORKLOAD_DAYS, group, hospital)
+    behind = {}
+    for course, (label, _, _, _) in COURSES.items():
+        patients, total = get_behind_on_treatment(conn, course, today, hospital)
+        behind[course] = {'label': label, 'patients': patients, 'total': total}
+    report = {
+        'columns': columns,
+        'calendar': calendar,
+        'appointments': sum(row['total'] for row in calendar),
+        'busiest': max(calendar, key=lambda row: row['total']) if calendar else None,
+        'behind': behind,
+        'hospitals': get_workload_hospitals(conn, today),
+    }
+    _workload_cache.set(key, report)
+    return report, False
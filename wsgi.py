@@ -0,0 +1,2 @@
+"""WSGI entry point: ``gunicorn -c gunicorn.conf.py wsgi:application``"""
+from app_new import app as application